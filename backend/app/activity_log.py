@@ -0,0 +1,349 @@
+"""
+Activity Log Writer
+Буферизованная асинхронная запись ActivityLog пачками
+и инкрементальное обновление почасовых/дневных агрегатов для дашбордов
+"""
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+import logging
+
+from .database import Base
+from .models import ActivityLog, ActivityRollupDaily, ActivityRollupHourly
+
+logger = logging.getLogger(__name__)
+
+# Тип действия по префиксу инструмента (используется в статистике дашбордов)
+TOOL_ACTION_TYPES = {
+    "wordpress_": "wordpress",
+    "wordstat_": "wordstat",
+    "telegram_": "telegram",
+}
+
+STATUS_SUCCESS = "success"
+STATUS_ERROR = "error"
+
+
+def tool_action_type(tool_name: Optional[str]) -> str:
+    """
+    Тип действия ActivityLog для MCP инструмента
+
+    Args:
+        tool_name: Название инструмента (wordpress_get_posts и т.п.)
+
+    Returns:
+        wordpress, wordstat, telegram или mcp
+    """
+    for prefix, action_type in TOOL_ACTION_TYPES.items():
+        if tool_name and tool_name.startswith(prefix):
+            return action_type
+    return "mcp"
+
+
+# ==================== ROLLUPS ====================
+
+ROLLUP_TABLES = [ActivityRollupHourly.__table__, ActivityRollupDaily.__table__]
+ROLLUP_KEY_COLUMNS = ("user_id", "action_type", "status")
+
+
+def hour_bucket(value: datetime) -> datetime:
+    """Начало часа для даты/времени"""
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def rollup_counts(rows: List[Dict[str, Any]]) -> Tuple[Counter, Counter]:
+    """
+    Свернуть события в счётчики по часам и дням
+
+    Args:
+        rows: Строки ActivityLog (dict с user_id, action_type, status, created_at)
+
+    Returns:
+        (hourly, daily): Counter с ключами (bucket|day, user_id, action_type, status)
+    """
+    hourly: Counter = Counter()
+    daily: Counter = Counter()
+    for row in rows:
+        created_at = row["created_at"]
+        key = (row["user_id"], row["action_type"], row.get("status") or STATUS_SUCCESS)
+        hourly[(hour_bucket(created_at),) + key] += 1
+        daily[(created_at.date(),) + key] += 1
+    return hourly, daily
+
+
+def _rollup_upsert(dialect_name: str, model, time_column: str, counts: Counter):
+    """INSERT ... ON CONFLICT DO UPDATE SET action_count = action_count + excluded.action_count"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+    values = [
+        {time_column: key[0], **dict(zip(ROLLUP_KEY_COLUMNS, key[1:])), "action_count": count}
+        for key, count in counts.items()
+    ]
+    stmt = dialect_insert(model).values(values)
+    return stmt.on_conflict_do_update(
+        index_elements=[time_column, *ROLLUP_KEY_COLUMNS],
+        set_={"action_count": model.action_count + stmt.excluded.action_count},
+    )
+
+
+async def apply_rollups(db, rows: List[Dict[str, Any]]) -> None:
+    """
+    Добавить пачку событий к агрегатам (в той же транзакции, что и INSERT логов)
+
+    Args:
+        db: AsyncSession
+        rows: Строки ActivityLog
+    """
+    hourly, daily = rollup_counts(rows)
+    if not hourly:
+        return
+    dialect_name = db.get_bind().dialect.name
+    await db.execute(_rollup_upsert(dialect_name, ActivityRollupHourly, "bucket", hourly))
+    await db.execute(_rollup_upsert(dialect_name, ActivityRollupDaily, "day", daily))
+
+
+def backfill_rollups(db: Session, chunk_size: int = 5000) -> Dict[str, int]:
+    """
+    Пересчитать агрегаты из activity_logs с нуля (идемпотентно)
+
+    Группировка по часам выполняется в БД, дневные агрегаты собираются из почасовых.
+
+    Args:
+        db: Синхронная сессия
+        chunk_size: Размер пачки при чтении и вставке
+
+    Returns:
+        Количество строк в почасовой и дневной таблицах
+    """
+    bind = db.get_bind()
+    Base.metadata.create_all(bind, tables=ROLLUP_TABLES, checkfirst=True)
+    db.execute(delete(ActivityRollupHourly))
+    db.execute(delete(ActivityRollupDaily))
+
+    if bind.dialect.name == "postgresql":
+        bucket = func.date_trunc("hour", ActivityLog.created_at)
+    else:
+        bucket = func.strftime("%Y-%m-%d %H:00:00", ActivityLog.created_at)
+    status = func.coalesce(ActivityLog.status, STATUS_SUCCESS)
+    query = (
+        select(bucket, ActivityLog.user_id, ActivityLog.action_type, status, func.count(ActivityLog.id))
+        .where(ActivityLog.created_at.isnot(None))
+        .group_by(bucket, ActivityLog.user_id, ActivityLog.action_type, status)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    hourly_rows = 0
+    daily: Counter = Counter()
+    chunk: List[Dict[str, Any]] = []
+    for bucket_value, user_id, action_type, status_value, count in db.execute(query):
+        if isinstance(bucket_value, str):
+            bucket_value = datetime.fromisoformat(bucket_value)
+        chunk.append({
+            "bucket": bucket_value,
+            "user_id": user_id,
+            "action_type": action_type,
+            "status": status_value,
+            "action_count": count,
+        })
+        daily[(bucket_value.date(), user_id, action_type, status_value)] += count
+        if len(chunk) >= chunk_size:
+            db.execute(insert(ActivityRollupHourly), chunk)
+            hourly_rows += len(chunk)
+            chunk = []
+    if chunk:
+        db.execute(insert(ActivityRollupHourly), chunk)
+        hourly_rows += len(chunk)
+
+    daily_values = [
+        {"day": key[0], **dict(zip(ROLLUP_KEY_COLUMNS, key[1:])), "action_count": count}
+        for key, count in daily.items()
+    ]
+    for start in range(0, len(daily_values), chunk_size):
+        db.execute(insert(ActivityRollupDaily), daily_values[start:start + chunk_size])
+
+    db.commit()
+    return {"hourly": hourly_rows, "daily": len(daily_values)}
+
+
+class ActivityLogWriter:
+    """
+    Ограниченный in-process буфер событий активности
+
+    record() только кладёт событие в очередь и не ждёт БД, фоновая задача
+    сбрасывает буфер одним multi-row INSERT по размеру пачки или по таймеру
+    и в той же транзакции увеличивает счётчики почасовых и дневных агрегатов.
+    При переполнении новые события отбрасываются (и считаются в stats()).
+    """
+
+    def __init__(
+        self,
+        session_factory=None,
+        max_queue_size: int = 10000,
+        batch_size: int = 200,
+        flush_interval: float = 1.0,
+    ):
+        """
+        Args:
+            session_factory: Фабрика AsyncSession (по умолчанию AsyncSessionLocal)
+            max_queue_size: Максимум событий в буфере
+            batch_size: Размер пачки для одного INSERT
+            flush_interval: Максимальная задержка записи события (сек)
+        """
+        self._session_factory = session_factory
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _get_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        return self._queue
+
+    async def start(self) -> None:
+        """Запуск фоновой задачи сброса буфера"""
+        if self._session_factory is None:
+            from .database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        # Таблицы агрегатов создаются при первом запуске (как oauth_entries)
+        async with self._session_factory() as db:
+            conn = await db.connection()
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=ROLLUP_TABLES, checkfirst=True
+            ))
+            await db.commit()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(
+                f"ActivityLog: writer started (batch={self.batch_size}, "
+                f"interval={self.flush_interval}s, queue={self.max_queue_size})"
+            )
+
+    def record(
+        self,
+        user_id: int,
+        action_type: str,
+        action_name: Optional[str] = None,
+        status: str = STATUS_SUCCESS,
+        details: Optional[Dict[str, Any]] = None,
+        error_message: Optional[str] = None,
+        ip_address: Optional[str] = None,
+        user_agent: Optional[str] = None,
+    ) -> bool:
+        """
+        Поставить событие в очередь записи (без ожидания БД)
+
+        Returns:
+            False если буфер переполнен и событие отброшено
+        """
+        row = {
+            "user_id": user_id,
+            "action_type": action_type,
+            "action_name": action_name,
+            "status": status,
+            "details": json.dumps(details, ensure_ascii=False) if details else None,
+            "error_message": error_message,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            self._get_queue().put_nowait(row)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        return True
+
+    async def _run(self) -> None:
+        queue = self._get_queue()
+        stopping = False
+        while not stopping:
+            row = await queue.get()
+            if row is None:
+                # Сигнал остановки от aclose()
+                break
+            batch = [row]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._flush(batch)
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        try:
+            async with self._session_factory() as db:
+                await db.execute(insert(ActivityLog).values(rows))
+                await apply_rollups(db, rows)
+                await db.commit()
+            self.written += len(rows)
+            self.batches += 1
+        except Exception as e:
+            self.failed += len(rows)
+            logger.error(f"ActivityLog: failed to write batch of {len(rows)}: {e}")
+
+    async def flush(self) -> None:
+        """Немедленно записать всё, что лежит в буфере"""
+        queue = self._get_queue()
+        while not queue.empty():
+            rows = []
+            while not queue.empty() and len(rows) < self.batch_size:
+                rows.append(queue.get_nowait())
+            await self._flush(rows)
+
+    async def aclose(self) -> None:
+        """Остановка с дозаписью буфера при завершении приложения"""
+        if self._task is not None:
+            await self._get_queue().put(None)
+            await self._task
+            self._task = None
+        if self._session_factory is not None:
+            await self.flush()
+        # Очередь привязана к event loop - при повторном start() создаётся новая
+        self._queue = None
+        logger.info(f"ActivityLog: writer stopped (written={self.written}, dropped={self.dropped})")
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            Счётчики буфера для мониторинга
+        """
+        return {
+            "queued": self._queue.qsize() if self._queue else 0,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "batches": self.batches,
+        }
+
+
+activity_writer = ActivityLogWriter(
+    max_queue_size=int(os.getenv("ACTIVITY_LOG_QUEUE_SIZE", "10000")),
+    batch_size=int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "200")),
+    flush_interval=float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", "1.0")),
+)
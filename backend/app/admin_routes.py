@@ -2,20 +2,126 @@
 Админ панель API endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, Request
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import and_, asc, delete, func, desc, or_, select
 from datetime import datetime, timedelta
 from typing import Optional, List
+import csv
+import io
 import json
+import os
+import zlib
 
-from .database import get_db
-from .auth import get_current_admin_user
-from .models import User, UserSettings, ActivityLog, AdminLog, LoginAttempt
+from .database import get_db, AsyncSessionLocal
+from .auth import get_current_admin_user, invalidate_principal
+from .models import (
+    User, UserSettings, ActivityLog, AdminLog, LoginAttempt,
+    ActivityRollupDaily, ActivityRollupHourly,
+)
+from .activity_log import hour_bucket
+from .retention import archived_counts, archived_until
+from .helpers import TTLCache, encode_cursor, decode_cursor, CURSOR_NEXT, CURSOR_PREV
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
-def log_admin_action(
-    db: Session,
+# Кэш приблизительных total для списков (ключ - таблица и фильтры)
+ADMIN_COUNT_CACHE_TTL = float(os.getenv("ADMIN_COUNT_CACHE_TTL", "60"))
+count_cache = TTLCache(max_size=1000, ttl_seconds=ADMIN_COUNT_CACHE_TTL)
+
+async def keyset_page(db: AsyncSession, query, model, cursor: Optional[str], limit: int):
+    """
+    Страница keyset-пагинации по (created_at DESC, id DESC)
+    
+    Returns:
+        (rows, next_cursor, prev_cursor)
+    """
+    direction = CURSOR_NEXT
+    if cursor:
+        try:
+            created_at, row_id, direction = decode_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Некорректный курсор")
+        if direction == CURSOR_NEXT:
+            query = query.where(or_(
+                model.created_at < created_at,
+                and_(model.created_at == created_at, model.id < row_id),
+            ))
+        else:
+            query = query.where(or_(
+                model.created_at > created_at,
+                and_(model.created_at == created_at, model.id > row_id),
+            ))
+    
+    order = desc if direction == CURSOR_NEXT else asc
+    rows = list((await db.scalars(
+        query.order_by(order(model.created_at), order(model.id)).limit(limit + 1)
+    )).all())
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if direction == CURSOR_PREV:
+        rows.reverse()
+    
+    if not rows:
+        return rows, None, None
+    # Дальше есть записи, если их вернул запрос вперёд, или если мы пришли назад
+    has_next = has_more if direction == CURSOR_NEXT else True
+    # Назад есть записи, если мы пришли по курсору вперёд, или их вернул запрос назад
+    has_prev = bool(cursor) if direction == CURSOR_NEXT else has_more
+    next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id, CURSOR_NEXT) if has_next else None
+    prev_cursor = encode_cursor(rows[0].created_at, rows[0].id, CURSOR_PREV) if has_prev else None
+    return rows, next_cursor, prev_cursor
+
+def activity_logs_query(
+    user_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    status: Optional[str] = None,
+):
+    """Запрос ActivityLog с фильтрами списка /admin/logs"""
+    query = select(ActivityLog)
+    if user_id:
+        query = query.where(ActivityLog.user_id == user_id)
+    if action_type:
+        query = query.where(ActivityLog.action_type == action_type)
+    if status:
+        query = query.where(ActivityLog.status == status)
+    return query
+
+def activity_log_to_dict(log: ActivityLog) -> dict:
+    return {
+        "id": log.id,
+        "user_id": log.user_id,
+        "action_type": log.action_type,
+        "action_name": log.action_name,
+        "status": log.status,
+        "details": log.details,
+        "error_message": log.error_message,
+        "ip_address": log.ip_address,
+        "created_at": log.created_at.isoformat() if log.created_at else None
+    }
+
+def admin_log_to_dict(log: AdminLog) -> dict:
+    return {
+        "id": log.id,
+        "admin_user_id": log.admin_user_id,
+        "action_type": log.action_type,
+        "action_description": log.action_description,
+        "target_user_id": log.target_user_id,
+        "changes": json.loads(log.changes) if log.changes else None,
+        "ip_address": log.ip_address,
+        "created_at": log.created_at.isoformat() if log.created_at else None
+    }
+
+async def approximate_total(db: AsyncSession, key: tuple, query) -> int:
+    """Количество строк запроса, кэшируется на ADMIN_COUNT_CACHE_TTL секунд"""
+    total = count_cache.get(key)
+    if total is None:
+        total = await db.scalar(select(func.count()).select_from(query.subquery())) or 0
+        count_cache.set(key, total)
+    return total
+
+async def log_admin_action(
+    db: AsyncSession,
     admin_user: User,
     action_type: str,
     action_description: str,
@@ -34,43 +140,43 @@ def log_admin_action(
         user_agent=request.headers.get("user-agent") if request else None
     )
     db.add(log)
-    db.commit()
+    await db.commit()
 
 @router.get("/dashboard")
 async def get_admin_dashboard(
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить данные для админ дашборда"""
     
     # Статистика пользователей
-    total_users = db.query(func.count(User.id)).scalar() or 0
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar() or 0
+    total_users = await db.scalar(select(func.count(User.id))) or 0
+    active_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True)) or 0
     
     # Новые пользователи за неделю
     week_ago = datetime.utcnow() - timedelta(days=7)
-    new_users_week = db.query(func.count(User.id)).filter(
+    new_users_week = await db.scalar(select(func.count(User.id)).where(
         User.created_at >= week_ago
-    ).scalar() or 0
+    )) or 0
     
-    # Общая активность
-    total_actions = db.query(func.count(ActivityLog.id)).scalar() or 0
+    # Общая активность (из агрегатов, а не сканированием activity_logs)
+    total_actions = await db.scalar(select(func.sum(ActivityRollupDaily.action_count))) or 0
     
-    # Активность за последние 24 часа
+    # Активность за последние 24 часа (с точностью до часа)
     day_ago = datetime.utcnow() - timedelta(days=1)
-    actions_today = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.created_at >= day_ago
-    ).scalar() or 0
+    actions_today = await db.scalar(select(func.sum(ActivityRollupHourly.action_count)).where(
+        ActivityRollupHourly.bucket >= hour_bucket(day_ago)
+    )) or 0
     
     # Топ активных пользователей
-    top_users = db.query(
+    top_users = (await db.execute(select(
         User.id,
         User.email,
         User.full_name,
-        func.count(ActivityLog.id).label('action_count')
-    ).join(ActivityLog, User.id == ActivityLog.user_id).group_by(
+        func.sum(ActivityRollupDaily.action_count).label('action_count')
+    ).join(ActivityRollupDaily, User.id == ActivityRollupDaily.user_id).group_by(
         User.id
-    ).order_by(desc('action_count')).limit(10).all()
+    ).order_by(desc('action_count')).limit(10))).all()
     
     top_users_list = [
         {
@@ -83,21 +189,21 @@ async def get_admin_dashboard(
     ]
     
     # Статистика по типам действий
-    actions_by_type = db.query(
-        ActivityLog.action_type,
-        func.count(ActivityLog.id).label('count')
-    ).group_by(ActivityLog.action_type).all()
+    actions_by_type = (await db.execute(select(
+        ActivityRollupDaily.action_type,
+        func.sum(ActivityRollupDaily.action_count).label('count')
+    ).group_by(ActivityRollupDaily.action_type))).all()
     
     actions_stats = {action_type: count for action_type, count in actions_by_type}
     
     # Активность по дням за последние 30 дней
     thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    daily_activity = db.query(
-        func.date(ActivityLog.created_at).label('date'),
-        func.count(ActivityLog.id).label('count')
-    ).filter(
-        ActivityLog.created_at >= thirty_days_ago
-    ).group_by(func.date(ActivityLog.created_at)).all()
+    daily_activity = (await db.execute(select(
+        ActivityRollupDaily.day.label('date'),
+        func.sum(ActivityRollupDaily.action_count).label('count')
+    ).where(
+        ActivityRollupDaily.day >= thirty_days_ago.date()
+    ).group_by(ActivityRollupDaily.day).order_by(ActivityRollupDaily.day))).all()
     
     daily_activity_list = [
         {"date": str(date), "count": count}
@@ -105,9 +211,9 @@ async def get_admin_dashboard(
     ]
     
     # Статистика ошибок
-    error_count = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.status == 'error'
-    ).scalar() or 0
+    error_count = await db.scalar(select(func.sum(ActivityRollupDaily.action_count)).where(
+        ActivityRollupDaily.status == 'error'
+    )) or 0
     
     return {
         "users": {
@@ -127,27 +233,29 @@ async def get_admin_dashboard(
 
 @router.get("/users")
 async def get_all_users(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 50,
     search: Optional[str] = None,
     is_active: Optional[bool] = None,
+    include_total: bool = False,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить список всех пользователей с фильтрами"""
     
-    query = db.query(User)
+    query = select(User)
     
     if search:
-        query = query.filter(
+        query = query.where(
             (User.email.contains(search)) | (User.full_name.contains(search))
         )
     
     if is_active is not None:
-        query = query.filter(User.is_active == is_active)
+        query = query.where(User.is_active == is_active)
     
-    total = query.count()
-    users = query.order_by(desc(User.created_at)).offset(skip).limit(limit).all()
+    limit = max(1, min(limit, 500))
+    users, next_cursor, prev_cursor = await keyset_page(db, query, User, cursor, limit)
+    total = await approximate_total(db, ("users", search, is_active), query) if include_total else None
     
     users_list = [
         {
@@ -164,8 +272,9 @@ async def get_all_users(
     
     return {
         "total": total,
-        "skip": skip,
         "limit": limit,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
         "users": users_list
     }
 
@@ -173,26 +282,26 @@ async def get_all_users(
 async def get_user_details(
     user_id: int,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить детальную информацию о пользователе"""
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     # Настройки
-    settings = db.query(UserSettings).filter(UserSettings.user_id == user_id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
     
     # Статистика активности
-    total_actions = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.user_id == user_id
-    ).scalar() or 0
+    total_actions = await db.scalar(select(func.sum(ActivityRollupDaily.action_count)).where(
+        ActivityRollupDaily.user_id == user_id
+    )) or 0
     
     # Последние действия
-    recent_activities = db.query(ActivityLog).filter(
+    recent_activities = (await db.scalars(select(ActivityLog).where(
         ActivityLog.user_id == user_id
-    ).order_by(desc(ActivityLog.created_at)).limit(20).all()
+    ).order_by(desc(ActivityLog.created_at)).limit(20))).all()
     
     activities_list = [
         {
@@ -230,11 +339,11 @@ async def block_user(
     user_id: int,
     request: Request,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Заблокировать пользователя"""
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
@@ -242,10 +351,11 @@ async def block_user(
         raise HTTPException(status_code=403, detail="Нельзя заблокировать администратора")
     
     user.is_active = False
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
     
     # Логируем действие
-    log_admin_action(
+    await log_admin_action(
         db=db,
         admin_user=admin_user,
         action_type="user_block",
@@ -261,19 +371,20 @@ async def unblock_user(
     user_id: int,
     request: Request,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Разблокировать пользователя"""
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
     user.is_active = True
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
     
     # Логируем действие
-    log_admin_action(
+    await log_admin_action(
         db=db,
         admin_user=admin_user,
         action_type="user_unblock",
@@ -289,11 +400,11 @@ async def delete_user(
     user_id: int,
     request: Request,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Удалить пользователя"""
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
@@ -303,13 +414,16 @@ async def delete_user(
     user_email = user.email
     
     # Удаляем связанные данные
-    db.query(UserSettings).filter(UserSettings.user_id == user_id).delete()
-    db.query(ActivityLog).filter(ActivityLog.user_id == user_id).delete()
-    db.delete(user)
-    db.commit()
+    await db.execute(delete(UserSettings).where(UserSettings.user_id == user_id))
+    await db.execute(delete(ActivityLog).where(ActivityLog.user_id == user_id))
+    await db.execute(delete(ActivityRollupHourly).where(ActivityRollupHourly.user_id == user_id))
+    await db.execute(delete(ActivityRollupDaily).where(ActivityRollupDaily.user_id == user_id))
+    await db.execute(delete(User).where(User.id == user_id))
+    await db.commit()
+    invalidate_principal(user_id)
     
     # Логируем действие
-    log_admin_action(
+    await log_admin_action(
         db=db,
         admin_user=admin_user,
         action_type="user_delete",
@@ -322,121 +436,252 @@ async def delete_user(
 
 @router.get("/logs")
 async def get_activity_logs(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 100,
     user_id: Optional[int] = None,
     action_type: Optional[str] = None,
     status: Optional[str] = None,
+    include_total: bool = False,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить логи активности с фильтрами"""
     
-    query = db.query(ActivityLog)
-    
-    if user_id:
-        query = query.filter(ActivityLog.user_id == user_id)
-    
-    if action_type:
-        query = query.filter(ActivityLog.action_type == action_type)
-    
-    if status:
-        query = query.filter(ActivityLog.status == status)
+    query = activity_logs_query(user_id, action_type, status)
+    limit = max(1, min(limit, 500))
+    logs, next_cursor, prev_cursor = await keyset_page(db, query, ActivityLog, cursor, limit)
+    total = (
+        await approximate_total(db, ("activity_logs", user_id, action_type, status), query)
+        if include_total else None
+    )
     
-    total = query.count()
-    logs = query.order_by(desc(ActivityLog.created_at)).offset(skip).limit(limit).all()
-    
-    logs_list = [
-        {
-            "id": log.id,
-            "user_id": log.user_id,
-            "action_type": log.action_type,
-            "action_name": log.action_name,
-            "status": log.status,
-            "details": log.details,
-            "error_message": log.error_message,
-            "ip_address": log.ip_address,
-            "created_at": log.created_at.isoformat() if log.created_at else None
-        }
-        for log in logs
-    ]
+    logs_list = [activity_log_to_dict(log) for log in logs]
     
     return {
         "total": total,
-        "skip": skip,
         "limit": limit,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
         "logs": logs_list
     }
 
 @router.get("/admin-logs")
 async def get_admin_logs(
-    skip: int = 0,
+    cursor: Optional[str] = None,
     limit: int = 50,
+    include_total: bool = False,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить логи действий администраторов"""
     
-    query = db.query(AdminLog)
-    
-    total = query.count()
-    logs = query.order_by(desc(AdminLog.created_at)).offset(skip).limit(limit).all()
+    query = select(AdminLog)
+    limit = max(1, min(limit, 500))
+    logs, next_cursor, prev_cursor = await keyset_page(db, query, AdminLog, cursor, limit)
+    total = await approximate_total(db, ("admin_logs",), query) if include_total else None
     
-    logs_list = [
-        {
-            "id": log.id,
-            "admin_user_id": log.admin_user_id,
-            "action_type": log.action_type,
-            "action_description": log.action_description,
-            "target_user_id": log.target_user_id,
-            "changes": json.loads(log.changes) if log.changes else None,
-            "ip_address": log.ip_address,
-            "created_at": log.created_at.isoformat() if log.created_at else None
-        }
-        for log in logs
-    ]
+    logs_list = [admin_log_to_dict(log) for log in logs]
     
     return {
         "total": total,
-        "skip": skip,
         "limit": limit,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
         "logs": logs_list
     }
 
+# ==================== EXPORT ====================
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BATCH_SIZE = int(os.getenv("ADMIN_EXPORT_BATCH_SIZE", "1000"))
+
+def _csv_value(value):
+    return json.dumps(value, ensure_ascii=False) if isinstance(value, (dict, list)) else value
+
+async def stream_export(query, serialize, columns: List[str], export_format: str, compress: bool):
+    """
+    Генератор частей файла экспорта
+    
+    Строки читаются пачками yield_per через серверный курсор в отдельной сессии
+    (сессия из Depends закрывается до начала отправки тела), поэтому память
+    не зависит от числа строк. gzip сжимается потоково.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None  # 31 - формат gzip
+    
+    def encode(text: str) -> bytes:
+        data = text.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+    
+    def to_csv(rows, header: bool = False) -> str:
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns)
+        if header:
+            writer.writeheader()
+        writer.writerows({key: _csv_value(value) for key, value in row.items()} for row in rows)
+        return buffer.getvalue()
+    
+    if export_format == "csv":
+        yield encode(to_csv([], header=True))
+    
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.partitions():
+            rows = [serialize(row) for row in partition]
+            if export_format == "csv":
+                text = to_csv(rows)
+            else:
+                text = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+            chunk = encode(text)
+            if chunk:
+                yield chunk
+    
+    if compressor:
+        yield compressor.flush()
+
+def export_response(name: str, query, serialize, columns: List[str], export_format: str, compress: bool):
+    """StreamingResponse с файлом экспорта"""
+    if export_format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Формат должен быть одним из: {', '.join(EXPORT_FORMATS)}")
+    filename = f"{name}-{datetime.utcnow():%Y%m%d-%H%M%S}.{export_format}"
+    media_type = EXPORT_FORMATS[export_format]
+    if compress:
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        stream_export(query, serialize, columns, export_format, compress),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.get("/logs/export")
+async def export_activity_logs(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    user_id: Optional[int] = None,
+    action_type: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Потоковый экспорт логов активности (NDJSON или CSV, опционально gzip)"""
+    
+    query = activity_logs_query(user_id, action_type, status)
+    if since:
+        query = query.where(ActivityLog.created_at >= since)
+    if until:
+        query = query.where(ActivityLog.created_at < until)
+    query = query.order_by(ActivityLog.created_at, ActivityLog.id)
+    response = export_response(
+        "activity-logs", query, activity_log_to_dict,
+        ["id", "user_id", "action_type", "action_name", "status", "details",
+         "error_message", "ip_address", "created_at"],
+        format, gzip,
+    )
+    
+    await log_admin_action(
+        db=db,
+        admin_user=admin_user,
+        action_type="logs_export",
+        action_description=f"Экспорт логов активности ({format}{', gzip' if gzip else ''})",
+        changes={"user_id": user_id, "action_type": action_type, "status": status,
+                 "since": since.isoformat() if since else None,
+                 "until": until.isoformat() if until else None},
+        request=request
+    )
+    return response
+
+@router.get("/admin-logs/export")
+async def export_admin_logs(
+    request: Request,
+    format: str = "ndjson",
+    gzip: bool = False,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    admin_user: User = Depends(get_current_admin_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Потоковый экспорт логов администраторов (NDJSON или CSV, опционально gzip)"""
+    
+    query = select(AdminLog)
+    if since:
+        query = query.where(AdminLog.created_at >= since)
+    if until:
+        query = query.where(AdminLog.created_at < until)
+    query = query.order_by(AdminLog.created_at, AdminLog.id)
+    response = export_response(
+        "admin-logs", query, admin_log_to_dict,
+        ["id", "admin_user_id", "action_type", "action_description", "target_user_id",
+         "changes", "ip_address", "created_at"],
+        format, gzip,
+    )
+    
+    await log_admin_action(
+        db=db,
+        admin_user=admin_user,
+        action_type="admin_logs_export",
+        action_description=f"Экспорт логов администраторов ({format}{', gzip' if gzip else ''})",
+        request=request
+    )
+    return response
+
 @router.get("/stats")
 async def get_platform_stats(
+    include_archived: bool = False,
     admin_user: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    """Получить общую статистику платформы"""
+    """
+    Получить общую статистику платформы
     
-    # Статистика пользователей
-    total_users = db.query(func.count(User.id)).scalar() or 0
-    active_users = db.query(func.count(User.id)).filter(User.is_active == True).scalar() or 0
-    admin_users = db.query(func.count(User.id)).filter(User.is_admin == True).scalar() or 0
+    По умолчанию из активности исключаются дни, строки которых уже перенесены
+    в архив (месяцы из archive_summaries); пока архивации не было, счётчики
+    за всё время. include_archived=true добавляет заархивированные месяцы.
+    """
     
-    # Статистика активности
-    total_actions = db.query(func.count(ActivityLog.id)).scalar() or 0
+    # Статистика пользователей
+    total_users = await db.scalar(select(func.count(User.id))) or 0
+    active_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True)) or 0
+    admin_users = await db.scalar(select(func.count(User.id)).where(User.is_admin == True)) or 0
+    
+    # Статистика активности (агрегаты не удаляются retention, окно задаётся по дню)
+    actions_query = select(func.sum(ActivityRollupDaily.action_count))
+    if not include_archived:
+        # Архив всегда - префикс по времени: окно начинается после последнего архивного
+        # месяца, но не позже самой старой строки, оставшейся в activity_logs
+        activity_start = await archived_until(db, ActivityLog.__tablename__)
+        if activity_start is not None:
+            oldest_live = await db.scalar(select(func.min(ActivityLog.created_at)))
+            if oldest_live is not None and oldest_live.date() < activity_start:
+                activity_start = oldest_live.date()
+            actions_query = actions_query.where(ActivityRollupDaily.day >= activity_start)
+    total_actions = await db.scalar(actions_query) or 0
     
     # По типам
-    wordpress_actions = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.action_type == 'wordpress'
-    ).scalar() or 0
+    wordpress_actions = await db.scalar(actions_query.where(
+        ActivityRollupDaily.action_type == 'wordpress'
+    )) or 0
     
-    wordstat_actions = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.action_type == 'wordstat'
-    ).scalar() or 0
+    wordstat_actions = await db.scalar(actions_query.where(
+        ActivityRollupDaily.action_type == 'wordstat'
+    )) or 0
     
     # Ошибки
-    total_errors = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.status == 'error'
-    ).scalar() or 0
+    total_errors = await db.scalar(actions_query.where(
+        ActivityRollupDaily.status == 'error'
+    )) or 0
     
-    # Попытки входа
-    total_login_attempts = db.query(func.count(LoginAttempt.id)).scalar() or 0
-    failed_logins = db.query(func.count(LoginAttempt.id)).filter(
+    # Попытки входа (живая таблица + счётчики архивных месяцев)
+    total_login_attempts = await db.scalar(select(func.count(LoginAttempt.id))) or 0
+    failed_logins = await db.scalar(select(func.count(LoginAttempt.id)).where(
         LoginAttempt.success == False
-    ).scalar() or 0
+    )) or 0
+    if include_archived:
+        archived_logins = await archived_counts(db, LoginAttempt.__tablename__)
+        total_login_attempts += archived_logins["rows"]
+        failed_logins += archived_logins["errors"]
     
     return {
         "users": {
@@ -453,6 +698,7 @@ async def get_platform_stats(
         "security": {
             "total_login_attempts": total_login_attempts,
             "failed_logins": failed_logins
-        }
+        },
+        "include_archived": include_archived
     }
 
@@ -1,17 +1,23 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from jose import JWTError, jwt
+import asyncio
 import hashlib
 import uuid
 import os
 import secrets
 import bcrypt
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from types import SimpleNamespace
+from typing import Dict, Optional, Set
 
 from .database import get_db
-from .models import User
+from .models import User, UserSettings
+from .helpers import TTLCache
 
 # Настройки для JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
@@ -33,6 +39,38 @@ def get_password_hash(password: str) -> str:
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+# bcrypt занимает ~250 мс CPU, поэтому в async обработчиках хеширование
+# выполняется в отдельном ограниченном пуле потоков, а не в event loop.
+# Пул создаётся при первом использовании, в том числе после shutdown (повторный запуск приложения)
+PASSWORD_HASH_CONCURRENCY = int(os.getenv("PASSWORD_HASH_CONCURRENCY", "4"))
+_password_executor: Optional[ThreadPoolExecutor] = None
+
+def _get_password_executor() -> ThreadPoolExecutor:
+    global _password_executor
+    if _password_executor is None:
+        _password_executor = ThreadPoolExecutor(
+            max_workers=PASSWORD_HASH_CONCURRENCY,
+            thread_name_prefix="password-hash",
+        )
+    return _password_executor
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Проверка пароля в пуле потоков (не блокирует event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_executor(), verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Хеширование пароля в пуле потоков (не блокирует event loop)"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_password_executor(), get_password_hash, password)
+
+def shutdown_password_executor() -> None:
+    """Остановка пула потоков хеширования при остановке приложения"""
+    global _password_executor
+    if _password_executor is not None:
+        _password_executor.shutdown(wait=False, cancel_futures=True)
+        _password_executor = None
+
 def generate_connector_id(user_id: int, username: str) -> str:
     """Генерация уникального, ASCII-only ID коннектора для MCP SSE"""
     clean_username = "".join(
@@ -47,8 +85,12 @@ def generate_mcp_sse_url(connector_id: str) -> str:
     """Генерация URL для MCP SSE сервера"""
     return f"https://mcp-kv.ru/mcp/sse/{connector_id}"
 
+def generate_telegram_webhook_url(connector_id: str) -> str:
+    """URL приёма обновлений Telegram (webhook) для коннектора"""
+    return f"https://mcp-kv.ru/telegram/webhook/{connector_id}"
 
-def get_user_from_token(token: str, db: Session) -> Optional[User]:
+
+async def get_user_from_token(token: str, db: AsyncSession) -> Optional[User]:
     """Получить пользователя по JWT токену, возвращает None если токен невалидный"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -58,7 +100,165 @@ def get_user_from_token(token: str, db: Session) -> Optional[User]:
     except JWTError:
         return None
 
-    return db.query(User).filter(User.email == email).first()
+    return await db.scalar(select(User).where(User.email == email))
+
+# ==================== PRINCIPAL CACHE ====================
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+
+def snapshot_settings(settings: UserSettings) -> SimpleNamespace:
+    """
+    Снимок настроек пользователя, не привязанный к сессии БД
+    Подходит для инструментов, которые только читают настройки
+    """
+    return SimpleNamespace(**{
+        column.name: getattr(settings, column.name)
+        for column in UserSettings.__table__.columns
+    })
+
+
+class Principal:
+    """
+    Аутентифицированный пользователь MCP запроса: user_id и снимок настроек
+    """
+    
+    def __init__(self, user: User, settings: UserSettings):
+        self.user_id = user.id
+        self.email = user.email
+        self.is_active = user.is_active
+        self.connector_id = settings.mcp_connector_id
+        self.settings = snapshot_settings(settings)
+
+
+class _PrincipalTTLCache(TTLCache):
+    """TTLCache, сообщающий PrincipalCache о вытесненных и истёкших записях"""
+    
+    def __init__(self, on_evicted, **kwargs):
+        super().__init__(**kwargs)
+        self._on_evicted = on_evicted
+    
+    def _evicted(self, key, value) -> None:
+        self._on_evicted(key, value)
+
+
+class PrincipalCache:
+    """
+    TTL+LRU кэш: bearer token или connector_id -> Principal
+    Записи пользователя сбрасываются при изменении настроек, блокировке и удалении
+    """
+    
+    def __init__(self, max_size: int = PRINCIPAL_CACHE_SIZE, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS):
+        self._cache = _PrincipalTTLCache(self._forget_key, max_size=max_size, ttl_seconds=ttl_seconds)
+        # Обратный индекс user_id -> ключи; обновляется при вытеснении, поэтому не больше max_size ключей
+        self._keys_by_user: Dict[int, Set[str]] = {}
+    
+    def _forget_key(self, key: str, principal: Principal) -> None:
+        keys = self._keys_by_user.get(principal.user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[principal.user_id]
+    
+    def get(self, key: str) -> Optional[Principal]:
+        return self._cache.get(key)
+    
+    def put(self, key: str, principal: Principal, ttl_seconds: Optional[float] = None) -> None:
+        self._cache.set(key, principal, ttl_seconds)
+        self._keys_by_user.setdefault(principal.user_id, set()).add(key)
+    
+    def invalidate_user(self, user_id: int) -> None:
+        """Сброс всех записей пользователя"""
+        for key in self._keys_by_user.pop(user_id, set()):
+            self._cache.pop(key)
+    
+    def clear(self) -> None:
+        self._cache.clear()
+        self._keys_by_user.clear()
+    
+    def stats(self) -> Dict[str, object]:
+        return self._cache.stats()
+
+
+principal_cache = PrincipalCache()
+
+
+def invalidate_principal(user_id: int) -> None:
+    """
+    Сбросить кэш аутентификации пользователя
+    Вызывается после изменения настроек, блокировки или удаления пользователя
+    """
+    principal_cache.invalidate_user(user_id)
+
+
+def _token_cache_key(token: str) -> str:
+    return "jwt:" + hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def get_principal_by_connector(connector_id: str, db: AsyncSession, refresh: bool = False) -> Optional[Principal]:
+    """
+    Получить Principal по connector_id (с кэшем)
+    
+    Args:
+        refresh: Прочитать из БД в обход кэша (свежая запись заменяет кэшированную)
+    
+    Returns:
+        Principal или None если коннектор не найден
+    """
+    key = f"connector:{connector_id}"
+    principal = None if refresh else principal_cache.get(key)
+    if principal:
+        return principal
+    
+    settings = await db.scalar(select(UserSettings).where(UserSettings.mcp_connector_id == connector_id))
+    if not settings:
+        return None
+    user = await db.get(User, settings.user_id)
+    if not user:
+        return None
+    
+    principal = Principal(user, settings)
+    principal_cache.put(key, principal)
+    return principal
+
+
+async def get_principal_from_token(token: str, db: AsyncSession) -> Optional[Principal]:
+    """
+    Получить Principal по JWT токену (с кэшем)
+    Запись живёт не дольше срока действия самого токена
+    
+    Returns:
+        Principal или None если токен невалидный или у пользователя нет настроек
+    """
+    key = _token_cache_key(token)
+    principal = principal_cache.get(key)
+    if principal:
+        return principal
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        email: Optional[str] = payload.get("sub")
+        if not email:
+            return None
+    except JWTError:
+        return None
+    
+    user = await db.scalar(select(User).where(User.email == email))
+    if not user:
+        return None
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == user.id))
+    if not settings:
+        return None
+    
+    principal = Principal(user, settings)
+    ttl = PRINCIPAL_CACHE_TTL_SECONDS
+    if payload.get("exp"):
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        principal_cache.put(key, principal, ttl)
+    return principal
+
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Создание JWT токена"""
@@ -71,9 +271,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Получение текущего пользователя из JWT токена"""
     credentials_exception = HTTPException(
@@ -90,7 +290,7 @@ def get_current_user(
     except JWTError:
         raise credentials_exception
     
-    user = db.query(User).filter(User.email == email).first()
+    user = await db.scalar(select(User).where(User.email == email))
     if user is None:
         raise credentials_exception
     return user
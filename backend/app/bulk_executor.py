@@ -0,0 +1,174 @@
+"""
+Bulk Executor
+Параллельное выполнение массовых операций с лимитом на хост и повторами при 429/503
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import logging
+
+from .http_clients import HttpClientRegistry
+
+logger = logging.getLogger(__name__)
+
+# Статусы, при которых сайт просит подождать (rate limit / перегрузка)
+RETRY_STATUSES = (429, 503)
+
+# progress(done, total, message) - уведомление о каждом обработанном элементе
+ProgressCallback = Callable[[int, int, str], Awaitable[None]]
+
+
+class BulkItemResult:
+    """Результат обработки одного элемента"""
+
+    def __init__(self, item: Any, ok: bool, result: Any = None, error: Optional[str] = None, attempts: int = 1):
+        self.item = item
+        self.ok = ok
+        self.result = result
+        self.error = error
+        self.attempts = attempts
+
+
+class HostThrottle:
+    """Семафор и общий cooldown одного хоста"""
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.cooldown_until = 0.0
+
+    def back_off(self, delay: float) -> None:
+        """Приостановить все запросы к хосту на delay секунд"""
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + delay)
+
+    async def wait_cooldown(self) -> None:
+        while True:
+            delay = self.cooldown_until - time.monotonic()
+            if delay <= 0:
+                return
+            await asyncio.sleep(delay)
+
+
+class BulkExecutor:
+    """
+    Исполнитель массовых операций
+
+    Не более concurrency_per_host одновременных запросов к одному сайту.
+    Ответ 429/503 ставит на паузу весь хост (Retry-After или экспоненциальная
+    задержка с jitter), элемент повторяется до max_retries раз.
+    Результаты возвращаются в порядке входных элементов.
+    """
+
+    def __init__(
+        self,
+        concurrency_per_host: int = 4,
+        max_retries: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 30.0,
+    ):
+        """
+        Args:
+            concurrency_per_host: Одновременных запросов к одному хосту
+            max_retries: Повторов одного элемента при 429/503
+            base_delay: Начальная задержка повтора (сек)
+            max_delay: Максимальная задержка повтора (сек)
+        """
+        self.concurrency_per_host = concurrency_per_host
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._hosts: Dict[str, HostThrottle] = {}
+        self.retries = 0
+
+    def _get_host(self, url: str) -> HostThrottle:
+        origin = HttpClientRegistry.origin_of(url)
+        host = self._hosts.get(origin)
+        if host is None:
+            host = HostThrottle(self.concurrency_per_host)
+            self._hosts[origin] = host
+        return host
+
+    def retry_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Задержка перед повтором: Retry-After сайта или 2^attempt * base_delay с jitter
+
+        Args:
+            attempt: Номер повтора (с 0)
+            retry_after: Значение Retry-After в секундах, если сайт его прислал
+        """
+        if retry_after is not None and retry_after >= 0:
+            return min(retry_after, self.max_delay)
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        # Jitter разводит повторы параллельных воркеров во времени
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def _call(self, host: HostThrottle, item: Any, func: Callable[[Any], Awaitable[Any]]) -> BulkItemResult:
+        attempt = 0
+        while True:
+            await host.wait_cooldown()
+            try:
+                async with host.semaphore:
+                    result = await func(item)
+                return BulkItemResult(item, True, result=result, attempts=attempt + 1)
+            except Exception as e:
+                status_code = getattr(e, "status_code", None)
+                if status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return BulkItemResult(item, False, error=str(e), attempts=attempt + 1)
+                delay = self.retry_delay(attempt, getattr(e, "retry_after", None))
+                host.back_off(delay)
+                self.retries += 1
+                attempt += 1
+                logger.warning(f"Bulk: {status_code} for item {item}, retry {attempt} in {delay:.2f}s")
+
+    async def run(
+        self,
+        url: str,
+        items: Iterable[Any],
+        func: Callable[[Any], Awaitable[Any]],
+        progress: Optional[ProgressCallback] = None,
+        describe: Callable[[Any], str] = str,
+    ) -> List[BulkItemResult]:
+        """
+        Выполнить func для каждого элемента
+
+        Args:
+            url: URL сайта (лимит и пауза считаются по его origin)
+            items: Элементы (например, ID постов)
+            func: Корутина обработки одного элемента
+            progress: Уведомление о ходе выполнения (ошибки уведомления не прерывают работу)
+            describe: Подпись элемента для сообщений progress
+
+        Returns:
+            Результаты в порядке items
+        """
+        items = list(items)
+        host = self._get_host(url)
+        total = len(items)
+        done = 0
+
+        async def worker(item):
+            nonlocal done
+            item_result = await self._call(host, item, func)
+            done += 1
+            if progress is not None:
+                if item_result.ok:
+                    message = f"✅ {describe(item)}"
+                else:
+                    message = f"❌ {describe(item)}: {item_result.error[:100]}"
+                try:
+                    await progress(done, total, message)
+                except Exception as e:
+                    logger.warning(f"Bulk: progress notification failed: {str(e)}")
+            return item_result
+
+        return list(await asyncio.gather(*(worker(item) for item in items)))
+
+
+wordpress_bulk = BulkExecutor(
+    concurrency_per_host=int(os.getenv("WP_BULK_CONCURRENCY_PER_HOST", "4")),
+    max_retries=int(os.getenv("WP_BULK_MAX_RETRIES", "4")),
+    base_delay=float(os.getenv("WP_BULK_RETRY_BASE_DELAY", "0.5")),
+    max_delay=float(os.getenv("WP_BULK_RETRY_MAX_DELAY", "30")),
+)
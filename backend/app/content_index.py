@@ -0,0 +1,443 @@
+"""
+WordPress Content Index
+Локальное зеркало постов и страниц в SQLite FTS5 для быстрого поиска
+"""
+import asyncio
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import logging
+
+from .http_clients import HttpClientRegistry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "content_index.db")
+)
+
+# Типы контента: kind -> endpoint REST API
+CONTENT_KINDS = {
+    "posts": "/wp-json/wp/v2/posts",
+    "pages": "/wp-json/wp/v2/pages",
+}
+CONTENT_FIELDS = ["id", "title", "excerpt", "modified", "status", "link", "categories", "tags"]
+# Синхронизация запрашивает все статусы: снятый с публикации, скрытый или удалённый
+# в корзину элемент приходит с новым modified и удаляется из индекса
+SYNC_STATUSES = "publish,future,draft,pending,private,trash"
+INDEXED_STATUS = "publish"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content_items (
+    id INTEGER PRIMARY KEY,
+    site TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    wp_id INTEGER NOT NULL,
+    title TEXT,
+    excerpt TEXT,
+    modified TEXT,
+    status TEXT,
+    link TEXT,
+    categories TEXT,
+    tags TEXT,
+    UNIQUE (site, kind, wp_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS content_fts USING fts5(title, excerpt, tokenize='unicode61');
+CREATE TABLE IF NOT EXISTS content_sync (
+    site TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    connector_id TEXT,
+    last_modified TEXT,
+    synced_at TEXT,
+    item_count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (site, kind)
+);
+"""
+
+TAG_RE = re.compile(r"<[^>]+>")
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def plain_text(value: Any) -> str:
+    """Текст без HTML из поля REST API ({"rendered": ...} или строка)"""
+    if isinstance(value, dict):
+        value = value.get("rendered", "")
+    return " ".join(html.unescape(TAG_RE.sub(" ", value or "")).split())
+
+
+def fts_query(search: str) -> Optional[str]:
+    """
+    Поисковая строка -> запрос FTS5: все слова обязательны, последнее - как префикс
+
+    Returns:
+        None если в строке нет слов
+    """
+    tokens = TOKEN_RE.findall(search.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+class ContentIndex:
+    """
+    Зеркало постов и страниц сайтов WordPress в SQLite FTS5
+
+    Сайт - пара (connector_id, origin). Синхронизация инкрементальная:
+    запрашиваются только элементы с modified после последней синхронизации
+    (modified_after, orderby=modified) во всех статусах; в индексе остаются
+    только опубликованные. Полная синхронизация дополнительно удаляет элементы,
+    которых больше нет на сайте (удалённые окончательно, минуя корзину).
+    """
+
+    def __init__(self, path: str = DEFAULT_INDEX_PATH, batch_size: int = 500):
+        """
+        Args:
+            path: Путь к файлу SQLite индекса
+            batch_size: Элементов за один запрос коллекции при синхронизации
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._site_locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def site_key(settings) -> str:
+        return f"{settings.mcp_connector_id or '-'}|{HttpClientRegistry.origin_of(settings.wordpress_url)}"
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def _has_index(self) -> bool:
+        """Создан ли файл индекса (запись через инструменты не должна создавать его)"""
+        return self._conn is not None or self.path == ":memory:" or os.path.exists(self.path)
+
+    def _execute(self, fn, *args):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return fn(conn, *args)
+
+    async def _run(self, fn, *args):
+        return await asyncio.to_thread(self._execute, fn, *args)
+
+    # ---------- запись ----------
+
+    @staticmethod
+    def _upsert_items(conn: sqlite3.Connection, site: str, kind: str, items: List[Dict[str, Any]]) -> int:
+        """Returns: количество новых или изменённых элементов"""
+        changed = 0
+        for item in items:
+            row = (
+                plain_text(item.get("title")),
+                plain_text(item.get("excerpt")),
+                item.get("modified"),
+                item.get("status"),
+                item.get("link"),
+                ",".join(str(term) for term in item.get("categories") or []),
+                ",".join(str(term) for term in item.get("tags") or []),
+            )
+            existing = conn.execute(
+                "SELECT id, title, excerpt, modified, status, link, categories, tags FROM content_items "
+                "WHERE site = ? AND kind = ? AND wp_id = ?",
+                (site, kind, item["id"]),
+            ).fetchone()
+            if existing and tuple(existing[1:]) == row:
+                continue
+            changed += 1
+            if existing:
+                rowid = existing[0]
+                conn.execute(
+                    "UPDATE content_items SET title = ?, excerpt = ?, modified = ?, status = ?, "
+                    "link = ?, categories = ?, tags = ? WHERE id = ?",
+                    (*row, rowid),
+                )
+                conn.execute("DELETE FROM content_fts WHERE rowid = ?", (rowid,))
+            else:
+                rowid = conn.execute(
+                    "INSERT INTO content_items (site, kind, wp_id, title, excerpt, modified, status, link, "
+                    "categories, tags) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (site, kind, item["id"], *row),
+                ).lastrowid
+            conn.execute("INSERT INTO content_fts (rowid, title, excerpt) VALUES (?, ?, ?)", (rowid, row[0], row[1]))
+        return changed
+
+    @staticmethod
+    def _remove_items(conn: sqlite3.Connection, site: str, kind: str, wp_ids: List[int]) -> int:
+        """Returns: количество удалённых из индекса элементов"""
+        removed = 0
+        for wp_id in wp_ids:
+            row = conn.execute(
+                "SELECT id FROM content_items WHERE site = ? AND kind = ? AND wp_id = ?", (site, kind, wp_id)
+            ).fetchone()
+            if row:
+                conn.execute("DELETE FROM content_fts WHERE rowid = ?", (row[0],))
+                conn.execute("DELETE FROM content_items WHERE id = ?", (row[0],))
+                removed += 1
+        return removed
+
+    @staticmethod
+    def _prune(conn: sqlite3.Connection, site: str, kind: str, seen_ids: List[int]) -> int:
+        seen = set(seen_ids)
+        stale = [
+            rowid for rowid, wp_id in conn.execute(
+                "SELECT id, wp_id FROM content_items WHERE site = ? AND kind = ?", (site, kind)
+            )
+            if wp_id not in seen
+        ]
+        for rowid in stale:
+            conn.execute("DELETE FROM content_fts WHERE rowid = ?", (rowid,))
+            conn.execute("DELETE FROM content_items WHERE id = ?", (rowid,))
+        return len(stale)
+
+    @staticmethod
+    def _save_state(conn: sqlite3.Connection, site: str, kind: str, connector_id: Optional[str],
+                    last_modified: Optional[str]) -> None:
+        count = conn.execute(
+            "SELECT COUNT(*) FROM content_items WHERE site = ? AND kind = ?", (site, kind)
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT INTO content_sync (site, kind, connector_id, last_modified, synced_at, item_count) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (site, kind) DO UPDATE SET "
+            "connector_id = excluded.connector_id, last_modified = excluded.last_modified, "
+            "synced_at = excluded.synced_at, item_count = excluded.item_count",
+            (site, kind, connector_id, last_modified, datetime.utcnow().isoformat(timespec="seconds"), count),
+        )
+
+    @staticmethod
+    def _get_state(conn: sqlite3.Connection, site: str, kind: str) -> Optional[Dict[str, Any]]:
+        row = conn.execute(
+            "SELECT last_modified, synced_at, item_count FROM content_sync WHERE site = ? AND kind = ?",
+            (site, kind),
+        ).fetchone()
+        if row is None:
+            return None
+        return {"last_modified": row[0], "synced_at": row[1], "item_count": row[2]}
+
+    # ---------- синхронизация ----------
+
+    async def sync(self, settings, full: bool = False) -> Dict[str, Dict[str, int]]:
+        """
+        Синхронизировать посты и страницы сайта с индексом
+
+        Args:
+            settings: Настройки пользователя (WordPress доступ и connector_id)
+            full: Полная синхронизация (с удалением пропавших элементов)
+
+        Returns:
+            {kind: {"changed": ..., "removed": ..., "total": ...}}
+        """
+        # Импорт здесь - wordpress_tools импортирует этот модуль
+        from .wordpress_tools import WordPressCollection, WP_MAX_PER_PAGE, WP_PAGINATE_MAX_ITEMS
+
+        site = self.site_key(settings)
+        lock = self._site_locks.setdefault(site, asyncio.Lock())
+        result: Dict[str, Dict[str, int]] = {}
+        async with lock:
+            for kind, endpoint in CONTENT_KINDS.items():
+                state = None if full else await self._run(self._get_state, site, kind)
+                last_modified = state["last_modified"] if state else None
+                changed = unpublished = 0
+                seen_ids: List[int] = []
+                round_size = min(self.batch_size, WP_PAGINATE_MAX_ITEMS)
+                if round_size > WP_MAX_PER_PAGE:
+                    # Пачка - целое число страниц, чтобы следующая пачка начиналась с границы страницы
+                    round_size -= round_size % WP_MAX_PER_PAGE
+                # Первая страница пачки в текущем окне modified_after
+                page = 1
+                while True:
+                    params: Dict[str, Any] = {"status": SYNC_STATUSES, "orderby": "modified", "order": "asc"}
+                    if last_modified:
+                        # Секунда назад: элементы с тем же modified на границе пачки не теряются
+                        cutoff = datetime.fromisoformat(last_modified) - timedelta(seconds=1)
+                        params["modified_after"] = cutoff.isoformat()
+                    # Мимо кэша GET: индекс должен видеть текущее состояние сайта
+                    collection = WordPressCollection(
+                        settings, endpoint, params=params, fields=CONTENT_FIELDS, limit=round_size,
+                        use_cache=False, first_page=page,
+                    )
+                    items = await collection.collect()
+                    newest = last_modified
+                    if items:
+                        published = [item for item in items if item.get("status") == INDEXED_STATUS]
+                        hidden_ids = [item["id"] for item in items if item.get("status") != INDEXED_STATUS]
+                        changed += await self._run(self._upsert_items, site, kind, published)
+                        if hidden_ids:
+                            unpublished += await self._run(self._remove_items, site, kind, hidden_ids)
+                        seen_ids.extend(item["id"] for item in published)
+                        newest = items[-1].get("modified") or last_modified
+                    if newest != last_modified:
+                        last_modified = newest
+                        page = 1
+                    elif len(items) == round_size:
+                        # Вся пачка с одним modified (массовый импорт/обновление):
+                        # следующие страницы того же окна, а не та же пачка заново
+                        page += round_size // collection.per_page
+                        if collection.total_pages is not None and page > collection.total_pages:
+                            break
+                    if len(items) < round_size:
+                        break
+                removed = unpublished
+                if full:
+                    removed += await self._run(self._prune, site, kind, seen_ids)
+                await self._run(self._save_state, site, kind, settings.mcp_connector_id, last_modified)
+                state = await self._run(self._get_state, site, kind)
+                result[kind] = {"changed": changed, "removed": removed, "total": state["item_count"]}
+        logger.info(f"ContentIndex: synced {site}: {result}")
+        return result
+
+    async def apply_write(self, settings, kind: str, item: Dict[str, Any]) -> None:
+        """
+        Учесть в индексе элемент, только что записанный через инструменты (ответ REST API)
+
+        Опубликованный элемент добавляется или обновляется, остальные удаляются.
+        Сайты, которые ещё не индексировались, не затрагиваются.
+        """
+        if not self._has_index():
+            return
+        site = self.site_key(settings)
+        if await self._run(self._get_state, site, kind) is None:
+            return
+        if item.get("status") == INDEXED_STATUS:
+            await self._run(self._upsert_items, site, kind, [item])
+        else:
+            await self._run(self._remove_items, site, kind, [item["id"]])
+
+    async def forget(self, settings, kind: str, wp_id: int) -> None:
+        """Удалить из индекса элемент, удалённый через инструменты"""
+        if not self._has_index():
+            return
+        await self._run(self._remove_items, self.site_key(settings), kind, [int(wp_id)])
+
+    # ---------- поиск ----------
+
+    @staticmethod
+    def _search(conn: sqlite3.Connection, site: str, kind: str, query: str, limit: int) -> List[Dict[str, Any]]:
+        rows = conn.execute(
+            "SELECT i.wp_id, i.title, i.excerpt, i.modified, i.link FROM content_fts "
+            "JOIN content_items i ON i.id = content_fts.rowid "
+            "WHERE content_fts MATCH ? AND i.site = ? AND i.kind = ? "
+            "ORDER BY bm25(content_fts, 10.0, 1.0) LIMIT ?",
+            (query, site, kind, limit),
+        ).fetchall()
+        return [
+            {"id": row[0], "title": row[1], "excerpt": row[2], "modified": row[3], "link": row[4]}
+            for row in rows
+        ]
+
+    async def search(self, settings, kind: str, search: str, limit: int = 10) -> Optional[Dict[str, Any]]:
+        """
+        Поиск по индексу сайта
+
+        Returns:
+            {"items": [...], "synced_at": ...} или None, если сайт не проиндексирован
+        """
+        site = self.site_key(settings)
+        state = await self._run(self._get_state, site, kind)
+        if state is None:
+            return None
+        query = fts_query(search)
+        items = await self._run(self._search, site, kind, query, limit) if query else []
+        return {"items": items, "synced_at": state["synced_at"]}
+
+    # ---------- фоновая синхронизация ----------
+
+    def _registered_connectors(self, conn: sqlite3.Connection) -> List[str]:
+        return [row[0] for row in conn.execute(
+            "SELECT DISTINCT connector_id FROM content_sync WHERE connector_id IS NOT NULL"
+        )]
+
+    async def sync_registered(self, full: bool = False) -> int:
+        """
+        Синхронизация всех сайтов, уже добавленных в индекс
+
+        Args:
+            full: Полная синхронизация (с удалением пропавших элементов)
+        """
+        from sqlalchemy import select
+        from .auth import snapshot_settings
+        from .database import AsyncSessionLocal
+        from .models import UserSettings
+
+        connector_ids = await self._run(self._registered_connectors)
+        if not connector_ids:
+            return 0
+        async with AsyncSessionLocal() as db:
+            rows = (await db.scalars(
+                select(UserSettings).where(UserSettings.mcp_connector_id.in_(connector_ids))
+            )).all()
+            snapshots = [snapshot_settings(row) for row in rows if row.wordpress_url]
+        synced = 0
+        for settings in snapshots:
+            try:
+                await self.sync(settings, full=full)
+                synced += 1
+            except Exception as e:
+                logger.error(f"ContentIndex: sync failed for {settings.mcp_connector_id}: {str(e)}")
+        return synced
+
+    def start(self, interval_seconds: float = 900.0, full_every: int = 96) -> None:
+        """
+        Периодическая синхронизация проиндексированных сайтов
+
+        Args:
+            interval_seconds: Период между проходами
+            full_every: Каждый N-й проход - полный (0 - только инкрементальные)
+        """
+        if self._task and not self._task.done():
+            return
+
+        async def sync_loop():
+            rounds = 0
+            while True:
+                await asyncio.sleep(interval_seconds)
+                rounds += 1
+                full = bool(full_every) and rounds % full_every == 0
+                started = time.perf_counter()
+                try:
+                    synced = await self.sync_registered(full=full)
+                    if synced:
+                        logger.info(
+                            f"ContentIndex: {synced} sites synced in {time.perf_counter() - started:.1f}s"
+                        )
+                except Exception as e:
+                    logger.error(f"ContentIndex: sync loop failed: {str(e)}")
+
+        self._task = asyncio.create_task(sync_loop())
+
+    async def close(self) -> None:
+        """Остановка фоновой синхронизации и закрытие файла индекса"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+content_index = ContentIndex(
+    path=os.getenv("WP_INDEX_PATH", DEFAULT_INDEX_PATH),
+    batch_size=int(os.getenv("WP_INDEX_BATCH_SIZE", "500")),
+)
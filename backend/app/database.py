@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from typing import Any, Dict
 import os
 
 # URL базы данных
@@ -8,14 +11,126 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DEFAULT_DB_PATH = os.path.abspath(os.path.join(BASE_DIR, "..", "app.db"))
 DATABASE_URL = os.getenv("DATABASE_URL", f"sqlite:///{DEFAULT_DB_PATH}")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Асинхронные драйверы для синхронных URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+# Профиль SQLite: production (WAL и прагмы ниже) или default (настройки SQLite по умолчанию)
+SQLITE_PROFILE_PRODUCTION = "production"
+SQLITE_PROFILE_DEFAULT = "default"
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", SQLITE_PROFILE_PRODUCTION)
+
+# Прагмы production профиля, применяются к каждому новому соединению
+SQLITE_PRODUCTION_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-64000")),  # отрицательное - в KiB (64 MB)
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+# Пул соединений (для SQLite в памяти не используется)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+
+def to_async_url(url: str) -> str:
+    """
+    Преобразовать URL базы данных в URL с асинхронным драйвером
+    sqlite:///app.db -> sqlite+aiosqlite:///app.db
+    postgresql://... -> postgresql+asyncpg://...
+    """
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if parsed.drivername in ASYNC_DRIVERS.values() or backend not in ASYNC_DRIVERS:
+        return url
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def is_sqlite_memory(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """
+    Параметры create_engine / create_async_engine для данного URL
+
+    Returns:
+        connect_args и настройки пула
+    """
+    options: Dict[str, Any] = {}
+    if is_sqlite(url):
+        options["connect_args"] = {"check_same_thread": False}
+    if not is_sqlite_memory(url):
+        options.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return options
+
+
+def set_sqlite_pragmas(dbapi_connection, pragmas: Dict[str, Any]) -> None:
+    """Применить прагмы к соединению SQLite (sqlite3 или aiosqlite)"""
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def install_sqlite_profile(sync_engine: Engine, profile: str = SQLITE_PROFILE) -> None:
+    """
+    Включить профиль SQLite для движка (для AsyncEngine передаётся .sync_engine)
+
+    Args:
+        sync_engine: Синхронный движок
+        profile: production или default
+    """
+    if profile != SQLITE_PROFILE_PRODUCTION or sync_engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        set_sqlite_pragmas(dbapi_connection, SQLITE_PRODUCTION_PRAGMAS)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", to_async_url(DATABASE_URL))
+
+# Синхронный движок - для скриптов миграций и фоновых потоков
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+install_sqlite_profile(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Асинхронный движок - для обработчиков запросов (не блокирует event loop)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+install_sqlite_profile(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+async def dispose_engines():
+    """Закрыть пулы соединений при остановке приложения"""
+    await async_engine.dispose()
+    engine.dispose()
@@ -2,10 +2,15 @@
 Helper Functions
 Вспомогательные функции для валидации, санитизации и утилиты
 """
+import base64
+import json
 import re
 import secrets
 import string
-from typing import Optional, Dict, Any
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Dict, Any, Tuple
 import os
 
 from cryptography.fernet import Fernet, InvalidToken
@@ -445,6 +450,150 @@ class SimpleRateLimiter:
             del self.requests[key]
 
 
+# ==================== PAGINATION HELPERS ====================
+
+CURSOR_NEXT = "next"
+CURSOR_PREV = "prev"
+
+
+def encode_cursor(created_at: datetime, row_id: int, direction: str = CURSOR_NEXT) -> str:
+    """
+    Непрозрачный курсор keyset-пагинации по (created_at, id)
+    
+    Args:
+        created_at: created_at граничной строки
+        row_id: id граничной строки
+        direction: next (дальше, к старым записям) или prev (назад, к новым)
+    
+    Returns:
+        base64url строка без паддинга
+    """
+    payload = json.dumps([created_at.isoformat(), row_id, direction], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int, str]:
+    """
+    Разбор курсора, созданного encode_cursor
+    
+    Returns:
+        (created_at, id, direction)
+    
+    Raises:
+        ValueError: Если курсор повреждён
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id, direction = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if direction not in (CURSOR_NEXT, CURSOR_PREV):
+            raise ValueError(direction)
+        return datetime.fromisoformat(created_at), int(row_id), direction
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+# ==================== CACHE HELPERS ====================
+
+class TTLCache:
+    """
+    Кэш в памяти процесса с ограничением размера (LRU) и временем жизни записей (TTL)
+    """
+    
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 60.0):
+        """
+        Args:
+            max_size: Максимальное количество записей
+            ttl_seconds: Время жизни записи по умолчанию
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        """
+        Получение значения
+        
+        Args:
+            key: Ключ
+            default: Значение, если записи нет или она истекла
+        
+        Returns:
+            Значение или default
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if time.monotonic() >= expires_at:
+            del self._data[key]
+            self._evicted(key, value)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+    
+    def set(self, key: Any, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        """
+        Сохранение значения
+        
+        Args:
+            key: Ключ
+            value: Значение
+            ttl_seconds: Время жизни (по умолчанию - ttl_seconds кэша)
+        """
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._data[key] = (value, time.monotonic() + ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            evicted_key, (evicted_value, _) = self._data.popitem(last=False)
+            self._evicted(evicted_key, evicted_value)
+    
+    def _evicted(self, key: Any, value: Any) -> None:
+        """
+        Хук: запись вытеснена из LRU или удалена по истечении TTL
+        (pop и clear его не вызывают). Переопределяется в наследниках
+        """
+    
+    def pop(self, key: Any) -> Any:
+        """
+        Удаление записи
+        
+        Returns:
+            Удалённое значение или None
+        """
+        entry = self._data.pop(key, None)
+        return entry[0] if entry else None
+    
+    def clear(self) -> None:
+        """Очистка кэша"""
+        self._data.clear()
+    
+    def __contains__(self, key: Any) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and time.monotonic() < entry[1]
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Размер кэша, попадания, промахи и hit rate
+        """
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
 # ==================== ENCRYPTION HELPERS ====================
 
 _FERNET_SECRET = os.getenv("FERNET_KEY")
@@ -0,0 +1,397 @@
+"""
+HTTP Client Registry
+Общие пулы httpx соединений на всё время жизни приложения
+"""
+import asyncio
+import hashlib
+import http.cookiejar
+import importlib.util
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+import httpx
+import logging
+
+from .helpers import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# HTTP/2 доступен только при установленном пакете h2 (httpx[http2])
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+class HttpClientRegistry:
+    """
+    Реестр httpx.AsyncClient, по одному клиенту на origin (scheme://host:port)
+
+    Клиенты переиспользуют TCP/TLS соединения между вызовами инструментов,
+    поэтому цепочка из десятков запросов к одному сайту платит за handshake один раз.
+    Клиент origin общий для всех пользователей, поэтому cookies ответов не сохраняются
+    (авторизация передаётся в каждом запросе). Запросы берут клиент через client():
+    вытесненный из LRU клиент закрывается, только когда завершится последний запрос к нему.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        max_keepalive_per_host: int = 5,
+        keepalive_expiry: float = 30.0,
+        max_clients: int = 500,
+        http2: bool = True,
+        timeout: float = 30.0,
+    ):
+        """
+        Args:
+            name: Название реестра (для логов)
+            max_connections: Общий лимит одновременных запросов по всем origin
+            max_connections_per_host: Лимит соединений на один origin
+            max_keepalive_per_host: Количество keep-alive соединений на origin
+            keepalive_expiry: Время жизни простаивающего соединения (сек)
+            max_clients: Максимум origin в реестре (LRU вытеснение)
+            http2: Использовать HTTP/2 если доступен h2
+            timeout: Таймаут по умолчанию
+        """
+        self.name = name
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.max_keepalive_per_host = max_keepalive_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self.max_clients = max_clients
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.timeout = timeout
+        self._clients: "OrderedDict[str, httpx.AsyncClient]" = OrderedDict()
+        # Клиент -> число выполняющихся запросов; вытесненные клиенты ждут закрытия в _retired
+        self._in_use: Dict[httpx.AsyncClient, int] = {}
+        self._retired: Set[httpx.AsyncClient] = set()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._closing: set = set()
+
+    @staticmethod
+    def origin_of(url: str) -> str:
+        """
+        Получить origin (scheme://netloc) из URL
+
+        Args:
+            url: Полный URL
+
+        Returns:
+            Origin в нижнем регистре
+        """
+        parsed = urlparse(url)
+        return f"{parsed.scheme.lower()}://{parsed.netloc.lower()}"
+
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.max_connections_per_host,
+            max_keepalive_connections=self.max_keepalive_per_host,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        # Политика без разрешённых доменов: Set-Cookie одного пользователя не попадёт в запросы другого
+        cookies = http.cookiejar.CookieJar(policy=http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+        return httpx.AsyncClient(http2=self.http2, limits=limits, timeout=self.timeout, cookies=cookies)
+
+    async def start(self) -> None:
+        """Инициализация реестра при старте приложения"""
+        self._slots = asyncio.Semaphore(self.max_connections)
+        logger.info(
+            f"HTTP[{self.name}]: registry started (http2={self.http2}, "
+            f"per_host={self.max_connections_per_host}, total={self.max_connections})"
+        )
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """
+        Получить (или создать) клиент для origin данного URL
+
+        Args:
+            url: URL запроса или базовый URL сайта
+
+        Returns:
+            Общий httpx.AsyncClient для origin (для запросов используйте client(),
+            иначе клиент может быть закрыт при вытеснении во время запроса)
+        """
+        origin = self.origin_of(url)
+        client = self._clients.get(origin)
+        if client is not None and not client.is_closed:
+            self._clients.move_to_end(origin)
+            return client
+
+        client = self._create_client()
+        self._clients[origin] = client
+        logger.info(f"HTTP[{self.name}]: new pooled client for {origin}")
+
+        # Вытесняем самый старый origin, если реестр переполнен
+        while len(self._clients) > self.max_clients:
+            old_origin, old_client = self._clients.popitem(last=False)
+            if self._in_use.get(old_client):
+                # Закроется после последнего выполняющегося запроса
+                self._retired.add(old_client)
+            else:
+                self._schedule_close(old_client)
+            logger.info(f"HTTP[{self.name}]: evicted client for {old_origin}")
+
+        return client
+
+    @asynccontextmanager
+    async def client(self, url: str):
+        """
+        Клиент origin на время запроса (со слотом глобального лимита)
+
+        Пока блок выполняется, клиент не закрывается, даже если его вытеснили из реестра
+
+        Args:
+            url: URL запроса или базовый URL сайта
+        """
+        client = self.get_client(url)
+        self._in_use[client] = self._in_use.get(client, 0) + 1
+        try:
+            async with self.slot():
+                yield client
+        finally:
+            self._in_use[client] -= 1
+            if not self._in_use[client]:
+                del self._in_use[client]
+                if client in self._retired:
+                    self._retired.discard(client)
+                    self._schedule_close(client)
+
+    def _schedule_close(self, client: httpx.AsyncClient) -> None:
+        try:
+            task = asyncio.get_running_loop().create_task(client.aclose())
+        except RuntimeError:
+            return
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @asynccontextmanager
+    async def slot(self):
+        """Захват слота глобального лимита соединений на время запроса"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        async with self._slots:
+            yield
+
+    def get_active_clients(self) -> int:
+        """
+        Returns:
+            Количество origin с открытым пулом соединений
+        """
+        return len(self._clients)
+
+    async def aclose(self) -> None:
+        """Закрытие всех клиентов при остановке приложения"""
+        clients = list(self._clients.values()) + list(self._retired)
+        self._clients.clear()
+        self._retired.clear()
+        for client in clients:
+            await client.aclose()
+        if self._closing:
+            await asyncio.gather(*self._closing, return_exceptions=True)
+        logger.info(f"HTTP[{self.name}]: closed {len(clients)} pooled clients")
+
+
+# Заголовки, которые не переносятся в закэшированный ответ (тело уже декодировано)
+UNCACHED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+class CachedResponse:
+    """Тело и заголовки успешного GET ответа с валидаторами для условного запроса"""
+
+    def __init__(self, response: httpx.Response, fresh_until: float):
+        self.content = response.content
+        self.headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in UNCACHED_HEADERS
+        ]
+        self.etag = response.headers.get("ETag")
+        self.last_modified = response.headers.get("Last-Modified")
+        self.fresh_until = fresh_until
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self.fresh_until
+
+    def validators(self) -> Dict[str, str]:
+        """Заголовки If-None-Match / If-Modified-Since"""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_response(self, request: Optional[httpx.Request] = None) -> httpx.Response:
+        return httpx.Response(200, headers=self.headers, content=self.content, request=request)
+
+
+class _ResponseTTLCache(TTLCache):
+    """TTLCache, сообщающий ResponseCache о вытесненных и истёкших записях"""
+
+    def __init__(self, on_evicted, **kwargs):
+        super().__init__(**kwargs)
+        self._on_evicted = on_evicted
+
+    def _evicted(self, key, value) -> None:
+        self._on_evicted(key)
+
+
+class ResponseCache:
+    """
+    Кэш GET ответов REST API по сайту с TTL и условной ревалидацией
+
+    Свежая запись (моложе ttl_seconds) отдаётся без запроса. Устаревшая хранится
+    до stale_seconds и ревалидируется через ETag/Last-Modified: ответ 304
+    возвращает закэшированное тело. Запись через тот же слой сбрасывает
+    записи ресурса на сайте (например, POST /wp/v2/tags -> списки тегов).
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 30.0,
+        stale_seconds: float = 600.0,
+        max_entries: int = 2000,
+        related_resources: Optional[Dict[str, Tuple[str, ...]]] = None,
+    ):
+        """
+        Args:
+            ttl_seconds: Время, когда запись отдаётся без запроса к сайту
+            stale_seconds: Время хранения записи для ревалидации
+            max_entries: Максимум записей (LRU), 0 - кэш выключен
+            related_resources: Какие ещё ресурсы сбрасывает запись в ресурс
+        """
+        self.ttl_seconds = ttl_seconds
+        self.enabled = max_entries > 0
+        self._cache = _ResponseTTLCache(
+            self._forget_key, max_size=max(max_entries, 1), ttl_seconds=max(stale_seconds, ttl_seconds)
+        )
+        # (origin, ресурс) -> ключи; обновляется при вытеснении, поэтому не больше max_entries ключей
+        self._keys_by_resource: Dict[Tuple[str, str], Set[Any]] = {}
+        self.related_resources = related_resources or {}
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.invalidations = 0
+
+    def _forget_key(self, key: Tuple) -> None:
+        keys = self._keys_by_resource.get(key[:2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_resource[key[:2]]
+
+    @staticmethod
+    def resource_of(path: str) -> str:
+        """
+        Ресурс REST API из пути: /wp-json/wp/v2/tags/5 -> wp/v2/tags
+        """
+        path = urlparse(path).path
+        if "/wp-json/" in path:
+            path = path.split("/wp-json/", 1)[1]
+        return "/".join(path.strip("/").split("/")[:3])
+
+    @staticmethod
+    def credential_of(username: Optional[str], password: Optional[str]) -> str:
+        """
+        Часть ключа для учётных данных: хэш логина и пароля
+
+        Аккаунт с тем же логином, но другим (неверным, отозванным) паролем не получает
+        чужие ответы из кэша - его запрос уходит на сайт и проверяется WordPress.
+        """
+        raw = f"{username or ''}\0{password or ''}".encode("utf-8")
+        return hashlib.sha256(raw).hexdigest()[:32]
+
+    def make_key(self, url: str, path: str, credential: Optional[str], params: Optional[Dict[str, Any]]) -> Tuple:
+        origin = HttpClientRegistry.origin_of(url)
+        items = tuple(sorted((str(k), str(v)) for k, v in (params or {}).items()))
+        return (origin, self.resource_of(path), path, credential, items)
+
+    def lookup(self, key: Tuple) -> Optional[CachedResponse]:
+        """Запись для ключа (свежая или устаревшая) или None"""
+        if not self.enabled:
+            return None
+        return self._cache.get(key)
+
+    def record_hit(self, entry: CachedResponse) -> None:
+        self.hits += 1
+        self.bytes_saved += len(entry.content)
+
+    def record_not_modified(self, key: Tuple, entry: CachedResponse) -> None:
+        """Сайт ответил 304 - продлеваем запись"""
+        self.revalidated += 1
+        self.bytes_saved += len(entry.content)
+        entry.fresh_until = time.monotonic() + self.ttl_seconds
+        self._cache.set(key, entry)
+
+    def store(self, key: Tuple, response: httpx.Response) -> None:
+        """Сохранить успешный GET ответ"""
+        self.misses += 1
+        if not self.enabled or response.status_code != 200:
+            return
+        self._cache.set(key, CachedResponse(response, time.monotonic() + self.ttl_seconds))
+        self._keys_by_resource.setdefault(key[:2], set()).add(key)
+
+    def invalidate(self, url: str, path: str) -> None:
+        """
+        Сбросить записи ресурса (и связанных ресурсов) на сайте после записи
+
+        Args:
+            url: URL сайта
+            path: Путь запроса записи (POST/DELETE)
+        """
+        origin = HttpClientRegistry.origin_of(url)
+        resource = self.resource_of(path)
+        for name in (resource, *self.related_resources.get(resource, ())):
+            keys = self._keys_by_resource.pop((origin, name), set())
+            for key in keys:
+                self._cache.pop(key)
+            self.invalidations += len(keys)
+
+    def clear(self) -> None:
+        self._cache.clear()
+        self._keys_by_resource.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Попадания, ревалидации (304), промахи, hit rate и сэкономленные байты
+        """
+        requests = self.hits + self.revalidated + self.misses
+        return {
+            "size": len(self._cache),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.revalidated) / requests, 4) if requests else 0.0,
+            "bytes_saved": self.bytes_saved,
+            "invalidations": self.invalidations,
+        }
+
+
+wordpress_http = HttpClientRegistry(
+    "wordpress",
+    max_connections=int(os.getenv("WP_HTTP_MAX_CONNECTIONS", "200")),
+    max_connections_per_host=int(os.getenv("WP_HTTP_MAX_CONNECTIONS_PER_HOST", "10")),
+    max_keepalive_per_host=int(os.getenv("WP_HTTP_MAX_KEEPALIVE_PER_HOST", "5")),
+    keepalive_expiry=float(os.getenv("WP_HTTP_KEEPALIVE_EXPIRY", "30")),
+    max_clients=int(os.getenv("WP_HTTP_MAX_CLIENTS", "500")),
+    http2=os.getenv("WP_HTTP2", "1") != "0",
+)
+
+# Записи постов/страниц меняют счётчики в рубриках и тегах (и наоборот)
+wordpress_cache = ResponseCache(
+    ttl_seconds=float(os.getenv("WP_CACHE_TTL", "30")),
+    stale_seconds=float(os.getenv("WP_CACHE_STALE_TTL", "600")),
+    max_entries=int(os.getenv("WP_CACHE_MAX_ENTRIES", "2000")),
+    related_resources={
+        "wp/v2/posts": ("wp/v2/categories", "wp/v2/tags"),
+        "wp/v2/pages": ("wp/v2/categories", "wp/v2/tags"),
+        "wp/v2/categories": ("wp/v2/posts",),
+        "wp/v2/tags": ("wp/v2/posts",),
+        "wp/v2/comments": ("wp/v2/posts", "wp/v2/pages"),
+    },
+)
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Form
+from fastapi import FastAPI, BackgroundTasks, Depends, HTTPException, status, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer
 from fastapi.responses import HTMLResponse, RedirectResponse
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import httpx
 import os
 import re
@@ -10,28 +11,41 @@ import asyncio
 import json
 import secrets
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional, Dict
 
-from .database import get_db
+from .database import get_db, dispose_engines
 from .auth import (
     get_current_user,
     get_current_admin_user,
     create_access_token,
-    get_password_hash,
-    verify_password,
+    get_password_hash_async,
+    verify_password_async,
+    shutdown_password_executor,
     generate_connector_id,
     generate_mcp_sse_url,
-    get_user_from_token,
+    get_principal_by_connector,
+    get_principal_from_token,
+    invalidate_principal,
+    principal_cache,
 )
 from sse_starlette import EventSourceResponse
-from .models import User, UserSettings, ActivityLog, AdminLog, LoginAttempt
+from .models import User, UserSettings, ActivityLog, AdminLog, LoginAttempt, ActivityRollupDaily
 from .schemas import UserCreate, UserLogin, MCPRequest, MCPResponse
 from .admin_routes import router as admin_router
 from .telegram_check import router as telegram_check_router
-from .wordpress_tools import handle_wordpress_tool
+from .wordpress_tools import handle_wordpress_tool, WORDPRESS_BULK_TOOLS
 from .wordstat_tools import handle_wordstat_tool
 from .telegram_tools import handle_telegram_tool
+from .telegram_bots import telegram_bots
+from .telegram_broadcast import broadcast_manager
+from .telegram_updates import SECRET_HEADER, telegram_updates, verify_webhook_secret, webhook_secret_refresh
+from .telegram_media import telegram_media
+from .http_clients import wordpress_cache, wordpress_http
+from .activity_log import activity_writer, tool_action_type, STATUS_ERROR, STATUS_SUCCESS
+from .retention import retention_engine
+from .content_index import content_index
 from .helpers import (
     create_jsonrpc_response,
     create_jsonrpc_error,
@@ -44,6 +58,8 @@ from .helpers import (
 from .mcp_handlers import (
     SseManager,
     OAuthStore,
+    create_sse_broker,
+    create_oauth_storage,
     get_all_mcp_tools,
     get_mcp_server_info
 )
@@ -115,11 +131,125 @@ security = HTTPBearer()
 MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "http://localhost:8080")
 
 # Глобальные экземпляры (импортированы из mcp_handlers)
-sse_manager = SseManager()
-oauth_store = OAuthStore()
+sse_manager = SseManager(
+    create_sse_broker(),
+    max_queue_size=int(os.getenv("SSE_QUEUE_SIZE", "100")),
+    overflow_policy=os.getenv("SSE_OVERFLOW_POLICY", "drop_oldest"),
+)
+oauth_store = OAuthStore(create_oauth_storage())
 
 logger = logging.getLogger("uvicorn.error")
 
+
+@app.on_event("startup")
+async def startup_services():
+    """Запуск сервисов на время жизни приложения"""
+    # Общие пулы HTTP соединений
+    await wordpress_http.start()
+    # Брокер SSE (in-memory или Redis pub/sub)
+    await sse_manager.start()
+    # Периодическая очистка истёкших OAuth кодов и токенов
+    oauth_store.start_sweeper(float(os.getenv("OAUTH_SWEEP_INTERVAL", "60")))
+    # Вытеснение неиспользуемых Telegram ботов из реестра
+    telegram_bots.start_sweeper(float(os.getenv("TELEGRAM_BOT_SWEEP_INTERVAL", "60")))
+    # Рассылки Telegram: продолжение прерванных и уведомления о ходе в SSE
+    broadcast_manager.notify = broadcast_progress
+    await broadcast_manager.start(float(os.getenv("TELEGRAM_BROADCAST_RESUME_INTERVAL", "60")))
+    # Буфер обновлений Telegram, принятых webhook'ом
+    await telegram_updates.ensure_tables()
+    # Учёт файлов Telegram, перенесённых в медиатеку WordPress
+    await telegram_media.ensure_tables()
+    # Пакетная запись ActivityLog
+    await activity_writer.start()
+    # Архивация и удаление старых activity_logs / login_attempts (0 - выключено)
+    retention_interval = float(os.getenv("RETENTION_INTERVAL", "0"))
+    if retention_interval > 0:
+        retention_engine.start(retention_interval)
+    # Фоновая синхронизация локального поискового индекса WordPress (0 - выключено)
+    index_interval = float(os.getenv("WP_INDEX_SYNC_INTERVAL", "900"))
+    if index_interval > 0:
+        content_index.start(index_interval, int(os.getenv("WP_INDEX_FULL_SYNC_EVERY", "96")))
+
+
+@app.on_event("shutdown")
+async def shutdown_services():
+    """Остановка сервисов"""
+    await oauth_store.close()
+    await retention_engine.close()
+    await broadcast_manager.close()
+    await content_index.close()
+    await sse_manager.close()
+    await activity_writer.aclose()
+    await wordpress_http.aclose()
+    await telegram_bots.aclose()
+    shutdown_password_executor()
+    await dispose_engines()
+
+def record_tool_call(principal, connector_id: str, tool_name: str, response: Dict, started: float, request: Request):
+    """Записать вызов MCP инструмента в ActivityLog (через буфер, без ожидания БД)"""
+    error_message = None
+    if "error" in response:
+        error_message = response["error"].get("message")
+    else:
+        content = response.get("result", {}).get("content") or [{}]
+        text = content[0].get("text") or ""
+        if text.startswith("❌"):
+            error_message = text.strip().splitlines()[0][:500]
+
+    activity_writer.record(
+        user_id=principal.user_id,
+        action_type=tool_action_type(tool_name),
+        action_name=tool_name,
+        status=STATUS_ERROR if error_message else STATUS_SUCCESS,
+        details={
+            "connector_id": connector_id,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+        },
+        error_message=error_message,
+        ip_address=request.client.host if request.client else None,
+        user_agent=request.headers.get("user-agent"),
+    )
+
+def tool_progress(connector_id: str, payload: Dict):
+    """
+    Callback прогресса инструмента: MCP notifications/progress в SSE канал коннектора
+    
+    progressToken берётся из params._meta запроса, иначе используется id запроса.
+    """
+    params = payload.get("params") or {}
+    progress_token = (params.get("_meta") or {}).get("progressToken", payload.get("id"))
+    
+    async def progress(done: int, total: int, message: str) -> None:
+        await sse_manager.send(connector_id, {
+            "jsonrpc": "2.0",
+            "method": "notifications/progress",
+            "params": {
+                "progressToken": progress_token,
+                "progress": done,
+                "total": total,
+                "message": message,
+            },
+        })
+    
+    return progress
+
+
+async def broadcast_progress(connector_id: str, status: Dict) -> None:
+    """
+    Ход фоновой рассылки: MCP notifications/message в SSE канал коннектора
+    
+    Вызов инструмента к этому моменту завершён, поэтому notifications/progress не подходит.
+    """
+    await sse_manager.send(connector_id, {
+        "jsonrpc": "2.0",
+        "method": "notifications/message",
+        "params": {
+            "level": "info",
+            "logger": "telegram_broadcast",
+            "data": status,
+        },
+    })
+
 # Функции валидации
 def validate_email(email: str) -> bool:
     """Валидация email адреса"""
@@ -154,7 +284,7 @@ async def root():
     return {"message": "WordPress MCP Platform API", "version": "1.0.0"}
 
 @app.post("/auth/register")
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя"""
     # Валидация входных данных
     if not validate_email(user_data.email):
@@ -174,7 +304,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     user_data.full_name = sanitize_input(user_data.full_name)
     
     # Проверяем, существует ли пользователь с таким email
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=400,
@@ -182,7 +312,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Создаем нового пользователя
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await get_password_hash_async(user_data.password)
     user = User(
         email=user_data.email,
         hashed_password=hashed_password,
@@ -190,8 +320,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
     
     # Генерируем уникальный коннектор для MCP SSE
     connector_id = generate_connector_id(user.id, user.full_name)
@@ -206,7 +336,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         language="ru"
     )
     db.add(settings)
-    db.commit()
+    await db.commit()
     
     # Создаем токен доступа
     access_token = create_access_token(data={"sub": user.email})
@@ -223,7 +353,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     }
 
 @app.post("/auth/login")
-async def login(login_data: UserLogin, db: Session = Depends(get_db)):
+async def login(login_data: UserLogin, db: AsyncSession = Depends(get_db)):
     """Вход в систему"""
     # Валидация входных данных
     if not validate_email(login_data.email):
@@ -235,8 +365,8 @@ async def login(login_data: UserLogin, db: Session = Depends(get_db)):
     # Очистка входных данных
     login_data.email = sanitize_input(login_data.email.lower())
     
-    user = db.query(User).filter(User.email == login_data.email).first()
-    if not user or not verify_password(login_data.password, user.hashed_password):
+    user = await db.scalar(select(User).where(User.email == login_data.email))
+    if not user or not await verify_password_async(login_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Неверный email или пароль",
@@ -268,10 +398,10 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 @app.get("/user/settings")
 async def get_user_settings(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить настройки пользователя"""
-    settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
 
     if not settings:
         connector_id = generate_connector_id(current_user.id, current_user.full_name or "user")
@@ -283,8 +413,8 @@ async def get_user_settings(
             language="ru"
         )
         db.add(settings)
-        db.commit()
-        db.refresh(settings)
+        await db.commit()
+        await db.refresh(settings)
     else:
         connector_id = settings.mcp_connector_id
         if not connector_id or len(connector_id) < 20:
@@ -293,8 +423,9 @@ async def get_user_settings(
         expected_url = generate_mcp_sse_url(connector_id)
         if settings.mcp_sse_url != expected_url:
             settings.mcp_sse_url = expected_url
-        db.commit()
-        db.refresh(settings)
+            invalidate_principal(current_user.id)
+        await db.commit()
+        await db.refresh(settings)
     
     # Определяем наличие учётных данных
     has_wordpress = bool(
@@ -328,10 +459,10 @@ async def get_user_settings(
 async def update_user_settings(
     settings_data: dict,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Обновить настройки пользователя"""
-    settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
     if not settings:
         settings = UserSettings(user_id=current_user.id)
         db.add(settings)
@@ -351,36 +482,38 @@ async def update_user_settings(
                 value = sanitize_input(value)
             setattr(settings, key, value)
     
-    db.commit()
+    await db.commit()
+    invalidate_principal(current_user.id)
+    if 'telegram_bot_token' in settings_data:
+        telegram_bots.invalidate(current_user.id)
     return {"message": "Настройки обновлены"}
 
 @app.get("/user/stats")
 async def get_user_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Получить статистику пользователя"""
-    from sqlalchemy import func
     
     # Общая статистика
-    total_actions = db.query(func.count(ActivityLog.id)).filter(
-        ActivityLog.user_id == current_user.id
-    ).scalar() or 0
+    total_actions = await db.scalar(select(func.sum(ActivityRollupDaily.action_count)).where(
+        ActivityRollupDaily.user_id == current_user.id
+    )) or 0
     
     # Статистика по типам действий
-    actions_by_type = db.query(
-        ActivityLog.action_type,
-        func.count(ActivityLog.id).label('count')
-    ).filter(
-        ActivityLog.user_id == current_user.id
-    ).group_by(ActivityLog.action_type).all()
+    actions_by_type = (await db.execute(select(
+        ActivityRollupDaily.action_type,
+        func.sum(ActivityRollupDaily.action_count).label('count')
+    ).where(
+        ActivityRollupDaily.user_id == current_user.id
+    ).group_by(ActivityRollupDaily.action_type))).all()
     
     actions_stats = {action_type: count for action_type, count in actions_by_type}
     
     # Последние действия
-    recent_activities = db.query(ActivityLog).filter(
+    recent_activities = (await db.scalars(select(ActivityLog).where(
         ActivityLog.user_id == current_user.id
-    ).order_by(ActivityLog.created_at.desc()).limit(20).all()
+    ).order_by(ActivityLog.created_at.desc()).limit(20))).all()
     
     recent_activities_list = [
         {
@@ -395,19 +528,19 @@ async def get_user_stats(
     ]
     
     # Статистика подключений
-    settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
     has_wordpress = bool(settings and settings.wordpress_url and settings.wordpress_username)
     has_wordstat = bool(settings and settings.wordstat_client_id and settings.wordstat_client_secret)
     
     # Активность за последние 7 дней
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
-    daily_activity = db.query(
-        func.date(ActivityLog.created_at).label('date'),
-        func.count(ActivityLog.id).label('count')
-    ).filter(
-        ActivityLog.user_id == current_user.id,
-        ActivityLog.created_at >= seven_days_ago
-    ).group_by(func.date(ActivityLog.created_at)).all()
+    daily_activity = (await db.execute(select(
+        ActivityRollupDaily.day.label('date'),
+        func.sum(ActivityRollupDaily.action_count).label('count')
+    ).where(
+        ActivityRollupDaily.user_id == current_user.id,
+        ActivityRollupDaily.day >= seven_days_ago.date()
+    ).group_by(ActivityRollupDaily.day).order_by(ActivityRollupDaily.day))).all()
     
     daily_activity_list = [
         {"date": str(date), "count": count}
@@ -436,10 +569,10 @@ async def get_user_stats(
 async def execute_mcp_command(
     request: MCPRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Выполнить команду MCP"""
-    settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
     if not settings:
         raise HTTPException(status_code=404, detail="Настройки не найдены")
     
@@ -503,7 +636,7 @@ async def execute_mcp_command(
 @app.get("/mcp/sse")
 async def sse_endpoint_oauth(
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """SSE endpoint для OAuth клиентов (без connector_id в URL)"""
     auth_header = request.headers.get("Authorization")
@@ -517,18 +650,17 @@ async def sse_endpoint_oauth(
         )
     
     token = auth_header.split(" ", 1)[1]
-    connector_id = oauth_store.get_connector_by_token(token)
+    connector_id = await oauth_store.get_connector_by_token(token)
     
     if not connector_id:
         # Попробовать JWT
-        user = get_user_from_token(token, db)
-        if not user:
+        principal = await get_principal_from_token(token, db)
+        if not principal:
             raise HTTPException(status_code=401, detail="Недействительный токен")
         
-        settings = db.query(UserSettings).filter(UserSettings.user_id == user.id).first()
-        if not settings or not settings.mcp_connector_id:
+        if not principal.connector_id:
             raise HTTPException(status_code=404, detail="Коннектор не найден")
-        connector_id = settings.mcp_connector_id
+        connector_id = principal.connector_id
     
     logger.info("SSE GET: connector %s connected via OAuth/JWT", connector_id)
     
@@ -547,6 +679,9 @@ async def sse_endpoint_oauth(
                     break
                 try:
                     message = await asyncio.wait_for(queue.get(), timeout=15)
+                    if message is None:
+                        # Отключён как медленный потребитель
+                        break
                     yield {
                         "event": "message",
                         "data": message,
@@ -557,7 +692,7 @@ async def sse_endpoint_oauth(
                         "comment": "keepalive",
                     }
         finally:
-            sse_manager.disconnect(connector_id)
+            await sse_manager.disconnect(connector_id, queue)
             logger.info("SSE GET: connector %s disconnected", connector_id)
 
     return EventSourceResponse(event_generator())
@@ -567,7 +702,7 @@ async def sse_endpoint_oauth(
 async def send_sse_event_oauth(
     payload: Dict,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """POST endpoint для OAuth клиентов (без connector_id в URL)"""
     auth_header = request.headers.get("Authorization")
@@ -582,19 +717,18 @@ async def send_sse_event_oauth(
         )
     
     token = auth_header.split(" ", 1)[1]
-    connector_id = oauth_store.get_connector_by_token(token)
+    connector_id = await oauth_store.get_connector_by_token(token)
     
     if not connector_id:
         # Попробовать JWT
-        user = get_user_from_token(token, db)
-        if not user:
+        principal = await get_principal_from_token(token, db)
+        if not principal:
             logger.warning("SSE POST /mcp/sse: invalid token")
             raise HTTPException(status_code=401, detail="Недействительный токен")
         
-        settings = db.query(UserSettings).filter(UserSettings.user_id == user.id).first()
-        if not settings or not settings.mcp_connector_id:
+        if not principal.connector_id:
             raise HTTPException(status_code=404, detail="Коннектор не найден")
-        connector_id = settings.mcp_connector_id
+        connector_id = principal.connector_id
     
     logger.info("SSE POST /mcp/sse received from connector %s: %s", connector_id, json.dumps(payload))
     
@@ -637,11 +771,12 @@ async def send_sse_event_oauth(
         tool_name = payload.get("params", {}).get("name")
         tool_args = payload.get("params", {}).get("arguments", {})
         
+        started = time.perf_counter()
         logger.info("SSE POST: tools/call %s with args: %s", tool_name, tool_args)
         
-        # Получаем настройки пользователя
-        settings = db.query(UserSettings).filter(UserSettings.mcp_connector_id == connector_id).first()
-        if not settings:
+        # Получаем пользователя и снимок настроек (из кэша, без запросов к БД)
+        principal = await get_principal_by_connector(connector_id, db)
+        if not principal:
             error_response = {
                 "jsonrpc": "2.0",
                 "id": request_id,
@@ -658,15 +793,20 @@ async def send_sse_event_oauth(
             
             # === WORDPRESS TOOLS ===
             if tool_name.startswith("wordpress_"):
-                result_content = await handle_wordpress_tool(tool_name, settings, tool_args)
+                result_content = await handle_wordpress_tool(
+                    tool_name, principal.settings, tool_args, progress=tool_progress(connector_id, payload)
+                )
             
             # === WORDSTAT TOOLS ===
             elif tool_name.startswith("wordstat_"):
+                # Wordstat может сохранять токены - нужна ORM запись настроек
+                settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == principal.user_id))
                 result_content = await handle_wordstat_tool(tool_name, settings, tool_args, db)
+                invalidate_principal(principal.user_id)
             
             # === TELEGRAM TOOLS ===
             elif tool_name.startswith("telegram_"):
-                result_content = await handle_telegram_tool(tool_name, tool_args, user.id, db)
+                result_content = await handle_telegram_tool(tool_name, tool_args, principal.user_id, db)
             
             # === UNKNOWN TOOL ===
             else:
@@ -684,6 +824,7 @@ async def send_sse_event_oauth(
                 }
             }
             logger.info("SSE POST: tools/call %s successful", tool_name)
+            record_tool_call(principal, connector_id, tool_name, response, started, request)
             # ChatGPT ожидает ответ напрямую в HTTP response
             return response
             
@@ -697,6 +838,7 @@ async def send_sse_event_oauth(
                     "message": f"Ошибка выполнения: {str(e)}"
                 }
             }
+            record_tool_call(principal, connector_id, tool_name, error_response, started, request)
             return error_response
     else:
         logger.info("SSE POST /mcp/sse: event dispatched to connector %s", connector_id)
@@ -709,20 +851,18 @@ async def send_sse_event_oauth(
 async def sse_endpoint(
     connector_id: str,
     request: Request,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     auth_header = request.headers.get("Authorization")
     if auth_header and auth_header.lower().startswith("bearer "):
         token = auth_header.split(" ", 1)[1]
-        token_connector = oauth_store.get_connector_by_token(token)
+        token_connector = await oauth_store.get_connector_by_token(token)
         if not token_connector:
             raise HTTPException(status_code=401, detail="Недействительный токен")
         connector_id = token_connector
 
-    settings = (
-        db.query(UserSettings)
-        .filter(UserSettings.mcp_connector_id == connector_id)
-        .first()
+    settings = await db.scalar(
+        select(UserSettings).where(UserSettings.mcp_connector_id == connector_id)
     )
     if not settings:
         raise HTTPException(status_code=404, detail="Коннектор не найден")
@@ -736,6 +876,9 @@ async def sse_endpoint(
                     break
                 try:
                     message = await asyncio.wait_for(queue.get(), timeout=15)
+                    if message is None:
+                        # Отключён как медленный потребитель
+                        break
                     yield {
                         "event": "message",
                         "data": message,
@@ -746,7 +889,7 @@ async def sse_endpoint(
                         "data": "ping",
                     }
         finally:
-            sse_manager.disconnect(connector_id)
+            await sse_manager.disconnect(connector_id, queue)
 
     return EventSourceResponse(event_generator())
 
@@ -757,7 +900,7 @@ async def send_sse_event(
     payload: Dict,
     request: Request,
     current_user: Optional[User] = Depends(lambda: None),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     auth_header = request.headers.get("Authorization")
     logger.info(
@@ -769,7 +912,7 @@ async def send_sse_event(
         token = auth_header.split(" ", 1)[1]
         logger.info("SSE POST: bearer token received for connector %s", connector_id)
 
-        token_connector = oauth_store.get_connector_by_token(token)
+        token_connector = await oauth_store.get_connector_by_token(token)
         if token_connector:
             logger.info(
                 "SSE POST: authorized via OAuth token for connector %s -> %s",
@@ -779,30 +922,24 @@ async def send_sse_event(
             connector_id = token_connector
         else:
             # возможно JWT токен
-            user = get_user_from_token(token, db)
-            if not user:
+            token_principal = await get_principal_from_token(token, db)
+            if not token_principal:
                 logger.warning(
                     "SSE POST: bearer token rejected (not OAuth/JWT) for connector %s",
                     connector_id,
                 )
                 raise HTTPException(status_code=401, detail="Недействительный токен")
 
-            settings = (
-                db.query(UserSettings)
-                .filter(UserSettings.user_id == user.id)
-                .filter(UserSettings.mcp_connector_id == connector_id)
-                .first()
-            )
-            if not settings:
+            if token_principal.connector_id != connector_id:
                 logger.warning(
                     "SSE POST: user %s has no access to connector %s",
-                    user.id,
+                    token_principal.user_id,
                     connector_id,
                 )
                 raise HTTPException(status_code=403, detail="Нет доступа к этому коннектору")
             logger.info(
                 "SSE POST: authorized via JWT user %s for connector %s",
-                user.id,
+                token_principal.user_id,
                 connector_id,
             )
     elif current_user:
@@ -811,11 +948,10 @@ async def send_sse_event(
             current_user.id,
             connector_id,
         )
-        settings = (
-            db.query(UserSettings)
-            .filter(UserSettings.user_id == current_user.id)
-            .filter(UserSettings.mcp_connector_id == connector_id)
-            .first()
+        settings = await db.scalar(
+            select(UserSettings)
+            .where(UserSettings.user_id == current_user.id)
+            .where(UserSettings.mcp_connector_id == connector_id)
         )
         if not settings:
             logger.warning(
@@ -831,8 +967,8 @@ async def send_sse_event(
             connector_id,
         )
         # Проверим, что connector_id существует в базе
-    settings = db.query(UserSettings).filter(UserSettings.mcp_connector_id == connector_id).first()
-    if not settings:
+    principal = await get_principal_by_connector(connector_id, db)
+    if not principal:
         logger.warning(
             "SSE POST: connector %s not found in database",
             connector_id,
@@ -877,40 +1013,32 @@ async def send_sse_event(
         tool_name = payload.get("params", {}).get("name")
         tool_args = payload.get("params", {}).get("arguments", {})
         
+        started = time.perf_counter()
         logger.info("SSE POST: tools/call for %s with args: %s", tool_name, json.dumps(tool_args))
         
-        # Get user from connector_id (ChatGPT doesn't send Authorization header)
-        # Find the user who owns this connector_id
-        settings = db.query(UserSettings).filter(UserSettings.mcp_connector_id == connector_id).first()
-        if not settings:
-            logger.warning("SSE POST: tools/call connector %s not found in database", connector_id)
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32600,
-                    "message": "Connector not found"
-                }
-            }
+        # Пользователь коннектора уже получен выше (ChatGPT не отправляет Authorization header)
+        logger.info("SSE POST: tools/call authorized for user %s (ID: %s) via connector %s", 
+                   principal.email, principal.user_id, connector_id)
         
-        # Get user from settings
-        user = db.query(User).filter(User.id == settings.user_id).first()
-        if not user:
-            logger.warning("SSE POST: tools/call user not found for connector %s", connector_id)
-            return {
-                "jsonrpc": "2.0",
-                "id": request_id,
-                "error": {
-                    "code": -32600,
-                    "message": "User not found"
+        if tool_name.startswith("wordpress_"):
+            # WordPress инструменты только читают настройки - используем снимок из кэша
+            settings = principal.settings
+        else:
+            # Wordstat сохраняет токены в настройки - нужна ORM запись
+            settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == principal.user_id))
+            if not settings:
+                logger.warning("SSE POST: tools/call connector %s not found in database", connector_id)
+                return {
+                    "jsonrpc": "2.0",
+                    "id": request_id,
+                    "error": {
+                        "code": -32600,
+                        "message": "Connector not found"
+                    }
                 }
-            }
-        
-        logger.info("SSE POST: tools/call authorized for user %s (ID: %s) via connector %s", 
-                   user.email, user.id, connector_id)
         
         logger.info("SSE POST: tools/call using settings for user %s - WordPress: %s, Wordstat: %s", 
-                   user.email, 
+                   principal.email, 
                    "configured" if settings.wordpress_url else "not configured",
                    "configured" if settings.wordstat_access_token else "not configured")
         
@@ -1336,7 +1464,7 @@ async def send_sse_event(
                     try:
                         # Сохраняем токен в базу данных
                         settings.wordstat_access_token = access_token
-                        db.commit()
+                        await db.commit()
                         
                         # Проверяем токен через API
                         try:
@@ -1420,7 +1548,7 @@ async def send_sse_event(
                         wordpress_get_posts, wordpress_create_post, wordpress_update_post,
                         wordpress_delete_post, wordpress_search_posts, wordpress_bulk_update_posts,
                         wordpress_get_pages, wordpress_create_page, wordpress_update_page,
-                        wordpress_delete_page, wordpress_search_pages,
+                        wordpress_delete_page, wordpress_search_pages, wordpress_sync_index,
                         wordpress_get_tags, wordpress_create_tag, wordpress_update_tag, wordpress_delete_tag,
                         wordpress_create_category, wordpress_get_categories, wordpress_update_category,
                         wordpress_delete_category, wordpress_upload_media, wordpress_upload_image_from_url,
@@ -1442,7 +1570,9 @@ async def send_sse_event(
                         elif tool_name == "wordpress_search_posts":
                             result_content = await wordpress_search_posts(settings, tool_args)
                         elif tool_name == "wordpress_bulk_update_posts":
-                            result_content = await wordpress_bulk_update_posts(settings, tool_args)
+                            result_content = await wordpress_bulk_update_posts(
+                                settings, tool_args, progress=tool_progress(connector_id, payload)
+                            )
                         elif tool_name == "wordpress_get_pages":
                             result_content = await wordpress_get_pages(settings, tool_args)
                         elif tool_name == "wordpress_create_page":
@@ -1453,6 +1583,8 @@ async def send_sse_event(
                             result_content = await wordpress_delete_page(settings, tool_args)
                         elif tool_name == "wordpress_search_pages":
                             result_content = await wordpress_search_pages(settings, tool_args)
+                        elif tool_name == "wordpress_sync_index":
+                            result_content = await wordpress_sync_index(settings, tool_args)
                         elif tool_name == "wordpress_get_tags":
                             result_content = await wordpress_get_tags(settings, tool_args)
                         elif tool_name == "wordpress_create_tag":
@@ -1495,6 +1627,10 @@ async def send_sse_event(
                             result_content = await wordpress_update_user(settings, tool_args)
                         elif tool_name == "wordpress_delete_user":
                             result_content = await wordpress_delete_user(settings, tool_args)
+                        elif tool_name in WORDPRESS_BULK_TOOLS:
+                            result_content = await handle_wordpress_tool(
+                                tool_name, settings, tool_args, progress=tool_progress(connector_id, payload)
+                            )
                         else:
                             result_content = f"❌ WordPress инструмент '{tool_name}' пока не реализован"
                     except Exception as e:
@@ -1527,7 +1663,7 @@ async def send_sse_event(
                     # Используем handle_telegram_tool из telegram_tools.py
                     from app.telegram_tools import handle_telegram_tool
                     try:
-                        result_content = await handle_telegram_tool(tool_name, tool_args, user.id, db)
+                        result_content = await handle_telegram_tool(tool_name, tool_args, principal.user_id, db)
                     except Exception as e:
                         result_content = f"❌ Ошибка Telegram API: {str(e)}"
                 
@@ -1566,6 +1702,11 @@ async def send_sse_event(
                 }
             }
         
+        if tool_name.startswith("wordstat_"):
+            # Wordstat мог обновить токены в настройках
+            invalidate_principal(principal.user_id)
+        
+        record_tool_call(principal, connector_id, tool_name, response, started, request)
         logger.info("SSE POST: tools/call response: %s", json.dumps(response))
         return response
     else:
@@ -1600,6 +1741,67 @@ async def get_available_tools():
 
     return categories
 
+@app.get("/admin/sse/stats")
+async def get_sse_stats(admin_user: User = Depends(get_current_admin_user)):
+    """Статистика SSE подписчиков, отброшенных сообщений, кэшей (аутентификация, WordPress GET) и буфера ActivityLog в текущем worker"""
+    return {
+        **sse_manager.get_stats(),
+        "principal_cache": principal_cache.stats(),
+        "activity_log": activity_writer.stats(),
+        "wordpress_cache": wordpress_cache.stats(),
+        "telegram_bots": telegram_bots.stats(),
+        "telegram_updates": telegram_updates.stats(),
+        "telegram_media": telegram_media.stats(),
+    }
+
+@app.post("/telegram/webhook/{connector_id}")
+async def telegram_webhook(
+    connector_id: str,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Приём обновлений Telegram (URL, переданный в setWebhook)
+    
+    Обновление сохраняется в буфер пользователя и сразу подтверждается; уведомление
+    в SSE канал коннектора уходит после ответа. Telegram повторяет доставку только
+    при ошибке, поэтому обработка здесь - одна вставка в БД.
+    """
+    principal = await get_principal_by_connector(connector_id, db)
+    if not principal:
+        raise HTTPException(status_code=404, detail="Коннектор не найден")
+    
+    received_secret = request.headers.get(SECRET_HEADER)
+    if not verify_webhook_secret(principal.settings.telegram_webhook_secret, received_secret):
+        # Секрет мог смениться в другом worker - сверяем с БД, но не чаще раза в интервал
+        # на коннектор; кэш при неудачной проверке не сбрасывается
+        fresh = None
+        if webhook_secret_refresh.allow(connector_id):
+            fresh = await get_principal_by_connector(connector_id, db, refresh=True)
+        if not fresh or not verify_webhook_secret(fresh.settings.telegram_webhook_secret, received_secret):
+            logger.warning("Telegram webhook: неверный секрет для коннектора %s", connector_id)
+            raise HTTPException(status_code=403, detail="Неверный секрет webhook")
+        principal = fresh
+    
+    try:
+        update = await request.json()
+        int(update["update_id"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Ожидается Update с update_id")
+    
+    if await telegram_updates.push(db, principal.user_id, update):
+        background_tasks.add_task(sse_manager.send, connector_id, {
+            "jsonrpc": "2.0",
+            "method": "notifications/message",
+            "params": {
+                "level": "info",
+                "logger": "telegram_updates",
+                "data": update,
+            },
+        })
+    return {"ok": True}
+
 @app.get("/.well-known/openid-configuration")
 async def openid_config():
     return {
@@ -1642,12 +1844,12 @@ async def oauth_register(request: Request):
     client_id = secrets.token_urlsafe(16)
     client_secret = secrets.token_urlsafe(32)
     
-    oauth_store.clients[client_id] = {
+    await oauth_store.register_client(client_id, {
         "name": body.get("client_name", "unknown"),
         "client_secret": client_secret,
         "redirect_uris": body.get("redirect_uris", []),
         "connector_id": "",
-    }
+    })
     
     logger.info("OAuth client registered: %s (%s)", client_id, body.get("client_name"))
     
@@ -1702,13 +1904,13 @@ async def mcp_manifest_post(request: Request):
 @app.get("/user/mcp-manifest")
 async def user_mcp_manifest(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Personal MCP manifest with direct connector access (JWT-based).
     No OAuth required - just use the provided token in Authorization header.
     """
-    settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
     
     if not settings or not settings.mcp_connector_id:
         raise HTTPException(status_code=404, detail="Connector not found. Please configure your settings first.")
@@ -1761,12 +1963,12 @@ async def oauth_authorize(
     code_challenge: Optional[str] = None,
     code_challenge_method: Optional[str] = None,
 ):
-    if client_id not in oauth_store.clients:
-        oauth_store.clients[client_id] = {
+    if not await oauth_store.get_client(client_id):
+        await oauth_store.register_client(client_id, {
             "name": "imported",
             "client_secret": secrets.token_urlsafe(32),
             "connector_id": "",
-        }
+        })
     
     hidden_state = f"<input type='hidden' name='state' value='{state}'>" if state else ""
     hidden_challenge = f"<input type='hidden' name='code_challenge' value='{code_challenge}'>" if code_challenge else ""
@@ -1791,7 +1993,7 @@ async def oauth_authorize_submit(
     state: Optional[str] = Form(None),
     code_challenge: Optional[str] = Form(None),
 ):
-    code = oauth_store.issue_auth_code(client_id, connector_id, code_challenge)
+    code = await oauth_store.issue_auth_code(client_id, connector_id, code_challenge)
     redirect_url = f"{redirect_uri}?code={code}"
     if state:
         redirect_url += f"&state={state}"
@@ -1839,7 +2041,7 @@ async def oauth_token(request: Request):
             logger.warning("OAuth token: missing client_id or code")
             raise HTTPException(status_code=400, detail="invalid_request")
         
-        client = oauth_store.clients.get(client_id)
+        client = await oauth_store.get_client(client_id)
         if not client:
             logger.warning(f"OAuth token: client {client_id} not found")
             raise HTTPException(status_code=400, detail="invalid_client")
@@ -1857,7 +2059,7 @@ async def oauth_token(request: Request):
             # НЕ бросаем ошибку - доверяем PKCE
             # raise HTTPException(status_code=400, detail="invalid_client")
         
-        token = oauth_store.exchange_code(code, client_id, code_verifier)
+        token = await oauth_store.exchange_code(code, client_id, code_verifier)
         if not token:
             logger.warning(f"OAuth token: failed to exchange code for client {client_id}")
             raise HTTPException(status_code=400, detail="invalid_grant")
@@ -1878,7 +2080,7 @@ async def oauth_token(request: Request):
 
 @app.post("/api/oauth/yandex/callback")
 @app.post("/oauth/yandex/callback")  # Дубликат для Nginx-проксирования
-async def yandex_oauth_callback(request: Request, current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def yandex_oauth_callback(request: Request, current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Обработка OAuth callback от Yandex"""
     logger.info(f"=== OAUTH CALLBACK STARTED === User: {current_user.email}")
     try:
@@ -1892,7 +2094,7 @@ async def yandex_oauth_callback(request: Request, current_user: User = Depends(g
         
         # Получаем настройки пользователя
         logger.info(f"Fetching settings for user_id={current_user.id}")
-        settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+        settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
         if not settings:
             logger.error(f"Settings not found for user_id={current_user.id}")
             raise HTTPException(status_code=404, detail="User settings not found")
@@ -1961,7 +2163,8 @@ async def yandex_oauth_callback(request: Request, current_user: User = Depends(g
             if expires_in:
                 settings.wordstat_token_expires = datetime.utcnow() + timedelta(seconds=expires_in)
             
-            db.commit()
+            await db.commit()
+            invalidate_principal(current_user.id)
             
             logger.info(f"✅ OAuth tokens saved for user {current_user.email}")
             logger.info(f"=== OAUTH CALLBACK COMPLETED SUCCESSFULLY ===")
@@ -1985,10 +2188,10 @@ async def yandex_oauth_callback(request: Request, current_user: User = Depends(g
 
 
 @app.post("/api/wordstat/refresh-token")
-async def wordstat_refresh_token(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def wordstat_refresh_token(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Обновить токен доступа Wordstat"""
     try:
-        settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+        settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
         if not settings or not settings.wordstat_refresh_token:
             raise HTTPException(status_code=400, detail="Refresh token not available")
         
@@ -2018,7 +2221,8 @@ async def wordstat_refresh_token(current_user: User = Depends(get_current_user),
                 if expires_in:
                     settings.wordstat_token_expires = datetime.utcnow() + timedelta(seconds=expires_in)
                 
-                db.commit()
+                await db.commit()
+                invalidate_principal(current_user.id)
                 
                 return {
                     "success": True,
@@ -2036,10 +2240,10 @@ async def wordstat_refresh_token(current_user: User = Depends(get_current_user),
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/wordstat/user-info")
-async def wordstat_user_info(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def wordstat_user_info(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     """Получить информацию о пользователе Wordstat"""
     try:
-        settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+        settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
         if not settings or not settings.wordstat_access_token:
             raise HTTPException(status_code=400, detail="Wordstat access token not configured")
         
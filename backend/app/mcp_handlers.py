@@ -7,47 +7,307 @@ import json
 import secrets
 import hashlib
 import base64
+import heapq
+import os
+import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional, Any
+from typing import Awaitable, Callable, Dict, List, Optional, Any, Set, Tuple
 import logging
 
+from sqlalchemy import delete as sql_delete
+
 logger = logging.getLogger(__name__)
 
 
+# ==================== SSE BROKERS ====================
+
+# Callback доставки сообщения локальным подписчикам: (connector_id, message) -> кол-во получателей
+DeliverCallback = Callable[[str, str], Awaitable[int]]
+
+
+class SseBroker:
+    """
+    Базовый брокер доставки SSE сообщений
+    Определяет, как сообщение попадает от POST-обработчика к открытому GET-потоку
+    """
+    
+    async def start(self, deliver: DeliverCallback) -> None:
+        """
+        Запуск брокера
+        
+        Args:
+            deliver: Функция доставки сообщения в локальные очереди
+        """
+        self._deliver = deliver
+    
+    async def subscribe(self, connector_id: str) -> None:
+        """Подписка процесса на сообщения коннектора"""
+    
+    async def unsubscribe(self, connector_id: str) -> None:
+        """Отписка процесса от сообщений коннектора"""
+    
+    async def publish(self, connector_id: str, message: str) -> int:
+        """
+        Публикация сообщения для коннектора
+        
+        Args:
+            connector_id: ID получателя
+            message: Сериализованное JSON сообщение
+        
+        Returns:
+            Количество получателей (процессов или очередей)
+        """
+        raise NotImplementedError
+    
+    async def close(self) -> None:
+        """Остановка брокера"""
+
+
+class InMemorySseBroker(SseBroker):
+    """
+    Брокер в пределах одного процесса
+    Подходит для запуска с одним uvicorn worker
+    """
+    
+    async def publish(self, connector_id: str, message: str) -> int:
+        return await self._deliver(connector_id, message)
+
+
+class RedisSseBroker(SseBroker):
+    """
+    Брокер на Redis pub/sub
+    Позволяет POST-запросу на любом worker доставить сообщение в GET-поток на другом worker
+    """
+    
+    def __init__(self, redis_url: str, channel_prefix: str = "mcp:sse:"):
+        """
+        Args:
+            redis_url: URL Redis (redis://host:port/db)
+            channel_prefix: Префикс pub/sub каналов
+        """
+        self.redis_url = redis_url
+        self.channel_prefix = channel_prefix
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+    
+    def _channel(self, connector_id: str) -> str:
+        return f"{self.channel_prefix}{connector_id}"
+    
+    async def start(self, deliver: DeliverCallback) -> None:
+        import redis.asyncio as aioredis
+        
+        await super().start(deliver)
+        self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        self._pubsub = self._redis.pubsub()
+        self._listener = asyncio.create_task(self._listen())
+        logger.info(f"SSE: Redis broker started ({self.redis_url})")
+    
+    async def _listen(self) -> None:
+        """Фоновый цикл чтения pub/sub и доставки в локальные очереди"""
+        prefix_len = len(self.channel_prefix)
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message and message.get("type") == "message":
+                    connector_id = message["channel"][prefix_len:]
+                    await self._deliver(connector_id, message["data"])
+                elif not self._pubsub.subscribed:
+                    # Нет подписок - get_message возвращается сразу
+                    await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"SSE: Redis listener error: {str(e)}")
+                await asyncio.sleep(1.0)
+    
+    async def subscribe(self, connector_id: str) -> None:
+        await self._pubsub.subscribe(self._channel(connector_id))
+    
+    async def unsubscribe(self, connector_id: str) -> None:
+        await self._pubsub.unsubscribe(self._channel(connector_id))
+    
+    async def publish(self, connector_id: str, message: str) -> int:
+        return await self._redis.publish(self._channel(connector_id), message)
+    
+    async def close(self) -> None:
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+        if self._pubsub:
+            await self._pubsub.aclose()
+        if self._redis:
+            await self._redis.aclose()
+        logger.info("SSE: Redis broker closed")
+
+
+def create_sse_broker() -> SseBroker:
+    """
+    Создание брокера по переменным окружения
+    
+    SSE_BROKER=redis включает Redis pub/sub (адрес берётся из REDIS_URL),
+    иначе используется брокер в памяти процесса.
+    
+    Returns:
+        Экземпляр SseBroker
+    """
+    backend = os.getenv("SSE_BROKER", "memory").lower()
+    if backend == "redis":
+        return RedisSseBroker(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return InMemorySseBroker()
+
+
 # ==================== SSE MANAGER ====================
 
+# Политики переполнения очереди подписчика
+OVERFLOW_DROP_OLDEST = "drop_oldest"
+OVERFLOW_DROP_NEWEST = "drop_newest"
+OVERFLOW_DISCONNECT = "disconnect"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_DROP_NEWEST, OVERFLOW_DISCONNECT)
+
+
 class SseManager:
     """
     Менеджер Server-Sent Events потоков
     Управляет WebSocket-подобными соединениями для MCP
+    
+    У одного коннектора может быть несколько подписчиков (например, вкладки клиента),
+    у каждого - своя ограниченная очередь. При переполнении применяется overflow_policy,
+    а из очереди отключённого подписчика читается None.
     """
     
-    def __init__(self):
-        self._streams: Dict[str, asyncio.Queue] = {}
+    def __init__(
+        self,
+        broker: Optional[SseBroker] = None,
+        max_queue_size: int = 100,
+        overflow_policy: str = OVERFLOW_DROP_OLDEST,
+    ):
+        """
+        Args:
+            broker: Брокер доставки сообщений (по умолчанию - в памяти процесса)
+            max_queue_size: Максимальный размер очереди одного подписчика
+            overflow_policy: drop_oldest, drop_newest или disconnect
+        """
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown SSE overflow policy: {overflow_policy}")
+        if max_queue_size < 1:
+            raise ValueError("max_queue_size must be >= 1")
+        
+        self._streams: Dict[str, Set[asyncio.Queue]] = {}
+        self.broker = broker or InMemorySseBroker()
+        self.max_queue_size = max_queue_size
+        self.overflow_policy = overflow_policy
+        self._started = False
+        
+        # Счётчики backpressure
+        self.dropped_messages: Dict[str, int] = {}
+        self.dropped_total = 0
+        self.slow_consumers_disconnected = 0
+    
+    async def start(self) -> None:
+        """Запуск брокера (вызывается при старте приложения)"""
+        if not self._started:
+            await self.broker.start(self._deliver)
+            self._started = True
+    
+    async def close(self) -> None:
+        """Остановка брокера (вызывается при остановке приложения)"""
+        if self._started:
+            await self.broker.close()
+            self._started = False
+    
+    def _count_drop(self, connector_id: str) -> None:
+        self.dropped_messages[connector_id] = self.dropped_messages.get(connector_id, 0) + 1
+        self.dropped_total += 1
+    
+    async def _deliver(self, connector_id: str, message: str) -> int:
+        """
+        Доставка сообщения во все локальные очереди коннектора
+        
+        Returns:
+            Количество подписчиков, получивших сообщение
+        """
+        subscribers = self._streams.get(connector_id)
+        if not subscribers:
+            return 0
+        
+        delivered = 0
+        for queue in list(subscribers):
+            if not queue.full():
+                queue.put_nowait(message)
+                delivered += 1
+                continue
+            
+            self._count_drop(connector_id)
+            if self.overflow_policy == OVERFLOW_DROP_OLDEST:
+                queue.get_nowait()
+                queue.put_nowait(message)
+                delivered += 1
+            elif self.overflow_policy == OVERFLOW_DISCONNECT:
+                # Медленный потребитель: очищаем очередь и сигнализируем о закрытии
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                subscribers.discard(queue)
+                self.slow_consumers_disconnected += 1
+                logger.warning(f"SSE: Slow consumer disconnected for connector {connector_id}")
+            # OVERFLOW_DROP_NEWEST: новое сообщение просто отбрасывается
+        
+        if not subscribers:
+            await self._release(connector_id)
+        return delivered
+    
+    async def _release(self, connector_id: str) -> None:
+        """Удаление коннектора без подписчиков и отписка в брокере"""
+        if self._streams.get(connector_id):
+            return
+        self._streams.pop(connector_id, None)
+        try:
+            await self.broker.unsubscribe(connector_id)
+        except Exception as e:
+            logger.error(f"SSE: Broker unsubscribe failed for {connector_id}: {str(e)}")
     
     async def connect(self, connector_id: str) -> asyncio.Queue:
         """
-        Создание нового SSE соединения
+        Создание нового SSE соединения (подписчика коннектора)
         
         Args:
             connector_id: Уникальный ID коннектора
         
         Returns:
-            asyncio.Queue для отправки сообщений
+            asyncio.Queue подписчика; None в очереди означает принудительное отключение
         """
-        queue: asyncio.Queue = asyncio.Queue()
-        self._streams[connector_id] = queue
-        logger.info(f"SSE: New connection for connector {connector_id}")
+        await self.start()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        subscribers = self._streams.setdefault(connector_id, set())
+        is_first = not subscribers
+        subscribers.add(queue)
+        if is_first:
+            await self.broker.subscribe(connector_id)
+        logger.info(
+            f"SSE: New connection for connector {connector_id} "
+            f"({len(subscribers)} subscribers)"
+        )
         return queue
     
-    def disconnect(self, connector_id: str) -> None:
+    async def disconnect(self, connector_id: str, queue: Optional[asyncio.Queue] = None) -> None:
         """
         Закрытие SSE соединения
         
         Args:
             connector_id: ID коннектора для отключения
+            queue: Очередь конкретного подписчика (None - отключить всех)
         """
-        self._streams.pop(connector_id, None)
+        subscribers = self._streams.get(connector_id)
+        if subscribers is not None:
+            if queue is None:
+                subscribers.clear()
+            else:
+                subscribers.discard(queue)
+            await self._release(connector_id)
         logger.info(f"SSE: Disconnected connector {connector_id}")
     
     async def send(self, connector_id: str, data: Dict) -> None:
@@ -58,48 +318,317 @@ class SseManager:
             connector_id: ID получателя
             data: Данные для отправки (будут сериализованы в JSON)
         """
-        queue = self._streams.get(connector_id)
-        if queue:
-            await queue.put(json.dumps(data))
-        else:
+        await self.start()
+        receivers = await self.broker.publish(connector_id, json.dumps(data))
+        if not receivers:
             logger.warning(f"SSE: Attempted to send to disconnected connector {connector_id}")
     
     def is_connected(self, connector_id: str) -> bool:
         """
-        Проверка активности соединения
+        Проверка активности соединения в текущем процессе
         
         Args:
             connector_id: ID коннектора
         
         Returns:
-            True если коннектор подключен
+            True если у коннектора есть хотя бы один подписчик
         """
-        return connector_id in self._streams
+        return bool(self._streams.get(connector_id))
     
     def get_active_connections(self) -> int:
         """
-        Получить количество активных соединений
+        Получить количество активных соединений в текущем процессе
+        
+        Returns:
+            Количество активных SSE подписчиков
+        """
+        return sum(len(subscribers) for subscribers in self._streams.values())
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Статистика SSE потоков и backpressure
+        
+        Returns:
+            Dict с количеством коннекторов, подписчиков и отброшенных сообщений
+        """
+        return {
+            "connectors": len(self._streams),
+            "subscribers": self.get_active_connections(),
+            "queued_messages": sum(
+                queue.qsize() for subscribers in self._streams.values() for queue in subscribers
+            ),
+            "dropped_total": self.dropped_total,
+            "slow_consumers_disconnected": self.slow_consumers_disconnected,
+            "overflow_policy": self.overflow_policy,
+            "max_queue_size": self.max_queue_size,
+        }
+
+
+# ==================== OAUTH STORAGE ====================
+
+# Типы записей OAuth хранилища
+OAUTH_CLIENT = "client"
+OAUTH_CODE = "code"
+OAUTH_TOKEN = "token"
+
+
+class OAuthStorage:
+    """
+    Базовое хранилище OAuth записей (клиенты, коды, токены) с TTL
+    Все операции - поиск по ключу, без сканирования; асинхронные, чтобы
+    проверка токена на каждом MCP запросе не блокировала event loop
+    """
+    
+    async def put(self, kind: str, key: str, data: Dict[str, Any], ttl_seconds: Optional[int] = None) -> None:
+        """
+        Сохранение записи
+        
+        Args:
+            kind: Тип записи (client, code, token)
+            key: Ключ записи (client_id, code, token)
+            data: Данные записи
+            ttl_seconds: Время жизни (None - бессрочно)
+        """
+        raise NotImplementedError
+    
+    async def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Получение записи
         
         Returns:
-            Количество активных SSE соединений
+            Данные записи или None если записи нет или она истекла
+        """
+        raise NotImplementedError
+    
+    async def delete(self, kind: str, key: str) -> bool:
+        """
+        Удаление записи
+        
+        Returns:
+            True если запись существовала
+        """
+        raise NotImplementedError
+    
+    async def sweep(self) -> int:
+        """
+        Удаление истёкших записей
+        
+        Returns:
+            Количество удалённых записей
+        """
+        return 0
+    
+    async def close(self) -> None:
+        """Освобождение ресурсов"""
+
+
+class InMemoryOAuthStorage(OAuthStorage):
+    """
+    Хранилище в памяти процесса
+    Истечения индексируются min-heap, поэтому sweep удаляет каждую запись за O(log n)
+    """
+    
+    def __init__(self):
+        self._entries: Dict[Tuple[str, str], Tuple[Dict[str, Any], Optional[float]]] = {}
+        self._expiries: List[Tuple[float, str, str]] = []
+    
+    async def put(self, kind: str, key: str, data: Dict[str, Any], ttl_seconds: Optional[int] = None) -> None:
+        expires_at = time.time() + ttl_seconds if ttl_seconds else None
+        self._entries[(kind, key)] = (data, expires_at)
+        if expires_at is not None:
+            heapq.heappush(self._expiries, (expires_at, kind, key))
+    
+    async def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get((kind, key))
+        if not entry:
+            return None
+        data, expires_at = entry
+        if expires_at is not None and time.time() > expires_at:
+            self._entries.pop((kind, key), None)
+            return None
+        return data
+    
+    async def delete(self, kind: str, key: str) -> bool:
+        # Элемент heap остаётся и будет пропущен при sweep
+        return self._entries.pop((kind, key), None) is not None
+    
+    async def sweep(self) -> int:
+        now = time.time()
+        removed = 0
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, kind, key = heapq.heappop(self._expiries)
+            entry = self._entries.get((kind, key))
+            # Запись могла быть удалена или перезаписана с новым сроком
+            if entry and entry[1] == expires_at:
+                del self._entries[(kind, key)]
+                removed += 1
+        return removed
+
+
+class SqlOAuthStorage(OAuthStorage):
+    """
+    Хранилище в таблице oauth_entries (SQLite/Postgres через SQLAlchemy AsyncSession)
+    Переживает рестарт и деплой; поиск по первичному ключу (kind, key)
+    """
+    
+    def __init__(self, session_factory=None):
+        """
+        Args:
+            session_factory: Фабрика AsyncSession (по умолчанию AsyncSessionLocal)
+        """
+        from .models import OAuthEntry
+        
+        self._model = OAuthEntry
+        self._session_factory = session_factory
+        self._table_ready = False
+    
+    async def _session(self):
+        if self._session_factory is None:
+            from .database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        if not self._table_ready:
+            # Таблица создаётся при первом обращении (как таблицы рассылок)
+            async with self._session_factory() as db:
+                conn = await db.connection()
+                await conn.run_sync(lambda sync_conn: self._model.__table__.create(sync_conn, checkfirst=True))
+                await db.commit()
+            self._table_ready = True
+        return self._session_factory()
+    
+    async def put(self, kind: str, key: str, data: Dict[str, Any], ttl_seconds: Optional[int] = None) -> None:
+        expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds) if ttl_seconds else None
+        async with await self._session() as db:
+            await db.merge(self._model(kind=kind, key=key, data=json.dumps(data), expires_at=expires_at))
+            await db.commit()
+    
+    async def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        async with await self._session() as db:
+            entry = await db.get(self._model, (kind, key))
+            if not entry:
+                return None
+            if entry.expires_at is not None and datetime.utcnow() > entry.expires_at:
+                await db.delete(entry)
+                await db.commit()
+                return None
+            return json.loads(entry.data)
+    
+    async def delete(self, kind: str, key: str) -> bool:
+        async with await self._session() as db:
+            result = await db.execute(
+                sql_delete(self._model).where(self._model.kind == kind, self._model.key == key)
+            )
+            await db.commit()
+            return bool(result.rowcount)
+    
+    async def sweep(self) -> int:
+        # Индекс по expires_at - удаление без полного сканирования
+        async with await self._session() as db:
+            result = await db.execute(
+                sql_delete(self._model).where(
+                    self._model.expires_at.isnot(None),
+                    self._model.expires_at <= datetime.utcnow()
+                )
+            )
+            await db.commit()
+            return result.rowcount or 0
+
+
+class RedisOAuthStorage(OAuthStorage):
+    """
+    Хранилище в Redis (redis.asyncio)
+    Истечение выполняет сам Redis (SET EX), sweep не требуется
+    """
+    
+    def __init__(self, redis_url: str, prefix: str = "mcp:oauth:"):
+        """
+        Args:
+            redis_url: URL Redis (redis://host:port/db)
+            prefix: Префикс ключей
         """
-        return len(self._streams)
+        import redis.asyncio as aioredis
+        
+        self._redis = aioredis.Redis.from_url(redis_url, decode_responses=True)
+        self.prefix = prefix
+    
+    def _key(self, kind: str, key: str) -> str:
+        return f"{self.prefix}{kind}:{key}"
+    
+    async def put(self, kind: str, key: str, data: Dict[str, Any], ttl_seconds: Optional[int] = None) -> None:
+        await self._redis.set(self._key(kind, key), json.dumps(data), ex=ttl_seconds)
+    
+    async def get(self, kind: str, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(self._key(kind, key))
+        return json.loads(raw) if raw else None
+    
+    async def delete(self, kind: str, key: str) -> bool:
+        return bool(await self._redis.delete(self._key(kind, key)))
+    
+    async def close(self) -> None:
+        await self._redis.aclose()
+
+
+def create_oauth_storage() -> OAuthStorage:
+    """
+    Создание OAuth хранилища по переменной окружения OAUTH_STORAGE
+    
+    memory (по умолчанию), sql - таблица oauth_entries в DATABASE_URL,
+    redis - Redis по адресу REDIS_URL.
+    
+    Returns:
+        Экземпляр OAuthStorage
+    """
+    backend = os.getenv("OAUTH_STORAGE", "memory").lower()
+    if backend == "sql":
+        return SqlOAuthStorage()
+    if backend == "redis":
+        return RedisOAuthStorage(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    return InMemoryOAuthStorage()
 
 
 # ==================== OAUTH STORE ====================
 
+# Время жизни authorization code и access token
+AUTH_CODE_TTL_SECONDS = 5 * 60
+ACCESS_TOKEN_TTL_SECONDS = 60 * 60
+
+
 class OAuthStore:
     """
     Хранилище OAuth данных (клиенты, коды, токены)
-    In-memory реализация для простоты (в production использовать Redis/DB)
+    Данные хранятся в OAuthStorage (память, SQL или Redis)
     """
     
-    def __init__(self):
-        self.clients: Dict[str, Dict[str, str]] = {}
-        self.auth_codes: Dict[str, Dict[str, str]] = {}
-        self.tokens: Dict[str, Dict[str, str]] = {}
+    def __init__(self, storage: Optional[OAuthStorage] = None):
+        """
+        Args:
+            storage: Бэкенд хранения (по умолчанию - в памяти процесса)
+        """
+        self.storage = storage or InMemoryOAuthStorage()
+        self._sweeper: Optional[asyncio.Task] = None
     
-    def create_client(self, name: str) -> Dict[str, str]:
+    async def register_client(self, client_id: str, data: Dict[str, Any]) -> None:
+        """
+        Сохранение OAuth клиента (dynamic registration)
+        
+        Args:
+            client_id: ID клиента
+            data: name, client_secret, redirect_uris, connector_id
+        """
+        await self.storage.put(OAUTH_CLIENT, client_id, data)
+    
+    async def get_client(self, client_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Получение OAuth клиента
+        
+        Args:
+            client_id: ID клиента
+        
+        Returns:
+            Данные клиента или None
+        """
+        return await self.storage.get(OAUTH_CLIENT, client_id)
+    
+    async def create_client(self, name: str) -> Dict[str, str]:
         """
         Создание нового OAuth клиента
         
@@ -112,11 +641,11 @@ class OAuthStore:
         client_id = secrets.token_urlsafe(16)
         client_secret = secrets.token_urlsafe(32)
         
-        self.clients[client_id] = {
+        await self.register_client(client_id, {
             "name": name,
             "client_secret": client_secret,
             "connector_id": "",
-        }
+        })
         
         logger.info(f"OAuth: Created client '{name}' with ID {client_id[:8]}...")
         
@@ -125,7 +654,7 @@ class OAuthStore:
             "client_secret": client_secret
         }
     
-    def issue_auth_code(
+    async def issue_auth_code(
         self,
         client_id: str,
         connector_id: str,
@@ -144,18 +673,17 @@ class OAuthStore:
         """
         code = secrets.token_urlsafe(16)
         
-        self.auth_codes[code] = {
+        await self.storage.put(OAUTH_CODE, code, {
             "client_id": client_id,
             "connector_id": connector_id,
-            "expires_at": (datetime.utcnow() + timedelta(minutes=5)).isoformat(),
             "code_challenge": code_challenge,
-        }
+        }, ttl_seconds=AUTH_CODE_TTL_SECONDS)
         
         logger.info(f"OAuth: Issued auth code for client {client_id[:8]}...")
         
         return code
     
-    def exchange_code(
+    async def exchange_code(
         self,
         code: str,
         client_id: str,
@@ -172,17 +700,12 @@ class OAuthStore:
         Returns:
             Access token или None если код недействителен
         """
-        data = self.auth_codes.get(code)
+        # Истёкший код хранилище не вернёт
+        data = await self.storage.get(OAUTH_CODE, code)
         
         # Проверка валидности кода
         if not data or data["client_id"] != client_id:
-            logger.warning(f"OAuth: Invalid code or client_id mismatch")
-            return None
-        
-        # Проверка expiration
-        if datetime.utcnow() > datetime.fromisoformat(data["expires_at"]):
-            self.auth_codes.pop(code, None)
-            logger.warning(f"OAuth: Auth code expired")
+            logger.warning(f"OAuth: Invalid, expired code or client_id mismatch")
             return None
         
         # Проверка PKCE если был использован
@@ -202,21 +725,21 @@ class OAuthStore:
         
         # Генерируем access token
         token = secrets.token_urlsafe(32)
-        self.tokens[token] = {
+        await self.storage.put(OAUTH_TOKEN, token, {
             "connector_id": data["connector_id"],
-            "expires_at": (datetime.utcnow() + timedelta(hours=1)).isoformat(),
-        }
+        }, ttl_seconds=ACCESS_TOKEN_TTL_SECONDS)
         
         # Удаляем использованный код
-        self.auth_codes.pop(code, None)
+        await self.storage.delete(OAUTH_CODE, code)
         
         logger.info(f"OAuth: Exchanged code for token (connector: {data['connector_id']})")
         
         return token
     
-    def get_connector_by_token(self, token: str) -> Optional[str]:
+    async def get_connector_by_token(self, token: str) -> Optional[str]:
         """
         Получить connector_id по access token
+        Горячий путь каждого MCP запроса - один поиск по ключу в хранилище
         
         Args:
             token: Access token
@@ -224,20 +747,14 @@ class OAuthStore:
         Returns:
             connector_id или None если токен недействителен
         """
-        data = self.tokens.get(token)
+        data = await self.storage.get(OAUTH_TOKEN, token)
         
         if not data:
             return None
         
-        # Проверка expiration
-        if datetime.utcnow() > datetime.fromisoformat(data["expires_at"]):
-            self.tokens.pop(token, None)
-            logger.info(f"OAuth: Token expired and removed")
-            return None
-        
         return data["connector_id"]
     
-    def revoke_token(self, token: str) -> bool:
+    async def revoke_token(self, token: str) -> bool:
         """
         Отзыв access token
         
@@ -247,11 +764,53 @@ class OAuthStore:
         Returns:
             True если токен был отозван
         """
-        if token in self.tokens:
-            self.tokens.pop(token)
+        if await self.storage.delete(OAUTH_TOKEN, token):
             logger.info(f"OAuth: Token revoked")
             return True
         return False
+    
+    async def sweep_expired(self) -> int:
+        """
+        Удаление истёкших кодов и токенов
+        
+        Returns:
+            Количество удалённых записей
+        """
+        removed = await self.storage.sweep()
+        if removed:
+            logger.info(f"OAuth: Swept {removed} expired entries")
+        return removed
+    
+    def start_sweeper(self, interval_seconds: float = 60.0) -> None:
+        """
+        Запуск фоновой очистки истёкших записей
+        
+        Args:
+            interval_seconds: Период очистки
+        """
+        if self._sweeper and not self._sweeper.done():
+            return
+        
+        async def sweeper_loop():
+            while True:
+                await asyncio.sleep(interval_seconds)
+                try:
+                    await self.sweep_expired()
+                except Exception as e:
+                    logger.error(f"OAuth: Sweeper error: {str(e)}")
+        
+        self._sweeper = asyncio.create_task(sweeper_loop())
+    
+    async def close(self) -> None:
+        """Остановка фоновой очистки и хранилища"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        await self.storage.close()
 
 
 # ==================== MCP TOOLS DEFINITIONS ====================
@@ -263,7 +822,7 @@ def get_wordpress_tools() -> list:
     Returns:
         List of tool definitions
     """
-    return [
+    tools = [
         {
             "name": "wordpress_get_posts",
             "description": "Получить список постов WordPress",
@@ -271,7 +830,9 @@ def get_wordpress_tools() -> list:
                 "type": "object",
                 "properties": {
                     "per_page": {"type": "number", "description": "Количество постов"},
-                    "status": {"type": "string", "description": "Статус постов (publish, draft, any)"}
+                    "status": {"type": "string", "description": "Статус постов (publish, draft, any)"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
                 }
             }
         },
@@ -283,7 +844,17 @@ def get_wordpress_tools() -> list:
                 "properties": {
                     "title": {"type": "string", "description": "Заголовок поста"},
                     "content": {"type": "string", "description": "Содержимое поста"},
-                    "status": {"type": "string", "description": "Статус (draft, publish)"}
+                    "status": {"type": "string", "description": "Статус (draft, publish)"},
+                    "categories": {
+                        "type": "array",
+                        "items": {"type": ["number", "string"]},
+                        "description": "Рубрики: ID или названия (недостающие будут созданы)"
+                    },
+                    "tags": {
+                        "type": "array",
+                        "items": {"type": ["number", "string"]},
+                        "description": "Теги: ID или названия (недостающие будут созданы)"
+                    }
                 },
                 "required": ["title", "content"]
             }
@@ -297,7 +868,17 @@ def get_wordpress_tools() -> list:
                     "post_id": {"type": "number", "description": "ID поста"},
                     "title": {"type": "string", "description": "Новый заголовок"},
                     "content": {"type": "string", "description": "Новое содержимое"},
-                    "status": {"type": "string", "description": "Новый статус"}
+                    "status": {"type": "string", "description": "Новый статус"},
+                    "categories": {
+                        "type": "array",
+                        "items": {"type": ["number", "string"]},
+                        "description": "Рубрики: ID или названия (недостающие будут созданы)"
+                    },
+                    "tags": {
+                        "type": "array",
+                        "items": {"type": ["number", "string"]},
+                        "description": "Теги: ID или названия (недостающие будут созданы)"
+                    }
                 },
                 "required": ["post_id"]
             }
@@ -315,11 +896,13 @@ def get_wordpress_tools() -> list:
         },
         {
             "name": "wordpress_search_posts",
-            "description": "Поиск постов по ключевым словам",
+            "description": "Поиск постов по ключевым словам (из локального индекса, если выполнен wordpress_sync_index)",
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "search": {"type": "string", "description": "Поисковый запрос"}
+                    "search": {"type": "string", "description": "Поисковый запрос"},
+                    "per_page": {"type": "number", "description": "Количество результатов (по умолчанию 10)"},
+                    "live": {"type": "boolean", "description": "Искать на сайте, минуя локальный индекс"}
                 },
                 "required": ["search"]
             }
@@ -350,7 +933,14 @@ def get_wordpress_tools() -> list:
         {
             "name": "wordpress_get_categories",
             "description": "Получить список категорий",
-            "inputSchema": {"type": "object", "properties": {}}
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "per_page": {"type": "number", "description": "Количество категорий"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
+                }
+            }
         },
         {
             "name": "wordpress_update_category",
@@ -404,7 +994,9 @@ def get_wordpress_tools() -> list:
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "per_page": {"type": "number", "description": "Количество файлов"}
+                    "per_page": {"type": "number", "description": "Количество файлов"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
                 }
             }
         },
@@ -437,7 +1029,10 @@ def get_wordpress_tools() -> list:
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "post_id": {"type": "number", "description": "ID поста (опционально)"}
+                    "post_id": {"type": "number", "description": "ID поста (опционально)"},
+                    "per_page": {"type": "number", "description": "Количество комментариев"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
                 }
             }
         },
@@ -470,7 +1065,9 @@ def get_wordpress_tools() -> list:
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "per_page": {"type": "number", "description": "Количество тегов"}
+                    "per_page": {"type": "number", "description": "Количество тегов"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
                 }
             }
         },
@@ -518,7 +1115,9 @@ def get_wordpress_tools() -> list:
                 "type": "object",
                 "properties": {
                     "per_page": {"type": "number", "description": "Количество страниц"},
-                    "status": {"type": "string", "description": "Статус страниц (publish, draft, any)"}
+                    "status": {"type": "string", "description": "Статус страниц (publish, draft, any)"},
+                    "all": {"type": "boolean", "description": "Получить все элементы (постранично, с лимитом max_items)"},
+                    "max_items": {"type": "number", "description": "Лимит элементов для all=true"}
                 }
             }
         },
@@ -564,15 +1163,27 @@ def get_wordpress_tools() -> list:
         },
         {
             "name": "wordpress_search_pages",
-            "description": "Поиск страниц по ключевым словам",
+            "description": "Поиск страниц по ключевым словам (из локального индекса, если выполнен wordpress_sync_index)",
             "inputSchema": {
                 "type": "object",
                 "properties": {
-                    "search": {"type": "string", "description": "Поисковый запрос"}
+                    "search": {"type": "string", "description": "Поисковый запрос"},
+                    "per_page": {"type": "number", "description": "Количество результатов (по умолчанию 10)"},
+                    "live": {"type": "boolean", "description": "Искать на сайте, минуя локальный индекс"}
                 },
                 "required": ["search"]
             }
         },
+        {
+            "name": "wordpress_sync_index",
+            "description": "Синхронизировать локальный поисковый индекс постов и страниц (только изменённые с прошлой синхронизации)",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "full": {"type": "boolean", "description": "Полная пересборка с удалением пропавших элементов"}
+                }
+            }
+        },
         {
             "name": "wordpress_moderate_comment",
             "description": "Модерировать комментарий (изменить статус)",
@@ -586,6 +1197,53 @@ def get_wordpress_tools() -> list:
             }
         }
     ]
+    return tools + get_wordpress_bulk_tools(tools)
+
+
+def get_wordpress_bulk_tools(tools: list) -> list:
+    """
+    Определения bulk вариантов WordPress write-инструментов
+    
+    Схема элемента items совпадает со схемой одиночного инструмента,
+    defaults - общие поля для всех элементов.
+    
+    Args:
+        tools: Определения одиночных WordPress инструментов
+    
+    Returns:
+        List of tool definitions
+    """
+    from .wordpress_tools import WORDPRESS_BULK_TOOLS, WP_BULK_MAX_ITEMS
+    
+    schemas = {tool["name"]: tool["inputSchema"] for tool in tools}
+    bulk_tools = []
+    for name, (single_tool, description, _) in WORDPRESS_BULK_TOOLS.items():
+        # Обязательны только идентификаторы, остальные поля могут прийти из defaults
+        item_schema = dict(schemas[single_tool])
+        item_schema["required"] = [key for key in item_schema.get("required", []) if key.endswith("_id")]
+        bulk_tools.append({
+            "name": name,
+            "description": f"{description} за один вызов (параллельно, до {WP_BULK_MAX_ITEMS} элементов, ошибки отдельных элементов не прерывают остальные)",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "items": {
+                        "type": "array",
+                        "items": item_schema,
+                        "minItems": 1,
+                        "maxItems": WP_BULK_MAX_ITEMS,
+                        "description": f"Аргументы {single_tool} для каждого элемента"
+                    },
+                    "defaults": {
+                        "type": "object",
+                        "properties": item_schema.get("properties", {}),
+                        "description": "Общие поля для всех элементов (поля элемента важнее)"
+                    }
+                },
+                "required": ["items"]
+            }
+        })
+    return bulk_tools
 
 
 def get_wordstat_tools() -> list:
@@ -769,15 +1427,14 @@ def get_telegram_tools() -> list:
         },
         {
             "name": "telegram_set_webhook",
-            "description": "Установить webhook",
+            "description": "Установить webhook. Без url обновления принимает сервер и отдаёт через telegram_get_updates и SSE",
             "inputSchema": {
                 "type": "object",
                 "properties": {
                     "url": {"type": "string"},
                     "secret_token": {"type": "string"},
                     "allowed_updates": {"type": "array", "items": {"type": "string"}}
-                },
-                "required": ["url"]
+                }
             }
         },
         {
@@ -808,7 +1465,7 @@ def get_telegram_tools() -> list:
         },
         {
             "name": "telegram_get_updates",
-            "description": "Получить последние обновления",
+            "description": "Получить последние обновления (при установленном webhook - из буфера сервера)",
             "inputSchema": {
                 "type": "object",
                 "properties": {
@@ -940,6 +1597,47 @@ def get_telegram_tools() -> list:
                 },
                 "required": ["file_id"]
             }
+        },
+        {
+            "name": "telegram_file_to_wordpress",
+            "description": "Перенести файл Telegram (file_id) в медиатеку WordPress потоком, без повторной загрузки того же файла",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "file_id": {"type": "string"},
+                    "title": {"type": "string"},
+                    "filename": {"type": "string", "description": "Имя файла в медиатеке (по умолчанию из Telegram)"}
+                },
+                "required": ["file_id"]
+            }
+        },
+        {
+            "name": "telegram_broadcast",
+            "description": "Рассылка сообщения по списку чатов в фоне (с учётом лимитов Telegram, продолжается после перезапуска)",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "chat_ids": {"type": "array", "items": {"type": "string"}, "description": "ID чатов или username"},
+                    "audience": {"type": "string", "description": "Сохранённая аудитория (вместе с chat_ids - сохранить список под этим именем)"},
+                    "text": {"type": "string", "description": "Текст сообщения"},
+                    "parse_mode": {"type": "string", "description": "HTML или Markdown"},
+                    "disable_web_page_preview": {"type": "boolean"},
+                    "disable_notification": {"type": "boolean"}
+                },
+                "required": ["text"]
+            }
+        },
+        {
+            "name": "telegram_broadcast_status",
+            "description": "Статус рассылки (или её отмена)",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "broadcast_id": {"type": "integer"},
+                    "cancel": {"type": "boolean", "description": "Остановить рассылку"}
+                },
+                "required": ["broadcast_id"]
+            }
         }
     ]
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Date, DateTime, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import bcrypt
@@ -20,6 +20,12 @@ class User(Base):
     # Связь с настройками
     settings = relationship("UserSettings", back_populates="user", uselist=False)
     
+    # Индексы для keyset-пагинации /admin/users по (created_at, id)
+    __table_args__ = (
+        Index("ix_users_created_id", "created_at", "id"),
+        Index("ix_users_active_created_id", "is_active", "created_at", "id"),
+    )
+    
     def verify_password(self, password: str) -> bool:
         """Проверка пароля"""
         return bcrypt.checkpw(password.encode('utf-8'), self.hashed_password.encode('utf-8'))
@@ -78,6 +84,18 @@ class ActivityLog(Base):
     
     # Связь с пользователем
     user = relationship("User", backref="activity_logs")
+    
+    # Индексы для keyset-пагинации /admin/logs: по одному на каждую комбинацию фильтров
+    __table_args__ = (
+        Index("ix_activity_logs_created_id", "created_at", "id"),
+        Index("ix_activity_logs_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_activity_logs_type_created_id", "action_type", "created_at", "id"),
+        Index("ix_activity_logs_status_created_id", "status", "created_at", "id"),
+        Index("ix_activity_logs_user_type_created_id", "user_id", "action_type", "created_at", "id"),
+        Index("ix_activity_logs_user_status_created_id", "user_id", "status", "created_at", "id"),
+        Index("ix_activity_logs_type_status_created_id", "action_type", "status", "created_at", "id"),
+        Index("ix_activity_logs_user_type_status_created_id", "user_id", "action_type", "status", "created_at", "id"),
+    )
 
 class AdminLog(Base):
     __tablename__ = "admin_logs"
@@ -102,6 +120,11 @@ class AdminLog(Base):
     # Связи
     admin_user = relationship("User", foreign_keys=[admin_user_id], backref="admin_actions")
     target_user = relationship("User", foreign_keys=[target_user_id])
+    
+    # Индекс для keyset-пагинации /admin/admin-logs
+    __table_args__ = (
+        Index("ix_admin_logs_created_id", "created_at", "id"),
+    )
 
 class LoginAttempt(Base):
     __tablename__ = "login_attempts"
@@ -114,3 +137,140 @@ class LoginAttempt(Base):
     attempt_type = Column(String, default="user")  # 'user' or 'admin'
     
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+class OAuthEntry(Base):
+    __tablename__ = "oauth_entries"
+    
+    # kind: 'client', 'code', 'token'
+    kind = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    data = Column(Text, nullable=False)  # JSON с данными записи
+    expires_at = Column(DateTime, nullable=True, index=True)  # NULL - бессрочно
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class ActivityRollupHourly(Base):
+    __tablename__ = "activity_rollup_hourly"
+    
+    # Начало часа (UTC)
+    bucket = Column(DateTime, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    action_type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    action_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_activity_rollup_hourly_user_bucket", "user_id", "bucket"),
+    )
+
+class ActivityRollupDaily(Base):
+    __tablename__ = "activity_rollup_daily"
+    
+    # День (UTC), совпадает с func.date(ActivityLog.created_at)
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    action_type = Column(String, primary_key=True)
+    status = Column(String, primary_key=True)
+    action_count = Column(Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        Index("ix_activity_rollup_daily_user_day", "user_id", "day"),
+    )
+
+class ArchiveSummary(Base):
+    __tablename__ = "archive_summaries"
+    
+    # Счётчики строк, перенесённых из таблицы в архив, по месяцам
+    table_name = Column(String, primary_key=True)  # 'activity_logs', 'login_attempts'
+    month = Column(String, primary_key=True)  # 'YYYY-MM'
+    row_count = Column(Integer, nullable=False, default=0)
+    error_count = Column(Integer, nullable=False, default=0)  # status='error' / неуспешные входы
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class RetentionLease(Base):
+    __tablename__ = "retention_leases"
+    
+    # Аренда прохода retention: архивирует только worker/cron, владеющий арендой
+    name = Column(String, primary_key=True)  # 'retention'
+    owner = Column(String, nullable=True)  # host:pid:random выполняющего процесса
+    lease_until = Column(DateTime, nullable=True)  # продлевается после каждой пачки
+
+class TelegramAudience(Base):
+    __tablename__ = "telegram_audiences"
+    
+    # Сохранённый список получателей рассылки
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+    chat_ids = Column(Text, nullable=False)  # JSON список chat_id
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_telegram_audiences_user_name", "user_id", "name", unique=True),
+    )
+
+class TelegramBroadcast(Base):
+    __tablename__ = "telegram_broadcasts"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    connector_id = Column(String, nullable=True)  # SSE канал для уведомлений о ходе
+    status = Column(String, nullable=False, default="running")  # running, done, cancelled, failed
+    payload = Column(Text, nullable=False)  # JSON: text, parse_mode, ...
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    error = Column(Text, nullable=True)
+    lease_until = Column(DateTime, nullable=True)  # worker, выполняющий рассылку, продлевает аренду
+    lease_owner = Column(String, nullable=True)  # host:pid:token worker'а, держащего аренду
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+class TelegramBroadcastRecipient(Base):
+    __tablename__ = "telegram_broadcast_recipients"
+    
+    id = Column(Integer, primary_key=True)
+    broadcast_id = Column(Integer, ForeignKey("telegram_broadcasts.id"), nullable=False)
+    chat_id = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")  # pending, sent, failed
+    message_id = Column(Integer, nullable=True)
+    error = Column(String, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    
+    # Следующая пачка получателей: WHERE broadcast_id = ? AND status = 'pending' ORDER BY id
+    __table_args__ = (
+        Index("ix_telegram_broadcast_recipients_pending", "broadcast_id", "status", "id"),
+    )
+
+class TelegramUpdate(Base):
+    __tablename__ = "telegram_updates"
+    
+    # Обновления, принятые webhook'ом (кольцевой буфер: последние N на пользователя)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    update_id = Column(BigInteger, nullable=False)
+    payload = Column(Text, nullable=False)  # JSON Update как прислал Telegram
+    received_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Повторная доставка того же update_id отбрасывается; чтение: WHERE user_id = ? AND update_id >= offset
+    __table_args__ = (
+        Index("ix_telegram_updates_user_update", "user_id", "update_id", unique=True),
+    )
+
+class TelegramMediaUpload(Base):
+    __tablename__ = "telegram_media_uploads"
+    
+    # Файл Telegram, уже загруженный в медиатеку сайта (file_unique_id одинаков у всех ботов)
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    site = Column(String, nullable=False)  # origin сайта WordPress
+    file_unique_id = Column(String, nullable=False)
+    media_id = Column(Integer, nullable=False)
+    source_url = Column(String, nullable=True)
+    size = Column(BigInteger, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        Index("ix_telegram_media_uploads_file", "user_id", "site", "file_unique_id", unique=True),
+    )
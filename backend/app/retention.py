@@ -0,0 +1,442 @@
+"""
+Retention Engine
+Перенос старых строк activity_logs / login_attempts в архив и удаление небольшими пачками
+"""
+import asyncio
+import gzip
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, func, or_, select, text, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import logging
+
+from .database import Base
+from .models import ActivityLog, ArchiveSummary, LoginAttempt, RetentionLease
+
+logger = logging.getLogger(__name__)
+
+# Режимы архивации
+ARCHIVE_MODE_FILE = "file"     # gzip NDJSON файлы по месяцам
+ARCHIVE_MODE_TABLE = "table"   # таблицы <table>_archive_YYYYMM (только PostgreSQL)
+ARCHIVE_MODE_NONE = "none"     # только удаление (счётчики в archive_summaries сохраняются)
+
+DEFAULT_ARCHIVE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "archive")
+)
+
+RETENTION_TABLES = [ArchiveSummary.__table__, RetentionLease.__table__]
+LEASE_NAME = "retention"
+
+
+class LeaseLostError(RuntimeError):
+    """Аренду прохода перехватил другой процесс (текущий проход слишком долго не продлевал её)"""
+
+
+class RetentionPolicy:
+    """Политика хранения одной таблицы"""
+
+    def __init__(self, model, retention_days: int, is_error: Callable[[Any], bool]):
+        """
+        Args:
+            model: Модель с колонками id и created_at
+            retention_days: Сколько дней хранить строки в основной таблице (0 - не удалять)
+            is_error: Признак «ошибочной» строки для счётчика error_count
+        """
+        self.model = model
+        self.retention_days = retention_days
+        self.is_error = is_error
+
+    @property
+    def table_name(self) -> str:
+        return self.model.__tablename__
+
+    def cutoff(self, now: Optional[datetime] = None) -> Optional[datetime]:
+        """Граница: строки с created_at раньше неё уходят в архив"""
+        if self.retention_days <= 0:
+            return None
+        return (now or datetime.utcnow()) - timedelta(days=self.retention_days)
+
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """Все колонки строки в JSON-совместимом виде"""
+    result = {}
+    for column in row.__table__.columns:
+        value = getattr(row, column.key)
+        if isinstance(value, (datetime, date)):
+            value = value.isoformat()
+        result[column.key] = value
+    return result
+
+
+class RetentionEngine:
+    """
+    Архивация и удаление строк старше retention_days
+
+    Каждая пачка (batch_size строк, по возрастанию id) архивируется, удаляется
+    и учитывается в archive_summaries в одной транзакции, между пачками - пауза,
+    чтобы не блокировать запись (SQLite держит write-lock только на одну пачку).
+    Проход выполняется под арендой в retention_leases: workers и cron, запущенные
+    одновременно, не архивируют одни и те же строки дважды. Аренда продлевается
+    в транзакции каждой пачки; потерявший аренду проход останавливается.
+    """
+
+    def __init__(
+        self,
+        policies: List[RetentionPolicy],
+        archive_mode: str = ARCHIVE_MODE_FILE,
+        archive_dir: str = DEFAULT_ARCHIVE_DIR,
+        batch_size: int = 1000,
+        batch_pause: float = 0.05,
+        lease_seconds: float = 300.0,
+        session_factory=None,
+    ):
+        """
+        Args:
+            policies: Политики по таблицам
+            archive_mode: file, table или none
+            archive_dir: Каталог архивов для режима file
+            batch_size: Строк в одной транзакции удаления
+            batch_pause: Пауза между пачками (сек)
+            lease_seconds: Срок аренды прохода (продлевается после каждой пачки)
+            session_factory: Фабрика синхронных сессий (по умолчанию SessionLocal)
+        """
+        if archive_mode not in (ARCHIVE_MODE_FILE, ARCHIVE_MODE_TABLE, ARCHIVE_MODE_NONE):
+            raise ValueError(f"Unknown retention archive mode: {archive_mode}")
+        self.policies = policies
+        self.archive_mode = archive_mode
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._session_factory = session_factory
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = threading.Event()
+
+    def get_policy(self, table_name: str) -> Optional[RetentionPolicy]:
+        for policy in self.policies:
+            if policy.table_name == table_name:
+                return policy
+        return None
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from .database import SessionLocal
+            self._session_factory = SessionLocal
+        return self._session_factory
+
+    # ---------- аренда ----------
+
+    def _acquire_lease(self, db: Session) -> bool:
+        """Взять аренду прохода; False, если её держит другой процесс"""
+        now = datetime.utcnow()
+        if db.get(RetentionLease, LEASE_NAME) is None:
+            db.add(RetentionLease(name=LEASE_NAME))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Строку аренды одновременно создал другой процесс
+                db.rollback()
+        # Условный UPDATE: из нескольких процессов аренду получит один
+        claimed = db.execute(
+            update(RetentionLease)
+            .where(
+                RetentionLease.name == LEASE_NAME,
+                or_(
+                    RetentionLease.lease_until.is_(None),
+                    RetentionLease.lease_until < now,
+                    RetentionLease.owner == self.owner,
+                ),
+            )
+            .values(owner=self.owner, lease_until=now + timedelta(seconds=self.lease_seconds))
+        )
+        db.commit()
+        return bool(claimed.rowcount)
+
+    def _renew_lease(self, db: Session) -> bool:
+        """Продлить аренду в текущей транзакции; False, если аренда перешла к другому процессу"""
+        renewed = db.execute(
+            update(RetentionLease)
+            .where(RetentionLease.name == LEASE_NAME, RetentionLease.owner == self.owner)
+            .values(lease_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds))
+        )
+        return bool(renewed.rowcount)
+
+    def _release_lease(self, db: Session) -> None:
+        db.execute(
+            update(RetentionLease)
+            .where(RetentionLease.name == LEASE_NAME, RetentionLease.owner == self.owner)
+            .values(lease_until=None)
+        )
+        db.commit()
+
+    # ---------- архивация ----------
+
+    def archive_path(self, table_name: str, month: str) -> str:
+        return os.path.join(self.archive_dir, table_name, f"{month}.ndjson.gz")
+
+    def _archive_to_file(self, table_name: str, month: str, rows: List[Any]) -> str:
+        """
+        Пачка записывается во временный файл <архив>.pending; в архив она дописывается
+        только после commit удаления (_promote_pending), иначе неудачный commit
+        архивировал бы те же строки повторно на следующем проходе
+
+        Returns:
+            Путь к временному файлу
+        """
+        pending = self.archive_path(table_name, month) + ".pending"
+        os.makedirs(os.path.dirname(pending), exist_ok=True)
+        payload = "".join(json.dumps(row_to_dict(row), ensure_ascii=False) + "\n" for row in rows)
+        with open(pending, "wb") as staged:
+            staged.write(gzip.compress(payload.encode("utf-8")))
+            staged.flush()
+            os.fsync(staged.fileno())
+        return pending
+
+    @staticmethod
+    def _promote_pending(pending: str) -> None:
+        """Дописать пачку из временного файла в архив месяца"""
+        with open(pending, "rb") as staged:
+            member = staged.read()
+        # Каждая пачка - отдельный gzip member, gzip.open читает их подряд
+        with open(pending[:-len(".pending")], "ab") as archive:
+            archive.write(member)
+            archive.flush()
+            os.fsync(archive.fileno())
+        os.remove(pending)
+
+    def _recover_pending(self, db: Session, policy: RetentionPolicy) -> None:
+        """
+        Временные файлы, оставшиеся после сбоя: если строк пачки уже нет в таблице,
+        commit прошёл и пачка дописывается в архив, иначе файл удаляется
+        (строки будут заархивированы заново)
+        """
+        directory = os.path.join(self.archive_dir, policy.table_name)
+        if not os.path.isdir(directory):
+            return
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".pending"):
+                continue
+            pending = os.path.join(directory, name)
+            with gzip.open(pending, "rt", encoding="utf-8") as staged:
+                ids = [json.loads(line)["id"] for line in staged]
+            still_live = db.scalar(
+                select(func.count()).select_from(policy.model).where(policy.model.id.in_(ids))
+            ) if ids else 0
+            if still_live:
+                os.remove(pending)
+            else:
+                self._promote_pending(pending)
+
+    def _archive_to_table(self, db: Session, table_name: str, month: str, ids: List[int]) -> None:
+        archive_table = f"{table_name}_archive_{month.replace('-', '')}"
+        db.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{archive_table}" (LIKE "{table_name}" INCLUDING DEFAULTS)'
+        ))
+        db.execute(
+            text(f'INSERT INTO "{archive_table}" SELECT * FROM "{table_name}" WHERE id = ANY(:ids)'),
+            {"ids": ids},
+        )
+
+    def _add_summary(self, db: Session, table_name: str, month: str, rows: int, errors: int) -> None:
+        summary = db.get(ArchiveSummary, (table_name, month))
+        if summary is None:
+            summary = ArchiveSummary(table_name=table_name, month=month, row_count=0, error_count=0)
+            db.add(summary)
+        summary.row_count += rows
+        summary.error_count += errors
+
+    def _archive_batch(self, db: Session, policy: RetentionPolicy, cutoff: datetime) -> int:
+        model = policy.model
+        # Продление аренды открывает write-транзакцию до чтения пачки
+        if not self._renew_lease(db):
+            db.rollback()
+            raise LeaseLostError("Retention: lease lost to another process")
+        rows = db.scalars(
+            select(model).where(model.created_at < cutoff).order_by(model.id).limit(self.batch_size)
+        ).all()
+        if not rows:
+            return 0
+
+        by_month: Dict[str, List[Any]] = defaultdict(list)
+        pending: List[str] = []
+        for row in rows:
+            by_month[row.created_at.strftime("%Y-%m")].append(row)
+
+        for month, month_rows in by_month.items():
+            if self.archive_mode == ARCHIVE_MODE_FILE:
+                pending.append(self._archive_to_file(policy.table_name, month, month_rows))
+            elif self.archive_mode == ARCHIVE_MODE_TABLE:
+                self._archive_to_table(db, policy.table_name, month, [row.id for row in month_rows])
+            self._add_summary(
+                db, policy.table_name, month,
+                len(month_rows), sum(1 for row in month_rows if policy.is_error(row)),
+            )
+
+        db.execute(delete(model).where(model.id.in_([row.id for row in rows])))
+        db.commit()
+        for path in pending:
+            self._promote_pending(path)
+        return len(rows)
+
+    def run_once(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """
+        Один проход по всем политикам (синхронно, для потока или cron)
+
+        Returns:
+            Количество перенесённых строк по таблицам (пусто, если проход
+            уже выполняет другой процесс)
+        """
+        session_factory = self._get_session_factory()
+        moved: Dict[str, int] = {}
+        with session_factory() as db:
+            bind = db.get_bind()
+            if self.archive_mode == ARCHIVE_MODE_TABLE and bind.dialect.name != "postgresql":
+                raise ValueError("Retention archive mode 'table' requires PostgreSQL")
+            Base.metadata.create_all(bind, tables=RETENTION_TABLES, checkfirst=True)
+
+            if not self._acquire_lease(db):
+                logger.info("Retention: another process holds the lease, skipping run")
+                return moved
+            try:
+                for policy in self.policies:
+                    if self.archive_mode == ARCHIVE_MODE_FILE:
+                        self._recover_pending(db, policy)
+                    cutoff = policy.cutoff(now)
+                    moved[policy.table_name] = 0
+                    if cutoff is None:
+                        continue
+                    while not self._stopping.is_set():
+                        try:
+                            count = self._archive_batch(db, policy, cutoff)
+                        except Exception:
+                            db.rollback()
+                            raise
+                        moved[policy.table_name] += count
+                        if count < self.batch_size:
+                            break
+                        time.sleep(self.batch_pause)
+                    if moved[policy.table_name]:
+                        logger.info(f"Retention: archived {moved[policy.table_name]} rows from {policy.table_name}")
+            except LeaseLostError as e:
+                logger.warning(str(e))
+                return moved
+            finally:
+                self._release_lease(db)
+        return moved
+
+    # ---------- фоновый запуск ----------
+
+    def start(self, interval_seconds: float = 3600.0) -> None:
+        """
+        Запуск периодической архивации в фоне
+
+        Args:
+            interval_seconds: Период между проходами
+        """
+        if self._task and not self._task.done():
+            return
+        self._stopping.clear()
+
+        async def retention_loop():
+            while True:
+                try:
+                    await asyncio.to_thread(self.run_once)
+                except Exception as e:
+                    logger.error(f"Retention: run failed: {str(e)}")
+                await asyncio.sleep(interval_seconds)
+
+        self._task = asyncio.create_task(retention_loop())
+
+    async def close(self) -> None:
+        """Остановка фоновой архивации (текущая пачка дописывается)"""
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+async def archived_until(db, table_name: str) -> Optional[date]:
+    """
+    Первый день после последнего заархивированного месяца таблицы
+
+    Args:
+        db: AsyncSession
+        table_name: activity_logs или login_attempts
+
+    Returns:
+        Дата или None, если из таблицы ещё ничего не архивировалось
+    """
+    try:
+        last_month = await db.scalar(
+            select(func.max(ArchiveSummary.month)).where(ArchiveSummary.table_name == table_name)
+        )
+    except Exception:
+        # Таблица archive_summaries создаётся при первом проходе retention
+        await db.rollback()
+        return None
+    if not last_month:
+        return None
+    year, month = (int(part) for part in last_month.split("-"))
+    return date(year + month // 12, month % 12 + 1, 1)
+
+
+async def archived_counts(db, table_name: str, before: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    Суммарные счётчики архивных месяцев таблицы
+
+    Args:
+        db: AsyncSession
+        table_name: activity_logs или login_attempts
+        before: Учитывать только месяцы до этой даты (None - все)
+
+    Returns:
+        {"rows": ..., "errors": ...}
+    """
+    query = select(
+        func.coalesce(func.sum(ArchiveSummary.row_count), 0),
+        func.coalesce(func.sum(ArchiveSummary.error_count), 0),
+    ).where(ArchiveSummary.table_name == table_name)
+    if before is not None:
+        query = query.where(ArchiveSummary.month < before.strftime("%Y-%m"))
+    try:
+        rows, errors = (await db.execute(query)).one()
+    except Exception:
+        # Таблица archive_summaries создаётся при первом проходе retention
+        await db.rollback()
+        return {"rows": 0, "errors": 0}
+    return {"rows": int(rows), "errors": int(errors)}
+
+
+retention_engine = RetentionEngine(
+    policies=[
+        RetentionPolicy(
+            ActivityLog,
+            int(os.getenv("ACTIVITY_LOG_RETENTION_DAYS", "90")),
+            lambda row: row.status == "error",
+        ),
+        RetentionPolicy(
+            LoginAttempt,
+            int(os.getenv("LOGIN_ATTEMPT_RETENTION_DAYS", "30")),
+            lambda row: not row.success,
+        ),
+    ],
+    archive_mode=os.getenv("RETENTION_ARCHIVE_MODE", ARCHIVE_MODE_FILE),
+    archive_dir=os.getenv("RETENTION_ARCHIVE_DIR", DEFAULT_ARCHIVE_DIR),
+    batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "1000")),
+    batch_pause=float(os.getenv("RETENTION_BATCH_PAUSE", "0.05")),
+    lease_seconds=float(os.getenv("RETENTION_LEASE_SECONDS", "300")),
+)
@@ -0,0 +1,273 @@
+"""
+Telegram Bot Registry
+Переиспользуемые экземпляры telegram.Bot с общим пулом HTTP соединений
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from itertools import islice
+from typing import Any, Dict, Optional
+
+import httpx
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
+
+from app.helpers import decrypt_token
+from app.models import UserSettings
+from app.telegram_scheduler import create_send_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+class SharedHTTPXRequest(HTTPXRequest):
+    """
+    HTTPXRequest, общий для всех ботов реестра
+
+    Bot.shutdown() не закрывает общий пул - он закрывается только через aclose()
+    при остановке приложения.
+    """
+
+    async def shutdown(self) -> None:
+        return
+
+    async def aclose(self) -> None:
+        await super().shutdown()
+
+
+class BotEntry:
+    """Бот пользователя и отпечаток токена, из которого он создан"""
+
+    def __init__(self, bot: Bot, fingerprint: str):
+        self.bot = bot
+        self.fingerprint = fingerprint
+        self.checked_at = time.monotonic()
+        self.last_used = self.checked_at
+
+
+class TelegramBotRegistry:
+    """
+    Реестр telegram.Bot по user_id
+
+    Бот создаётся один раз на токен: повторные вызовы инструментов не расшифровывают
+    токен и не открывают новый пул соединений. Раз в revalidate_seconds отпечаток
+    сохранённого токена сверяется с БД (настройки могли смениться в другом worker),
+    /user/settings сбрасывает запись сразу. Неиспользуемые боты вытесняются
+    через idle_seconds.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = 100,
+        updates_pool_size: int = 20,
+        revalidate_seconds: float = 60.0,
+        idle_seconds: float = 900.0,
+        max_bots: int = 1000,
+        httpx_kwargs: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            pool_size: Соединений к Bot API на всех ботов
+            updates_pool_size: Соединений для get_updates (long polling)
+            revalidate_seconds: Как часто сверять токен с БД
+            idle_seconds: Через сколько вытеснять неиспользуемого бота
+            max_bots: Максимум ботов в реестре (LRU)
+            httpx_kwargs: Дополнительные параметры httpx.AsyncClient (тесты, прокси)
+        """
+        self.pool_size = pool_size
+        self.updates_pool_size = updates_pool_size
+        self.revalidate_seconds = revalidate_seconds
+        self.idle_seconds = idle_seconds
+        self.max_bots = max_bots
+        self.httpx_kwargs = httpx_kwargs
+        self._bots: "OrderedDict[Any, BotEntry]" = OrderedDict()
+        self._request: Optional[SharedHTTPXRequest] = None
+        self._updates_request: Optional[SharedHTTPXRequest] = None
+        self._file_client: Optional[httpx.AsyncClient] = None
+        self._sweeper: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.revalidated = 0
+        self.created = 0
+        self.evicted = 0
+
+    @staticmethod
+    def fingerprint(stored_token: str) -> str:
+        """Отпечаток сохранённого (зашифрованного) токена"""
+        return hashlib.sha256(stored_token.encode("utf-8")).hexdigest()[:16]
+
+    def _requests(self):
+        if self._request is None:
+            self._request = SharedHTTPXRequest(
+                connection_pool_size=self.pool_size, httpx_kwargs=self.httpx_kwargs
+            )
+            # Long polling держит соединение до timeout - отдельный пул
+            self._updates_request = SharedHTTPXRequest(
+                connection_pool_size=self.updates_pool_size, httpx_kwargs=self.httpx_kwargs
+            )
+        return self._request, self._updates_request
+
+    def file_client(self, timeout: float = 120.0) -> httpx.AsyncClient:
+        """
+        Клиент для потокового скачивания файлов (api.telegram.org/file/...)
+
+        Отдельно от пула Bot API: долгое скачивание не занимает соединения для запросов.
+        """
+        if self._file_client is None:
+            self._file_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(timeout, connect=10.0),
+                limits=httpx.Limits(max_connections=self.updates_pool_size),
+                follow_redirects=True,
+                **(self.httpx_kwargs or {}),
+            )
+        return self._file_client
+
+    def create_bot(self, token: str) -> Bot:
+        """Новый бот на общем пуле соединений со своим планировщиком отправки (лимиты на токен)"""
+        request, updates_request = self._requests()
+        return ExtBot(
+            token=token,
+            request=request,
+            get_updates_request=updates_request,
+            rate_limiter=create_send_scheduler(),
+        )
+
+    async def get_bot(self, user_id: Any, db: AsyncSession) -> Optional[Bot]:
+        """
+        Бот пользователя (None, если токен не настроен)
+
+        Args:
+            user_id: ID пользователя
+            db: AsyncSession для проверки токена
+        """
+        now = time.monotonic()
+        entry = self._bots.get(user_id)
+        if entry is not None and now - entry.checked_at < self.revalidate_seconds:
+            entry.last_used = now
+            self._bots.move_to_end(user_id)
+            self.hits += 1
+            return entry.bot
+
+        stored_token = await db.scalar(
+            select(UserSettings.telegram_bot_token).where(UserSettings.user_id == user_id)
+        )
+        if not stored_token:
+            self.invalidate(user_id)
+            return None
+
+        fingerprint = self.fingerprint(stored_token)
+        if entry is not None and entry.fingerprint == fingerprint:
+            entry.checked_at = entry.last_used = now
+            self._bots.move_to_end(user_id)
+            self.revalidated += 1
+            return entry.bot
+
+        entry = BotEntry(self.create_bot(decrypt_token(stored_token)), fingerprint)
+        self._bots[user_id] = entry
+        self._bots.move_to_end(user_id)
+        self.created += 1
+        if len(self._bots) > self.max_bots:
+            # Как в sweep_idle: бот с очередью отправки не вытесняется, реестр временно больше max_bots
+            idle = islice((
+                cached_user_id for cached_user_id, cached in self._bots.items()
+                if cached is not entry and not cached.bot.rate_limiter.busy
+            ), len(self._bots) - self.max_bots)
+            for cached_user_id in list(idle):
+                del self._bots[cached_user_id]
+                self.evicted += 1
+        return entry.bot
+
+    def invalidate(self, user_id: Any) -> None:
+        """Сбросить бота пользователя (токен изменён или удалён)"""
+        if self._bots.pop(user_id, None) is not None:
+            logger.info("TelegramBots: bot for user %s invalidated", user_id)
+
+    def sweep_idle(self) -> int:
+        """Вытеснить ботов, не использовавшихся idle_seconds (и без запросов в очереди)"""
+        cutoff = time.monotonic() - self.idle_seconds
+        # Бот с очередью отправки не вытесняется: второй экземпляр удвоил бы лимиты токена
+        idle = [
+            user_id for user_id, entry in self._bots.items()
+            if entry.last_used < cutoff and not entry.bot.rate_limiter.busy
+        ]
+        for user_id in idle:
+            del self._bots[user_id]
+        self.evicted += len(idle)
+        return len(idle)
+
+    def start_sweeper(self, interval_seconds: float = 60.0) -> None:
+        """
+        Запуск фонового вытеснения неиспользуемых ботов
+
+        Args:
+            interval_seconds: Период проверки
+        """
+        if self._sweeper and not self._sweeper.done():
+            return
+
+        async def sweeper_loop():
+            while True:
+                await asyncio.sleep(interval_seconds)
+                try:
+                    removed = self.sweep_idle()
+                    if removed:
+                        logger.info("TelegramBots: evicted %s idle bots", removed)
+                except Exception as exc:
+                    logger.error("TelegramBots: sweeper error: %s", exc)
+
+        self._sweeper = asyncio.create_task(sweeper_loop())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Размер реестра, попадания, проверки токена, созданные и вытесненные боты,
+            суммарные метрики планировщиков отправки
+        """
+        send = {"queued": 0, "chat_waiting": 0, "in_flight": 0, "sent": 0, "retries": 0, "failed": 0}
+        for entry in self._bots.values():
+            scheduler_stats = entry.bot.rate_limiter.stats()
+            send["queued"] += sum(scheduler_stats["queued"].values())
+            for name in ("chat_waiting", "in_flight", "sent", "retries", "failed"):
+                send[name] += scheduler_stats[name]
+        return {
+            "size": len(self._bots),
+            "hits": self.hits,
+            "revalidated": self.revalidated,
+            "created": self.created,
+            "evicted": self.evicted,
+            "send": send,
+        }
+
+    async def aclose(self) -> None:
+        """Остановка вытеснения и закрытие общего пула"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        self._bots.clear()
+        for request in (self._request, self._updates_request):
+            if request is not None:
+                await request.aclose()
+        self._request = self._updates_request = None
+        if self._file_client is not None:
+            await self._file_client.aclose()
+            self._file_client = None
+
+
+telegram_bots = TelegramBotRegistry(
+    pool_size=int(os.getenv("TELEGRAM_HTTP_POOL_SIZE", "100")),
+    updates_pool_size=int(os.getenv("TELEGRAM_HTTP_UPDATES_POOL_SIZE", "20")),
+    revalidate_seconds=float(os.getenv("TELEGRAM_BOT_REVALIDATE", "60")),
+    idle_seconds=float(os.getenv("TELEGRAM_BOT_IDLE_TTL", "900")),
+    max_bots=int(os.getenv("TELEGRAM_BOT_MAX", "1000")),
+)
@@ -0,0 +1,449 @@
+"""
+Telegram Broadcast
+Фоновые рассылки одного сообщения по списку чатов с сохранением статуса каждого получателя
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import secrets
+import socket
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram.error import TelegramError
+
+from app.database import Base
+from app.models import TelegramAudience, TelegramBroadcast, TelegramBroadcastRecipient, UserSettings
+from app.telegram_bots import telegram_bots
+from app.telegram_scheduler import PRIORITY_BULK
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_TABLES = [
+    TelegramAudience.__table__,
+    TelegramBroadcast.__table__,
+    TelegramBroadcastRecipient.__table__,
+]
+
+# Поля сообщения, которые передаются в send_message
+MESSAGE_FIELDS = ("text", "parse_mode", "disable_web_page_preview", "disable_notification")
+
+# notify(connector_id, status) - уведомление о ходе рассылки
+BroadcastNotifier = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+async def _uninterruptible(coro: Awaitable[Any]) -> Any:
+    """
+    Выполнить coro до конца, даже если вызывающую задачу отменили
+
+    Запись пачки в БД не обрывается на середине транзакции: отмена ждёт commit
+    и только потом пробрасывается дальше.
+    """
+    task = asyncio.ensure_future(coro)
+    try:
+        return await asyncio.shield(task)
+    except asyncio.CancelledError:
+        await task
+        raise
+
+
+def parse_chat_ids(value: Any) -> List[str]:
+    """Список chat_id из массива или строки через запятую/перевод строки, без повторов"""
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        value = str(value).replace("\n", ",").split(",")
+    return list(dict.fromkeys(str(chat_id).strip() for chat_id in value if str(chat_id).strip()))
+
+
+def broadcast_status(job: TelegramBroadcast) -> Dict[str, Any]:
+    """Состояние рассылки для ответа инструмента и SSE уведомлений"""
+    return {
+        "broadcast_id": job.id,
+        "status": job.status,
+        "total": job.total,
+        "sent": job.sent,
+        "failed": job.failed,
+        "pending": job.total - job.sent - job.failed,
+        "error": job.error,
+    }
+
+
+class BroadcastManager:
+    """
+    Выполнение рассылок в фоне
+
+    Получатели хранятся в telegram_broadcast_recipients со статусом pending/sent/failed.
+    Рассылка идёт пачками по chunk_size: пачка отправляется через планировщик бота
+    (PRIORITY_BULK - в пределах лимитов Telegram и после интерактивных запросов),
+    затем статусы пачки и счётчики сохраняются одной транзакцией. После падения или
+    рестарта рассылка продолжается с первого pending получателя (повторно может
+    уйти только последняя несохранённая пачка). Worker держит аренду (lease_owner,
+    lease_until) и продлевает её после каждой пачки; рассылку с истёкшей арендой
+    подхватывает любой worker. Пачка сохраняется только пока аренда у этого
+    worker'а: если её перехватили, worker прекращает рассылку.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 50,
+        lease_seconds: float = 120.0,
+        max_recipients: int = 50000,
+        session_factory=None,
+        stop_timeout: float = 30.0,
+    ):
+        """
+        Args:
+            chunk_size: Получателей в одной пачке (и максимум повторов после падения)
+            lease_seconds: Аренда рассылки worker'ом
+            max_recipients: Максимум получателей одной рассылки
+            session_factory: Фабрика AsyncSession (по умолчанию AsyncSessionLocal)
+            stop_timeout: Сколько close() ждёт завершения текущих пачек
+        """
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self.max_recipients = max_recipients
+        self.stop_timeout = stop_timeout
+        self._stopping = False
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._session_factory = session_factory
+        self.notify: Optional[BroadcastNotifier] = None
+        self._jobs: Dict[int, asyncio.Task] = {}
+        self._resumer: Optional[asyncio.Task] = None
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def ensure_tables(self) -> None:
+        """Таблицы рассылок создаются при первом запуске (как таблицы агрегатов)"""
+        async with self._get_session_factory()() as db:
+            conn = await db.connection()
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=BROADCAST_TABLES, checkfirst=True
+            ))
+            await db.commit()
+
+    # ---------- аудитории ----------
+
+    async def save_audience(self, db: AsyncSession, user_id: int, name: str, chat_ids: List[str]) -> None:
+        audience = await db.scalar(select(TelegramAudience).where(
+            TelegramAudience.user_id == user_id, TelegramAudience.name == name
+        ))
+        if audience is None:
+            audience = TelegramAudience(user_id=user_id, name=name)
+            db.add(audience)
+        audience.chat_ids = json.dumps(chat_ids)
+        await db.commit()
+
+    async def load_audience(self, db: AsyncSession, user_id: int, name: str) -> Optional[List[str]]:
+        chat_ids = await db.scalar(select(TelegramAudience.chat_ids).where(
+            TelegramAudience.user_id == user_id, TelegramAudience.name == name
+        ))
+        return json.loads(chat_ids) if chat_ids is not None else None
+
+    # ---------- управление рассылками ----------
+
+    async def create(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        chat_ids: List[str],
+        message: Dict[str, Any],
+    ) -> TelegramBroadcast:
+        """
+        Создать рассылку и запустить её в фоне
+
+        Args:
+            db: AsyncSession
+            user_id: Владелец бота
+            chat_ids: Получатели (без повторов)
+            message: Поля send_message (text, parse_mode, ...)
+        """
+        if len(chat_ids) > self.max_recipients:
+            raise ValueError(f"Слишком много получателей: {len(chat_ids)} (максимум {self.max_recipients})")
+
+        connector_id = await db.scalar(
+            select(UserSettings.mcp_connector_id).where(UserSettings.user_id == user_id)
+        )
+        job = TelegramBroadcast(
+            user_id=user_id,
+            connector_id=connector_id,
+            status="running",
+            payload=json.dumps({key: message[key] for key in MESSAGE_FIELDS if message.get(key) is not None}),
+            total=len(chat_ids),
+            lease_until=datetime.utcnow() + timedelta(seconds=self.lease_seconds),
+            lease_owner=self.owner,
+        )
+        db.add(job)
+        await db.flush()
+        for start in range(0, len(chat_ids), 1000):
+            db.add_all([
+                TelegramBroadcastRecipient(broadcast_id=job.id, chat_id=chat_id, status="pending")
+                for chat_id in chat_ids[start:start + 1000]
+            ])
+            await db.flush()
+        await db.commit()
+        self._spawn(job.id)
+        return job
+
+    async def get(self, db: AsyncSession, user_id: int, broadcast_id: int) -> Optional[TelegramBroadcast]:
+        job = await db.get(TelegramBroadcast, broadcast_id, populate_existing=True)
+        if job is None or job.user_id != user_id:
+            return None
+        return job
+
+    async def failed_recipients(self, db: AsyncSession, broadcast_id: int, limit: int = 10) -> List[Tuple[str, str]]:
+        rows = await db.execute(
+            select(TelegramBroadcastRecipient.chat_id, TelegramBroadcastRecipient.error)
+            .where(
+                TelegramBroadcastRecipient.broadcast_id == broadcast_id,
+                TelegramBroadcastRecipient.status == "failed",
+            )
+            .order_by(TelegramBroadcastRecipient.id)
+            .limit(limit)
+        )
+        return [(chat_id, error) for chat_id, error in rows]
+
+    async def cancel(self, db: AsyncSession, job: TelegramBroadcast) -> None:
+        """Остановить рассылку (текущая пачка дописывается)"""
+        if job.status == "running":
+            job.status = "cancelled"
+            job.finished_at = datetime.utcnow()
+            await db.commit()
+
+    # ---------- выполнение ----------
+
+    def _spawn(self, broadcast_id: int) -> None:
+        if self._stopping:
+            return
+        task = self._jobs.get(broadcast_id)
+        if task is not None and not task.done():
+            return
+        task = asyncio.create_task(self._run(broadcast_id))
+        self._jobs[broadcast_id] = task
+        task.add_done_callback(lambda _: self._jobs.pop(broadcast_id, None))
+
+    async def _send(self, bot, chat_id: str, message: Dict[str, Any]) -> Tuple[bool, Optional[int], Optional[str]]:
+        try:
+            sent = await bot.send_message(chat_id=chat_id, rate_limit_args=PRIORITY_BULK, **message)
+            return True, sent.message_id, None
+        except TelegramError as exc:
+            return False, None, str(exc.message)[:200]
+        except Exception as exc:
+            logger.error("Broadcast: ошибка отправки в %s: %s", chat_id, exc)
+            return False, None, str(exc)[:200]
+
+    async def _notify(self, job: TelegramBroadcast) -> None:
+        if self.notify is None or not job.connector_id:
+            return
+        try:
+            await self.notify(job.connector_id, broadcast_status(job))
+        except Exception as exc:
+            logger.warning("Broadcast: уведомление не отправлено: %s", exc)
+
+    async def _run(self, broadcast_id: int) -> None:
+        session_factory = self._get_session_factory()
+        recipient = TelegramBroadcastRecipient
+        try:
+            # close() выставляет _stopping: текущая пачка дописывается, следующая не начинается
+            while not self._stopping:
+                async with session_factory() as db:
+                    job = await db.get(TelegramBroadcast, broadcast_id)
+                    if job is None or job.status != "running" or job.lease_owner != self.owner:
+                        return
+                    bot = await telegram_bots.get_bot(job.user_id, db)
+                    if bot is None:
+                        job.status = "failed"
+                        job.error = "Telegram бот не настроен"
+                        job.finished_at = datetime.utcnow()
+                        await db.commit()
+                        await self._notify(job)
+                        return
+                    message = json.loads(job.payload)
+                    chunk = (await db.execute(
+                        select(recipient.id, recipient.chat_id)
+                        .where(recipient.broadcast_id == broadcast_id, recipient.status == "pending")
+                        .order_by(recipient.id)
+                        .limit(self.chunk_size)
+                    )).all()
+                    if not chunk:
+                        job.status = "done"
+                        job.finished_at = datetime.utcnow()
+                        await db.commit()
+                        await self._notify(job)
+                        logger.info("Broadcast %s: done (sent=%s, failed=%s)", job.id, job.sent, job.failed)
+                        return
+
+                results = await asyncio.gather(*(self._send(bot, chat_id, message) for _, chat_id in chunk))
+                job = await _uninterruptible(self._save_chunk(broadcast_id, chunk, results))
+                if job is None:
+                    logger.warning("Broadcast %s: аренду перехватил другой worker, рассылка остановлена", broadcast_id)
+                    return
+                await self._notify(job)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            # Аренда истечёт, и рассылку продолжит resume_orphaned
+            logger.error("Broadcast %s: прервана: %s", broadcast_id, exc, exc_info=True)
+
+    async def _save_chunk(
+        self,
+        broadcast_id: int,
+        chunk: List[Tuple[int, str]],
+        results: List[Tuple[bool, Optional[int], Optional[str]]],
+    ) -> Optional[TelegramBroadcast]:
+        """
+        Статусы получателей пачки, счётчики и продление аренды - одной транзакцией
+
+        Returns:
+            Рассылка или None, если аренда уже не у этого worker'а (пачка не сохранена)
+        """
+        recipient = TelegramBroadcastRecipient
+        now = datetime.utcnow()
+        sent = sum(1 for ok, _, _ in results if ok)
+        async with self._get_session_factory()() as db:
+            renewed = await db.execute(
+                update(TelegramBroadcast)
+                .where(TelegramBroadcast.id == broadcast_id, TelegramBroadcast.lease_owner == self.owner)
+                .values(
+                    sent=TelegramBroadcast.sent + sent,
+                    failed=TelegramBroadcast.failed + len(results) - sent,
+                    lease_until=now + timedelta(seconds=self.lease_seconds),
+                    updated_at=now,
+                )
+            )
+            if not renewed.rowcount:
+                await db.rollback()
+                return None
+            await db.execute(update(recipient), [
+                {
+                    "id": recipient_id,
+                    "status": "sent" if ok else "failed",
+                    "message_id": message_id,
+                    "error": error,
+                    "updated_at": now,
+                }
+                for (recipient_id, _), (ok, message_id, error) in zip(chunk, results)
+            ])
+            await db.commit()
+            return await db.get(TelegramBroadcast, broadcast_id)
+
+    async def resume_orphaned(self) -> int:
+        """
+        Подхватить рассылки со статусом running и истёкшей арендой
+
+        Returns:
+            Количество продолженных рассылок
+        """
+        now = datetime.utcnow()
+        async with self._get_session_factory()() as db:
+            candidates = (await db.scalars(
+                select(TelegramBroadcast.id).where(
+                    TelegramBroadcast.status == "running",
+                    or_(TelegramBroadcast.lease_until.is_(None), TelegramBroadcast.lease_until < now),
+                )
+            )).all()
+            resumed = 0
+            for broadcast_id in candidates:
+                if self._stopping:
+                    break
+                # Условный UPDATE: из нескольких worker'ов аренду получит один
+                claimed = await db.execute(
+                    update(TelegramBroadcast)
+                    .where(
+                        TelegramBroadcast.id == broadcast_id,
+                        TelegramBroadcast.status == "running",
+                        or_(TelegramBroadcast.lease_until.is_(None), TelegramBroadcast.lease_until < now),
+                    )
+                    .values(lease_owner=self.owner, lease_until=now + timedelta(seconds=self.lease_seconds))
+                )
+                await db.commit()
+                if claimed.rowcount:
+                    self._spawn(broadcast_id)
+                    resumed += 1
+        if resumed:
+            logger.info("Broadcast: resumed %s broadcasts", resumed)
+        return resumed
+
+    async def start(self, resume_interval: float = 60.0) -> None:
+        """
+        Создание таблиц и фоновое продолжение прерванных рассылок
+
+        Args:
+            resume_interval: Период поиска рассылок с истёкшей арендой (0 - только при старте)
+        """
+        await self.ensure_tables()
+        if self._resumer and not self._resumer.done():
+            return
+
+        async def resume_loop():
+            while True:
+                try:
+                    await _uninterruptible(self.resume_orphaned())
+                except Exception as exc:
+                    logger.error("Broadcast: resume error: %s", exc)
+                if resume_interval <= 0:
+                    return
+                await asyncio.sleep(resume_interval)
+
+        self._resumer = asyncio.create_task(resume_loop())
+
+    async def close(self) -> None:
+        """
+        Остановка рассылок этого worker'а
+
+        Текущие пачки дописываются (не дольше stop_timeout), затем аренда снимается,
+        и рассылки сразу подхватит другой worker.
+        """
+        self._stopping = True
+        broadcast_ids = list(self._jobs)
+        if self._resumer is not None:
+            self._resumer.cancel()
+        jobs = list(self._jobs.values())
+        if jobs:
+            _, pending = await asyncio.wait(jobs, timeout=self.stop_timeout)
+            for task in pending:
+                task.cancel()
+        await asyncio.gather(*(task for task in (self._resumer, *jobs) if task is not None), return_exceptions=True)
+        self._resumer = None
+        self._jobs.clear()
+        if broadcast_ids:
+            await self._release_leases(broadcast_ids)
+
+    async def _release_leases(self, broadcast_ids: List[int], attempts: int = 5) -> None:
+        """Снять аренду (с повторами: БД может быть занята записью других worker'ов)"""
+        for attempt in range(attempts):
+            try:
+                async with self._get_session_factory()() as db:
+                    await db.execute(
+                        update(TelegramBroadcast)
+                        .where(
+                            TelegramBroadcast.id.in_(broadcast_ids),
+                            TelegramBroadcast.status == "running",
+                            TelegramBroadcast.lease_owner == self.owner,
+                        )
+                        .values(lease_owner=None, lease_until=None)
+                    )
+                    await db.commit()
+                return
+            except Exception as exc:
+                if attempt + 1 == attempts:
+                    logger.error("Broadcast: аренда не снята, рассылки продолжатся после её истечения: %s", exc)
+                    return
+                await asyncio.sleep(0.2 * 2 ** attempt)
+
+
+broadcast_manager = BroadcastManager(
+    chunk_size=int(os.getenv("TELEGRAM_BROADCAST_CHUNK_SIZE", "50")),
+    lease_seconds=float(os.getenv("TELEGRAM_BROADCAST_LEASE", "120")),
+    max_recipients=int(os.getenv("TELEGRAM_BROADCAST_MAX_RECIPIENTS", "50000")),
+)
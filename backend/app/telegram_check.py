@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.auth import get_current_user
 from app.models import UserSettings
@@ -12,14 +13,14 @@ router = APIRouter()
 @router.post("/check-token")
 async def check_telegram_token(
     current_user = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Проверить токен Telegram бота
     """
     try:
         # Получаем настройки пользователя
-        settings = db.query(UserSettings).filter(UserSettings.user_id == current_user.id).first()
+        settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == current_user.id))
         
         if not settings or not settings.telegram_bot_token:
             raise HTTPException(status_code=400, detail="Telegram bot token не настроен")
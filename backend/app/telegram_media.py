@@ -0,0 +1,182 @@
+"""
+Telegram Media
+Потоковый перенос файлов Telegram (file_id) в медиатеку WordPress без повторных загрузок
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from telegram import Bot
+
+from app.database import Base
+from app.http_clients import HttpClientRegistry
+from app.models import TelegramMediaUpload
+from app.telegram_bots import telegram_bots
+from app.wordpress_tools import (
+    MediaTransferError,
+    WP_MEDIA_TIMEOUT,
+    WordPressAPIError,
+    wordpress_api_request,
+    wordpress_upload_stream,
+)
+
+logger = logging.getLogger(__name__)
+
+MEDIA_TABLES = [TelegramMediaUpload.__table__]
+
+
+class TelegramMediaImporter:
+    """
+    Перенос файла Telegram в /wp/v2/media
+
+    getFile даёт ссылку на файл, файл скачивается из Telegram и одновременно
+    отправляется в WordPress по chunk (wordpress_upload_stream) - целиком в памяти
+    не хранится. Загруженные файлы запоминаются по file_unique_id (он не зависит от бота
+    и повторной пересылки): тот же файл на тот же сайт возвращает уже созданный
+    медиафайл, пока тот не удалён из медиатеки.
+    """
+
+    def __init__(self, session_factory=None):
+        """
+        Args:
+            session_factory: Фабрика AsyncSession (по умолчанию AsyncSessionLocal)
+        """
+        self._session_factory = session_factory
+        # Ключ файла -> [lock, число ожидающих]; запись удаляется, когда файл никто не переносит
+        self._locks: Dict[Tuple[Any, str, str], List[Any]] = {}
+        self.uploaded = 0
+        self.deduplicated = 0
+        self.bytes = 0
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def ensure_tables(self) -> None:
+        """Таблица загруженных файлов создаётся при первом запуске (как таблицы рассылок)"""
+        async with self._get_session_factory()() as db:
+            conn = await db.connection()
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=MEDIA_TABLES, checkfirst=True
+            ))
+            await db.commit()
+
+    async def _existing_media(
+        self, db: AsyncSession, settings, user_id: Any, site: str, file_unique_id: str
+    ) -> Optional[Dict[str, Any]]:
+        """Ранее загруженный медиафайл, если он ещё есть в медиатеке"""
+        record = await db.scalar(select(TelegramMediaUpload).where(
+            TelegramMediaUpload.user_id == user_id,
+            TelegramMediaUpload.site == site,
+            TelegramMediaUpload.file_unique_id == file_unique_id,
+        ))
+        if record is None:
+            return None
+        try:
+            resp = await wordpress_api_request(
+                "GET", f"/wp-json/wp/v2/media/{record.media_id}", settings,
+                params={"_fields": "id,source_url"}, use_cache=False
+            )
+        except WordPressAPIError as exc:
+            if exc.status_code not in (404, 410):
+                raise
+            # Медиафайл удалён на сайте - загрузим заново
+            await db.execute(delete(TelegramMediaUpload).where(TelegramMediaUpload.id == record.id))
+            await db.commit()
+            return None
+        media = resp.json()
+        return {"id": media["id"], "source_url": media.get("source_url") or record.source_url, "size": record.size}
+
+    async def import_file(
+        self,
+        db: AsyncSession,
+        bot: Bot,
+        user_id: Any,
+        settings,
+        file_id: str,
+        title: Optional[str] = None,
+        filename: Optional[str] = None,
+        allowed_type_prefix: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Загрузить файл Telegram в медиатеку сайта пользователя
+
+        Args:
+            db: AsyncSession
+            bot: Бот пользователя
+            user_id: ID пользователя
+            settings: Настройки пользователя (WordPress)
+            file_id: file_id Telegram
+            title: Название медиафайла
+            filename: Имя файла (по умолчанию из пути файла в Telegram)
+            allowed_type_prefix: Допустимый префикс MIME типа (например, image/)
+
+        Returns:
+            media_id, source_url, bytes, seconds, duplicate, file_unique_id
+        """
+        file = await bot.get_file(file_id)
+        if not file.file_path or not file.file_path.startswith(("http://", "https://")):
+            raise MediaTransferError("Telegram не отдал ссылку на файл")
+        site = HttpClientRegistry.origin_of(settings.wordpress_url)
+        key = (user_id, site, file.file_unique_id)
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # Параллельный перенос того же файла ждёт первый и получает его результат
+            async with entry[0]:
+                existing = await self._existing_media(db, settings, user_id, site, file.file_unique_id)
+                if existing is not None:
+                    self.deduplicated += 1
+                    return {
+                        "media_id": existing["id"], "source_url": existing["source_url"],
+                        "bytes": existing["size"] or file.file_size or 0, "seconds": 0.0,
+                        "duplicate": True, "file_unique_id": file.file_unique_id,
+                    }
+
+                transfer: Dict[str, Any] = {}
+                started = time.monotonic()
+                client = telegram_bots.file_client(WP_MEDIA_TIMEOUT)
+                async with client.stream("GET", file.file_path) as source:
+                    media = await wordpress_upload_stream(
+                        settings, source, title=title, allowed_type_prefix=allowed_type_prefix,
+                        filename=filename, transfer=transfer,
+                    )
+                seconds = time.monotonic() - started
+                size = transfer.get("bytes") or file.file_size or 0
+                self.uploaded += 1
+                self.bytes += size
+
+                db.add(TelegramMediaUpload(
+                    user_id=user_id, site=site, file_unique_id=file.file_unique_id,
+                    media_id=media["id"], source_url=media.get("source_url"), size=size,
+                ))
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    # Тот же файл одновременно загрузил другой worker
+                    await db.rollback()
+                    logger.warning("TelegramMedia: %s уже загружен другим worker", file.file_unique_id)
+                return {
+                    "media_id": media["id"], "source_url": media.get("source_url"),
+                    "bytes": size, "seconds": seconds,
+                    "duplicate": False, "file_unique_id": file.file_unique_id,
+                }
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"uploaded": self.uploaded, "deduplicated": self.deduplicated, "bytes": self.bytes}
+
+
+telegram_media = TelegramMediaImporter()
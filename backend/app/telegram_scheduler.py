@@ -0,0 +1,263 @@
+"""
+Telegram Send Scheduler
+Планировщик исходящих запросов бота: лимиты Bot API на бота и на чат, повторы при RetryAfter
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from datetime import timedelta
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты (меньше - раньше): ответы на вызов инструмента обгоняют рассылки
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+
+class TokenBucket:
+    """Token bucket: rate токенов в секунду, не больше capacity"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько ждать до следующего токена (с учётом паузы RetryAfter)"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self) -> None:
+        self.tokens -= 1
+
+    def pause(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд (RetryAfter от Telegram)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def is_idle(self) -> bool:
+        return self.delay() <= 0 and self.tokens >= self.capacity
+
+
+def chat_key(chat_id: Any) -> Tuple[Any, bool]:
+    """
+    (ключ чата, это группа/канал)
+
+    Отрицательный chat_id и @username - группы и каналы, положительный - личный чат.
+    """
+    if isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit():
+        return chat_id.lower(), True
+    chat_id = int(chat_id)
+    return chat_id, chat_id < 0
+
+
+def retry_after_seconds(exc: RetryAfter) -> float:
+    # С v22.2 retry_after (int) объявлен устаревшим, внутри хранится timedelta
+    value = getattr(exc, "_retry_after", None) or exc.retry_after
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return float(value)
+
+
+class TelegramSendScheduler(BaseRateLimiter):
+    """
+    Планировщик исходящих запросов одного бота (rate limiter ExtBot)
+
+    Каждый запрос сначала ждёт токен своего чата (1 сообщение/сек в личном чате,
+    20/мин в группе), затем глобальный токен бота (~30/сек). Глобальные токены
+    раздаются по приоритету (PRIORITY_INTERACTIVE раньше PRIORITY_BULK), поэтому
+    ответы агенту не стоят в очереди за рассылкой. RetryAfter ставит на паузу чат
+    (или весь бот, если запрос без chat_id) и повторяет запрос до max_retries раз.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        chat_rate: float = 1.0,
+        group_rate_per_minute: float = 20.0,
+        max_retries: int = 3,
+        max_idle_chats: int = 10000,
+    ):
+        """
+        Args:
+            global_rate: Запросов в секунду на бота
+            chat_rate: Сообщений в секунду в один личный чат
+            group_rate_per_minute: Сообщений в минуту в одну группу/канал
+            max_retries: Повторов запроса после RetryAfter
+            max_idle_chats: После скольких чатов чистить простаивающие корзины
+        """
+        self.global_rate = global_rate
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate_per_minute / 60.0
+        self.max_retries = max_retries
+        self.max_idle_chats = max_idle_chats
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats: Dict[Any, TokenBucket] = {}
+        self._chat_locks: Dict[Any, asyncio.Lock] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self.chat_waiting = 0
+        self.in_flight = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    async def initialize(self) -> None:
+        return
+
+    async def shutdown(self) -> None:
+        if self._dispatcher:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        for _, _, future in self._waiters:
+            future.cancel()
+        self._waiters.clear()
+
+    # ---------- лимиты ----------
+
+    def _chat_bucket(self, key: Any, is_group: bool) -> TokenBucket:
+        bucket = self._chats.get(key)
+        if bucket is None:
+            if len(self._chats) >= self.max_idle_chats:
+                self._prune_chats()
+            bucket = TokenBucket(self.group_rate if is_group else self.chat_rate)
+            self._chats[key] = bucket
+            self._chat_locks[key] = asyncio.Lock()
+        return bucket
+
+    def _prune_chats(self) -> None:
+        for key in [key for key, bucket in self._chats.items()
+                    if bucket.is_idle() and not self._chat_locks[key].locked()]:
+            del self._chats[key]
+            del self._chat_locks[key]
+
+    async def _acquire_chat(self, key: Any, is_group: bool) -> None:
+        bucket = self._chat_bucket(key, is_group)
+        self.chat_waiting += 1
+        try:
+            # Lock сохраняет порядок сообщений в чате
+            async with self._chat_locks[key]:
+                while (delay := bucket.delay()) > 0:
+                    await asyncio.sleep(delay)
+                bucket.take()
+        finally:
+            self.chat_waiting -= 1
+
+    async def _acquire_global(self, priority: int) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    async def _dispatch(self) -> None:
+        """Раздача глобальных токенов ожидающим запросам по приоритету"""
+        while self._waiters:
+            delay = self._global.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._global.take()
+            future.set_result(None)
+
+    # ---------- BaseRateLimiter ----------
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Any]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[int],
+    ) -> Any:
+        """
+        Выполнить запрос Bot API в рамках лимитов
+
+        Args:
+            rate_limit_args: Приоритет запроса (по умолчанию PRIORITY_INTERACTIVE)
+        """
+        priority = PRIORITY_INTERACTIVE if rate_limit_args is None else int(rate_limit_args)
+        chat_id = data.get("chat_id")
+        key, is_group = chat_key(chat_id) if chat_id is not None else (None, False)
+
+        attempt = 0
+        while True:
+            if key is not None:
+                await self._acquire_chat(key, is_group)
+            await self._acquire_global(priority)
+            self.in_flight += 1
+            try:
+                result = await callback(*args, **kwargs)
+                self.sent += 1
+                return result
+            except RetryAfter as exc:
+                delay = retry_after_seconds(exc)
+                bucket = self._chats.get(key) if key is not None else self._global
+                bucket.pause(delay)
+                if attempt >= self.max_retries:
+                    self.failed += 1
+                    raise
+                attempt += 1
+                self.retries += 1
+                logger.warning("TelegramScheduler: %s for chat %s, retry %s in %ss", endpoint, key, attempt, delay)
+            finally:
+                self.in_flight -= 1
+
+    # ---------- метрики ----------
+
+    @property
+    def busy(self) -> bool:
+        """Есть запросы в очереди или в работе"""
+        return bool(self.in_flight or self.chat_waiting or self._waiters)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            Глубина очередей (по приоритетам и ожидающих токена чата), в работе, отправлено, повторы
+        """
+        queued: Dict[int, int] = {}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                queued[priority] = queued.get(priority, 0) + 1
+        return {
+            "queued": queued,
+            "chat_waiting": self.chat_waiting,
+            "in_flight": self.in_flight,
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "chats": len(self._chats),
+        }
+
+
+def create_send_scheduler() -> TelegramSendScheduler:
+    """Планировщик с лимитами из окружения"""
+    return TelegramSendScheduler(
+        global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", "30")),
+        chat_rate=float(os.getenv("TELEGRAM_CHAT_RATE", "1")),
+        group_rate_per_minute=float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20")),
+        max_retries=int(os.getenv("TELEGRAM_SEND_MAX_RETRIES", "3")),
+    )
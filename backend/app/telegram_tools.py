@@ -6,45 +6,45 @@ Telegram Bot Tools для MCP Platform
 from __future__ import annotations
 
 import logging
+import secrets
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from telegram import (
     Bot,
     BotCommand,
     InputMediaDocument,
     InputMediaPhoto,
     InputMediaVideo,
+    Update,
 )
 from telegram.error import TelegramError
 
+from app.auth import generate_telegram_webhook_url, invalidate_principal
 from app.database import get_db
+from app.helpers import decrypt_token, encrypt_token
 from app.models import UserSettings
-from app.helpers import decrypt_token
+from app.telegram_bots import telegram_bots
+from app.telegram_broadcast import broadcast_manager, broadcast_status, parse_chat_ids
+from app.telegram_media import telegram_media
+from app.telegram_updates import telegram_updates
+from app.wordpress_tools import MediaTransferError, validate_wordpress_settings
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-async def get_bot_from_settings(user_id: str, db: Session) -> Optional[Bot]:
-    """Получить экземпляр бота из настроек пользователя."""
+async def get_bot_from_settings(user_id: str, db: AsyncSession) -> Optional[Bot]:
+    """Получить экземпляр бота пользователя (из реестра, на общем пуле соединений)."""
     try:
-        settings = (
-            db.query(UserSettings)
-            .filter(UserSettings.user_id == user_id)
-            .first()
-        )
-        if not settings or not settings.telegram_bot_token:
-            return None
-
-        bot_token = decrypt_token(settings.telegram_bot_token)
-        return Bot(token=bot_token)
+        return await telegram_bots.get_bot(user_id, db)
     except Exception as exc:
         logger.error("Ошибка инициализации Telegram бота для пользователя %s: %s", user_id, exc)
         return None
 
-async def send_message(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_message(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен. Укажите токен в настройках."
@@ -79,7 +79,7 @@ async def send_message(params: Dict[str, Any], user_id: str, db: Session) -> str
         logger.error("Ошибка отправки сообщения: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_photo(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_photo(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -111,7 +111,7 @@ async def send_photo(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка отправки фото: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_document(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_document(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -143,7 +143,7 @@ async def send_document(params: Dict[str, Any], user_id: str, db: Session) -> st
         logger.error("Ошибка отправки документа: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_media_group(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_media_group(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -187,7 +187,7 @@ async def send_media_group(params: Dict[str, Any], user_id: str, db: Session) ->
         logger.error("Ошибка отправки media group: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_audio(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_audio(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -219,7 +219,7 @@ async def send_audio(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка отправки аудио: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_video(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_video(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -251,7 +251,7 @@ async def send_video(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка отправки видео: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_animation(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_animation(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -281,29 +281,51 @@ async def send_animation(params: Dict[str, Any], user_id: str, db: Session) -> s
         logger.error("Ошибка отправки анимации: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def set_webhook(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def set_webhook(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
 
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
+    # По умолчанию обновления принимает сам backend: /telegram/webhook/{connector_id}
     url = params.get("url")
+    if not url and settings and settings.mcp_connector_id:
+        url = generate_telegram_webhook_url(settings.mcp_connector_id)
     if not url:
         return "❌ Необходимо указать параметр url."
 
+    # Секрет сверяет приёмник webhook; без него обновления отклоняются, поэтому создаём
+    secret_token = params.get("secret_token")
+    try:
+        if not secret_token and settings and settings.telegram_webhook_secret:
+            secret_token = decrypt_token(settings.telegram_webhook_secret)
+        if not secret_token:
+            secret_token = secrets.token_urlsafe(32)
+        stored_secret = encrypt_token(secret_token)
+    except (ValueError, RuntimeError) as exc:
+        return f"❌ Секрет webhook недоступен: {exc}"
+
     try:
         result = await bot.set_webhook(
             url=url,
-            secret_token=params.get("secret_token"),
+            secret_token=secret_token,
             allowed_updates=params.get("allowed_updates"),
         )
-        return "✅ Webhook успешно установлен." if result else "⚠️ Не удалось установить webhook."
+        if not result:
+            return "⚠️ Не удалось установить webhook."
+        if settings:
+            settings.telegram_webhook_url = url
+            settings.telegram_webhook_secret = stored_secret
+            await db.commit()
+            invalidate_principal(settings.user_id)
+        return f"✅ Webhook успешно установлен: {url}"
     except TelegramError as exc:
         return f"❌ Ошибка Telegram API: {exc.message}"
     except Exception as exc:
         logger.error("Ошибка установки webhook: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def delete_webhook(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def delete_webhook(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -313,6 +335,14 @@ async def delete_webhook(params: Dict[str, Any], user_id: str, db: Session) -> s
     try:
         result = await bot.delete_webhook(drop_pending_updates=drop_pending)
         status = "✅ Webhook удалён." if result else "⚠️ Не удалось удалить webhook."
+        if result:
+            # telegram_get_updates снова опрашивает Bot API; буфер webhook больше не читается
+            settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
+            if settings and settings.telegram_webhook_url:
+                settings.telegram_webhook_url = None
+                await db.commit()
+                invalidate_principal(settings.user_id)
+            await telegram_updates.clear(db, user_id)
         if drop_pending:
             status += " (Подписанные обновления отменены)"
         return status
@@ -322,7 +352,7 @@ async def delete_webhook(params: Dict[str, Any], user_id: str, db: Session) -> s
         logger.error("Ошибка удаления webhook: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def get_webhook_info(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def get_webhook_info(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -341,7 +371,7 @@ async def get_webhook_info(params: Dict[str, Any], user_id: str, db: Session) ->
         logger.error("Ошибка получения webhook info: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def get_bot_info(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def get_bot_info(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -361,7 +391,46 @@ async def get_bot_info(params: Dict[str, Any], user_id: str, db: Session) -> str
         logger.error("Ошибка получения информации о боте: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def get_updates(params: Dict[str, Any], user_id: str, db: Session) -> str:
+def format_updates(updates: List[Update], source: str) -> str:
+    """Краткая сводка обновлений для ответа инструмента"""
+    summary_lines = [f"Всего обновлений: {len(updates)} ({source})"]
+    for update in updates[:10]:
+        if update.message:
+            author = update.message.from_user
+            author_text = f"@{author.username}" if author and author.username else "пользователь"
+            summary_lines.append(
+                f"• Message {update.update_id}: {author_text} → {update.message.chat.id}"
+            )
+        elif update.callback_query:
+            summary_lines.append(
+                f"• Callback {update.update_id}: {update.callback_query.data}"
+            )
+        else:
+            summary_lines.append(f"• Update {update.update_id}: тип {update.to_dict().keys()}")
+
+    if len(updates) > 10:
+        summary_lines.append("… показаны первые 10 обновлений …")
+    summary_lines.append(f"Следующий offset: {updates[-1].update_id + 1}")
+
+    return "\n".join(summary_lines)
+
+async def get_updates(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
+    try:
+        # С webhook обновления уже лежат в локальном буфере - без запроса к Bot API
+        webhook_url = await db.scalar(
+            select(UserSettings.telegram_webhook_url).where(UserSettings.user_id == user_id)
+        )
+        if webhook_url:
+            payloads = await telegram_updates.read(
+                db, user_id, offset=params.get("offset"), limit=params.get("limit") or 100
+            )
+            if not payloads:
+                return "ℹ️ Обновлений нет."
+            return format_updates([Update.de_json(data, None) for data in payloads], "webhook")
+    except Exception as exc:
+        logger.error("Ошибка чтения буфера обновлений: %s", exc, exc_info=True)
+        return f"❌ Внутренняя ошибка: {exc}"
+
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -374,33 +443,14 @@ async def get_updates(params: Dict[str, Any], user_id: str, db: Session) -> str:
         )
         if not updates:
             return "ℹ️ Обновлений нет."
-
-        summary_lines = [f"Всего обновлений: {len(updates)}"]
-        for update in updates[:10]:
-            if update.message:
-                author = update.message.from_user
-                author_text = f"@{author.username}" if author and author.username else "пользователь"
-                summary_lines.append(
-                    f"• Message {update.update_id}: {author_text} → {update.message.chat.id}"
-                )
-            elif update.callback_query:
-                summary_lines.append(
-                    f"• Callback {update.update_id}: {update.callback_query.data}"
-                )
-            else:
-                summary_lines.append(f"• Update {update.update_id}: тип {update.to_dict().keys()}")
-
-        if len(updates) > 10:
-            summary_lines.append("… показаны первые 10 обновлений …")
-
-        return "\n".join(summary_lines)
+        return format_updates(list(updates), "getUpdates")
     except TelegramError as exc:
         return f"❌ Ошибка Telegram API: {exc.message}"
     except Exception as exc:
         logger.error("Ошибка получения обновлений: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def set_commands(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def set_commands(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -427,7 +477,7 @@ async def set_commands(params: Dict[str, Any], user_id: str, db: Session) -> str
         logger.error("Ошибка установки команд: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def delete_message(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def delete_message(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -447,7 +497,7 @@ async def delete_message(params: Dict[str, Any], user_id: str, db: Session) -> s
         logger.error("Ошибка удаления сообщения: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def edit_message(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def edit_message(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -474,7 +524,7 @@ async def edit_message(params: Dict[str, Any], user_id: str, db: Session) -> str
         logger.error("Ошибка редактирования сообщения: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_poll(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_poll(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -501,7 +551,7 @@ async def send_poll(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка отправки опроса: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def stop_poll(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def stop_poll(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -522,7 +572,7 @@ async def stop_poll(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка остановки опроса: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def answer_callback_query(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def answer_callback_query(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -549,7 +599,7 @@ async def answer_callback_query(params: Dict[str, Any], user_id: str, db: Sessio
         logger.error("Ошибка answer_callback_query: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def send_chat_action(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def send_chat_action(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -569,7 +619,7 @@ async def send_chat_action(params: Dict[str, Any], user_id: str, db: Session) ->
         logger.error("Ошибка отправки chat_action: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def get_user_profile_photos(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def get_user_profile_photos(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -598,7 +648,7 @@ async def get_user_profile_photos(params: Dict[str, Any], user_id: str, db: Sess
         logger.error("Ошибка получения user_profile_photos: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
-async def get_file(params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def get_file(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     bot = await get_bot_from_settings(user_id, db)
     if not bot:
         return "❌ Telegram бот не настроен."
@@ -621,6 +671,112 @@ async def get_file(params: Dict[str, Any], user_id: str, db: Session) -> str:
         logger.error("Ошибка получения файла: %s", exc, exc_info=True)
         return f"❌ Внутренняя ошибка: {exc}"
 
+async def file_to_wordpress(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
+    bot = await get_bot_from_settings(user_id, db)
+    if not bot:
+        return "❌ Telegram бот не настроен."
+
+    file_id = params.get("file_id")
+    if not file_id:
+        return "❌ Необходимо указать file_id."
+
+    settings = await db.scalar(select(UserSettings).where(UserSettings.user_id == user_id))
+    is_valid, error_msg = await validate_wordpress_settings(settings)
+    if not is_valid:
+        return f"❌ {error_msg}"
+
+    try:
+        result = await telegram_media.import_file(
+            db, bot, user_id, settings, file_id,
+            title=params.get("title"), filename=params.get("filename"),
+        )
+    except TelegramError as exc:
+        return f"❌ Ошибка Telegram API: {exc.message}"
+    except MediaTransferError as exc:
+        return f"❌ Файл не перенесён: {exc}"
+    except Exception as exc:
+        logger.error("Ошибка переноса файла в WordPress: %s", exc, exc_info=True)
+        return f"❌ Внутренняя ошибка: {exc}"
+
+    size_mb = result["bytes"] / (1024 * 1024)
+    if result["duplicate"]:
+        return (
+            "♻️ Файл уже есть в медиатеке (загружен ранее):\n"
+            f"ID: {result['media_id']}\n"
+            f"URL: {result['source_url']}\n"
+            f"Размер: {size_mb:.2f} МБ"
+        )
+    seconds = max(result["seconds"], 0.001)
+    return (
+        "✅ Файл перенесён в медиатеку WordPress:\n"
+        f"ID: {result['media_id']}\n"
+        f"URL: {result['source_url']}\n"
+        f"Размер: {size_mb:.2f} МБ за {result['seconds']:.1f} с ({size_mb / seconds:.2f} МБ/с)"
+    )
+
+async def broadcast(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
+    bot = await get_bot_from_settings(user_id, db)
+    if not bot:
+        return "❌ Telegram бот не настроен."
+
+    text = params.get("text")
+    audience = params.get("audience")
+    chat_ids = parse_chat_ids(params.get("chat_ids"))
+
+    if not text:
+        return "❌ Необходимо указать text."
+    if not chat_ids and audience:
+        chat_ids = await broadcast_manager.load_audience(db, user_id, audience)
+        if chat_ids is None:
+            return f"❌ Аудитория '{audience}' не найдена."
+    if not chat_ids:
+        return "❌ Необходимо указать chat_ids или audience."
+
+    try:
+        if params.get("chat_ids") and audience:
+            await broadcast_manager.save_audience(db, user_id, audience, chat_ids)
+        job = await broadcast_manager.create(db, user_id, chat_ids, params)
+        return (
+            f"✅ Рассылка #{job.id} запущена\n"
+            f"Получателей: {job.total}\n"
+            "Ход рассылки приходит уведомлениями, статус: telegram_broadcast_status"
+        )
+    except ValueError as exc:
+        return f"❌ {exc}"
+    except Exception as exc:
+        logger.error("Ошибка запуска рассылки: %s", exc, exc_info=True)
+        return f"❌ Внутренняя ошибка: {exc}"
+
+async def broadcast_status_tool(params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
+    broadcast_id = params.get("broadcast_id")
+    if not broadcast_id:
+        return "❌ Необходимо указать broadcast_id."
+
+    try:
+        broadcast_id = int(broadcast_id)
+    except (TypeError, ValueError):
+        return "❌ broadcast_id должен быть числом."
+
+    job = await broadcast_manager.get(db, user_id, broadcast_id)
+    if not job:
+        return f"❌ Рассылка #{broadcast_id} не найдена."
+    if params.get("cancel"):
+        await broadcast_manager.cancel(db, job)
+
+    status = broadcast_status(job)
+    result = (
+        f"Рассылка #{job.id}: {status['status']}\n"
+        f"Отправлено: {status['sent']}/{status['total']}\n"
+        f"Ошибок: {status['failed']}\n"
+        f"В очереди: {status['pending']}"
+    )
+    if job.error:
+        result += f"\nОшибка: {job.error}"
+    failed = await broadcast_manager.failed_recipients(db, job.id)
+    if failed:
+        result += "\n\nНе доставлено:\n" + "\n".join(f"{chat_id}: {error}" for chat_id, error in failed)
+    return result
+
 TOOLS_MAP = {
     "telegram_send_message": send_message,
     "telegram_send_photo": send_photo,
@@ -643,10 +799,13 @@ TOOLS_MAP = {
     "telegram_send_chat_action": send_chat_action,
     "telegram_get_user_profile_photos": get_user_profile_photos,
     "telegram_get_file": get_file,
+    "telegram_file_to_wordpress": file_to_wordpress,
+    "telegram_broadcast": broadcast,
+    "telegram_broadcast_status": broadcast_status_tool,
 }
 
 
-async def handle_telegram_tool(tool_name: str, params: Dict[str, Any], user_id: str, db: Session) -> str:
+async def handle_telegram_tool(tool_name: str, params: Dict[str, Any], user_id: str, db: AsyncSession) -> str:
     """Маршрутизация Telegram инструментов."""
     handler = TOOLS_MAP.get(tool_name)
     if not handler:
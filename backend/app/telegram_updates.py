@@ -0,0 +1,207 @@
+"""
+Telegram Updates
+Приём обновлений через webhook: проверка секрета и ограниченный буфер последних обновлений пользователя
+"""
+
+from __future__ import annotations
+
+import hmac
+import json
+import logging
+import os
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import Base
+from app.helpers import TTLCache, decrypt_token
+from app.models import TelegramUpdate
+
+logger = logging.getLogger(__name__)
+
+UPDATE_TABLES = [TelegramUpdate.__table__]
+
+# Заголовок с secret_token, переданным в setWebhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def verify_webhook_secret(stored_secret: Optional[str], received: Optional[str]) -> bool:
+    """
+    Проверка секрета webhook
+
+    Args:
+        stored_secret: telegram_webhook_secret из настроек (зашифрован)
+        received: Значение заголовка X-Telegram-Bot-Api-Secret-Token
+
+    Returns:
+        False, если секрет не настроен, не расшифровывается или не совпадает
+    """
+    if not stored_secret or not received:
+        return False
+    try:
+        secret = decrypt_token(stored_secret)
+    except (ValueError, RuntimeError) as exc:
+        logger.warning("TelegramUpdates: секрет webhook не расшифрован: %s", exc)
+        return False
+    return hmac.compare_digest(secret.encode("utf-8"), received.encode("utf-8"))
+
+
+class SecretRefreshThrottle:
+    """
+    Ограничение повторной сверки секрета webhook с БД
+
+    Секрет сверяется с кэшированными настройками; при несовпадении настройки
+    перечитываются из БД (секрет мог смениться в другом worker), но не чаще раза
+    в interval_seconds на коннектор - поток запросов с неверным секретом не
+    превращается в поток запросов к БД.
+    """
+
+    def __init__(self, interval_seconds: float = 30.0, max_size: int = 10000):
+        """
+        Args:
+            interval_seconds: Минимальный интервал между чтениями из БД для одного коннектора
+            max_size: Сколько коннекторов помнить
+        """
+        self._recent = TTLCache(max_size=max_size, ttl_seconds=interval_seconds)
+        self.refreshed = 0
+        self.throttled = 0
+
+    def allow(self, connector_id: str) -> bool:
+        """Можно ли сейчас перечитать настройки коннектора из БД"""
+        if connector_id in self._recent:
+            self.throttled += 1
+            return False
+        self._recent.set(connector_id, True)
+        self.refreshed += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {"refreshed": self.refreshed, "throttled": self.throttled}
+
+
+class TelegramUpdateStore:
+    """
+    Буфер обновлений, принятых webhook'ом
+
+    Хранится в БД, а не в памяти worker'а: Telegram доставляет webhook в любой
+    worker, а telegram_get_updates может прийти в другой. На пользователя
+    остаются последние capacity обновлений - старые удаляются раз в trim_every
+    обновлений. Чтение повторяет семантику getUpdates: возвращаются обновления
+    с update_id >= offset, всё, что раньше offset, считается подтверждённым и удаляется.
+    """
+
+    def __init__(self, capacity: int = 1000, trim_every: int = 50, session_factory=None):
+        """
+        Args:
+            capacity: Сколько последних обновлений хранить на пользователя
+            trim_every: Как часто (в обновлениях) удалять вышедшие за capacity
+            session_factory: Фабрика AsyncSession (по умолчанию AsyncSessionLocal)
+        """
+        self.capacity = capacity
+        self.trim_every = max(1, trim_every)
+        self._session_factory = session_factory
+        self.received = 0
+        self.duplicates = 0
+
+    def _get_session_factory(self):
+        if self._session_factory is None:
+            from app.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory
+
+    async def ensure_tables(self) -> None:
+        """Таблица буфера создаётся при первом запуске (как таблицы рассылок)"""
+        async with self._get_session_factory()() as db:
+            conn = await db.connection()
+            await conn.run_sync(lambda sync_conn: Base.metadata.create_all(
+                sync_conn, tables=UPDATE_TABLES, checkfirst=True
+            ))
+            await db.commit()
+
+    async def push(self, db: AsyncSession, user_id: int, update: Dict[str, Any]) -> bool:
+        """
+        Сохранить обновление
+
+        Returns:
+            False, если обновление с таким update_id уже сохранено (повторная доставка)
+        """
+        update_id = int(update["update_id"])
+        db.add(TelegramUpdate(
+            user_id=user_id, update_id=update_id, payload=json.dumps(update, ensure_ascii=False)
+        ))
+        try:
+            await db.flush()
+        except IntegrityError:
+            await db.rollback()
+            self.duplicates += 1
+            return False
+        # update_id идут подряд: обрезка примерно раз в trim_every обновлений без счётчиков в памяти
+        if update_id % self.trim_every == 0:
+            await self._trim(db, user_id)
+        await db.commit()
+        self.received += 1
+        return True
+
+    async def _trim(self, db: AsyncSession, user_id: int) -> None:
+        boundary = await db.scalar(
+            select(TelegramUpdate.update_id)
+            .where(TelegramUpdate.user_id == user_id)
+            .order_by(TelegramUpdate.update_id.desc())
+            .offset(self.capacity)
+            .limit(1)
+        )
+        if boundary is not None:
+            await db.execute(delete(TelegramUpdate).where(
+                TelegramUpdate.user_id == user_id, TelegramUpdate.update_id <= boundary
+            ))
+
+    async def read(
+        self, db: AsyncSession, user_id: int, offset: Optional[int] = None, limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        Обновления пользователя по возрастанию update_id
+
+        Args:
+            offset: Первый нужный update_id; более ранние удаляются как подтверждённые
+            limit: Максимум обновлений (1-100, как в getUpdates)
+        """
+        limit = min(max(int(limit or 100), 1), 100)
+        query = select(TelegramUpdate.payload).where(TelegramUpdate.user_id == user_id)
+        if offset is not None:
+            offset = int(offset)
+            await db.execute(delete(TelegramUpdate).where(
+                TelegramUpdate.user_id == user_id, TelegramUpdate.update_id < offset
+            ))
+            await db.commit()
+            query = query.where(TelegramUpdate.update_id >= offset)
+        rows = await db.scalars(query.order_by(TelegramUpdate.update_id).limit(limit))
+        return [json.loads(payload) for payload in rows]
+
+    async def clear(self, db: AsyncSession, user_id: int) -> int:
+        """
+        Удалить буфер пользователя (после удаления webhook обновления снова читаются из Bot API)
+
+        Returns:
+            Количество удалённых обновлений
+        """
+        result = await db.execute(delete(TelegramUpdate).where(TelegramUpdate.user_id == user_id))
+        await db.commit()
+        return result.rowcount or 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received, "duplicates": self.duplicates, "capacity": self.capacity,
+            "secret_refresh": webhook_secret_refresh.stats(),
+        }
+
+
+telegram_updates = TelegramUpdateStore(
+    capacity=int(os.getenv("TELEGRAM_UPDATES_BUFFER", "1000")),
+    trim_every=int(os.getenv("TELEGRAM_UPDATES_TRIM_EVERY", "50")),
+)
+
+webhook_secret_refresh = SecretRefreshThrottle(
+    interval_seconds=float(os.getenv("TELEGRAM_WEBHOOK_SECRET_REFRESH_INTERVAL", "30")),
+)
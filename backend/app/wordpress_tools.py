@@ -2,16 +2,42 @@
 WordPress MCP Tools
 Все инструменты для работы с WordPress REST API
 """
+import asyncio
+import html
+from contextlib import asynccontextmanager
 import httpx
-from typing import Optional, Dict, Any, List
+import mimetypes
+import os
+from typing import Optional, Dict, Any, List, AsyncIterator
+from urllib.parse import quote, unquote, urlparse
 from .models import UserSettings
-from .helpers import sanitize_url, is_valid_url, log_api_call
+from .helpers import sanitize_url, is_valid_url, log_api_call, TTLCache
+from .http_clients import wordpress_cache, wordpress_http
+from .bulk_executor import ProgressCallback, wordpress_bulk
+from .content_index import content_index
 import logging
 import time
 
 logger = logging.getLogger(__name__)
 
 
+class WordPressAPIError(Exception):
+    """Ошибка HTTP ответа WordPress REST API (со статусом для повторов)"""
+    
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After в секундах (формат HTTP-date не поддерживается)"""
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
 async def validate_wordpress_settings(settings: UserSettings) -> tuple[bool, str]:
     """Валидация настроек WordPress"""
     if not settings.wordpress_url:
@@ -34,7 +60,9 @@ async def wordpress_api_call(
     json_data: Optional[Dict[str, Any]] = None,
     params: Optional[Dict[str, Any]] = None,
     files: Optional[Dict[str, Any]] = None,
-    timeout: int = 30
+    timeout: int = 30,
+    content: Optional[AsyncIterator[bytes]] = None,
+    headers: Optional[Dict[str, str]] = None
 ) -> Dict[str, Any]:
     """
     Универсальный метод для вызова WordPress REST API
@@ -47,10 +75,38 @@ async def wordpress_api_call(
         params: Query параметры
         files: Файлы для загрузки
         timeout: Таймаут запроса
+        content: Потоковое тело POST запроса (вместо json_data/files)
+        headers: Дополнительные заголовки POST запроса с content
     
     Returns:
         Dict с результатом или raises Exception
     """
+    resp = await wordpress_api_request(
+        method, endpoint, settings, json_data, params, files, timeout, content=content, headers=headers
+    )
+    return resp.json()
+
+
+async def wordpress_api_request(
+    method: str,
+    endpoint: str,
+    settings: UserSettings,
+    json_data: Optional[Dict[str, Any]] = None,
+    params: Optional[Dict[str, Any]] = None,
+    files: Optional[Dict[str, Any]] = None,
+    timeout: int = 30,
+    content: Optional[AsyncIterator[bytes]] = None,
+    headers: Optional[Dict[str, str]] = None,
+    use_cache: bool = True
+) -> httpx.Response:
+    """
+    Вызов WordPress REST API с доступом к заголовкам ответа (X-WP-Total и т.п.)
+    
+    Аргументы как у wordpress_api_call, use_cache=False - GET мимо кэша ответов.
+    
+    Returns:
+        Успешный httpx.Response или raises Exception
+    """
     wp_url = sanitize_url(settings.wordpress_url)
     wp_user = settings.wordpress_username
     wp_pass = settings.wordpress_password
@@ -60,13 +116,30 @@ async def wordpress_api_call(
     start_time = time.time()
     
     try:
-        async with httpx.AsyncClient() as client:
-            auth = (wp_user, wp_pass) if wp_user and wp_pass else None
-            
+        auth = (wp_user, wp_pass) if wp_user and wp_pass else None
+        
+        # GET: свежая запись кэша без запроса, устаревшая - условный запрос
+        cache_key = cached = None
+        if method == "GET" and use_cache:
+            cache_key = wordpress_cache.make_key(
+                wp_url, endpoint, wordpress_cache.credential_of(wp_user, wp_pass), params
+            )
+            cached = wordpress_cache.lookup(cache_key)
+            if cached is not None and cached.is_fresh():
+                wordpress_cache.record_hit(cached)
+                return cached.to_response()
+        
+        # Общий пул соединений для origin сайта (keep-alive, HTTP/2)
+        async with wordpress_http.client(wp_url) as client:
             if method == "GET":
-                resp = await client.get(full_url, params=params, auth=auth, timeout=timeout)
+                validators = cached.validators() if cached is not None else None
+                resp = await client.get(full_url, params=params, headers=validators, auth=auth, timeout=timeout)
             elif method == "POST":
-                if files:
+                if content is not None:
+                    resp = await client.post(
+                        full_url, content=content, params=params, headers=headers, auth=auth, timeout=timeout
+                    )
+                elif files:
                     resp = await client.post(full_url, files=files, auth=auth, timeout=timeout)
                 else:
                     resp = await client.post(full_url, json=json_data, auth=auth, timeout=timeout)
@@ -74,16 +147,28 @@ async def wordpress_api_call(
                 resp = await client.delete(full_url, params=params, auth=auth, timeout=timeout)
             else:
                 raise ValueError(f"Unsupported HTTP method: {method}")
-            
-            duration_ms = (time.time() - start_time) * 1000
-            log_api_call("WordPress", endpoint, resp.status_code, duration_ms)
-            
-            resp.raise_for_status()
-            return resp.json()
+        
+        duration_ms = (time.time() - start_time) * 1000
+        log_api_call("WordPress", endpoint, resp.status_code, duration_ms)
+        
+        if resp.status_code == 304 and cached is not None:
+            wordpress_cache.record_not_modified(cache_key, cached)
+            return cached.to_response(resp.request)
+        
+        resp.raise_for_status()
+        if cache_key is not None:
+            wordpress_cache.store(cache_key, resp)
+        elif method != "GET":
+            wordpress_cache.invalidate(wp_url, endpoint)
+        return resp
             
     except httpx.HTTPStatusError as e:
         logger.error(f"WordPress API HTTP error: {e.response.status_code} - {e.response.text}")
-        raise Exception(f"WordPress API ошибка {e.response.status_code}: {e.response.text[:200]}")
+        raise WordPressAPIError(
+            f"WordPress API ошибка {e.response.status_code}: {e.response.text[:200]}",
+            e.response.status_code,
+            parse_retry_after(e.response.headers.get("Retry-After")),
+        )
     except httpx.RequestError as e:
         logger.error(f"WordPress API request error: {str(e)}")
         raise Exception(f"Ошибка соединения с WordPress: {str(e)}")
@@ -92,21 +177,365 @@ async def wordpress_api_call(
         raise
 
 
+# ==================== PAGINATION ====================
+
+# WordPress не отдаёт больше 100 элементов на страницу
+WP_MAX_PER_PAGE = 100
+# Жёсткий лимит элементов для запросов "all"
+WP_PAGINATE_MAX_ITEMS = int(os.getenv("WP_PAGINATE_MAX_ITEMS", "2000"))
+# Одновременных запросов страниц после первой
+WP_PAGINATE_CONCURRENCY = int(os.getenv("WP_PAGINATE_CONCURRENCY", "4"))
+
+
+class WordPressCollection:
+    """
+    Async-итератор по коллекции REST API (posts, pages, media, ...) с автопагинацией
+    
+    Первая страница даёт X-WP-Total / X-WP-TotalPages, остальные страницы
+    запрашиваются параллельно (до concurrency), а элементы отдаются по порядку.
+    _fields сокращает ответы до нужных полей.
+    """
+    
+    def __init__(
+        self,
+        settings: UserSettings,
+        endpoint: str,
+        params: Optional[Dict[str, Any]] = None,
+        fields: Optional[List[str]] = None,
+        limit: int = 10,
+        concurrency: int = WP_PAGINATE_CONCURRENCY,
+        use_cache: bool = True,
+        first_page: int = 1,
+    ):
+        """
+        Args:
+            settings: Настройки пользователя
+            endpoint: Endpoint коллекции (например, /wp-json/wp/v2/posts)
+            params: Фильтры запроса (status, post, search, ...)
+            fields: Поля элементов для _fields (None - все поля)
+            limit: Максимум элементов (не больше WP_PAGINATE_MAX_ITEMS)
+            concurrency: Параллельных запросов страниц
+            use_cache: Брать страницы из кэша GET ответов
+            first_page: С какой страницы (размера per_page) начинать
+        """
+        self.settings = settings
+        self.endpoint = endpoint
+        self.params = dict(params or {})
+        if fields:
+            self.params["_fields"] = ",".join(fields)
+        self.limit = max(1, min(limit, WP_PAGINATE_MAX_ITEMS))
+        self.per_page = min(self.limit, WP_MAX_PER_PAGE)
+        self.concurrency = max(1, concurrency)
+        self.use_cache = use_cache
+        self.first_page = max(1, first_page)
+        # Заполняются после первой страницы
+        self.total: Optional[int] = None
+        self.total_pages: Optional[int] = None
+    
+    async def _fetch_page(self, page: int) -> httpx.Response:
+        return await wordpress_api_request(
+            "GET",
+            self.endpoint,
+            self.settings,
+            params={**self.params, "per_page": self.per_page, "page": page},
+            use_cache=self.use_cache
+        )
+    
+    def __aiter__(self):
+        return self._iterate()
+    
+    async def _iterate(self):
+        first = await self._fetch_page(self.first_page)
+        items = first.json()
+        self.total = int(first.headers.get("X-WP-Total", len(items)))
+        self.total_pages = int(first.headers.get("X-WP-TotalPages", 1))
+        
+        remaining = self.limit
+        for item in items[:remaining]:
+            yield item
+        remaining -= min(len(items), remaining)
+        
+        last_page = min(self.total_pages, self.first_page - 1 + -(-self.limit // self.per_page))
+        if remaining <= 0 or last_page <= self.first_page:
+            return
+        
+        slots = asyncio.Semaphore(self.concurrency)
+        
+        async def fetch(page: int):
+            async with slots:
+                return (await self._fetch_page(page)).json()
+        
+        tasks = [asyncio.create_task(fetch(page)) for page in range(self.first_page + 1, last_page + 1)]
+        try:
+            for task in tasks:
+                for item in (await task)[:remaining]:
+                    yield item
+                    remaining -= 1
+                if remaining <= 0:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def collect(self) -> List[Dict[str, Any]]:
+        """Все элементы списком"""
+        return [item async for item in self]
+
+
+def collection_limit(tool_args: Dict[str, Any], default: int) -> int:
+    """
+    Сколько элементов запросить: per_page, либо all=true (до max_items и WP_PAGINATE_MAX_ITEMS)
+    """
+    if tool_args.get("all") or tool_args.get("per_page") == "all":
+        return int(tool_args.get("max_items") or WP_PAGINATE_MAX_ITEMS)
+    return int(tool_args.get("per_page") or default)
+
+
+def collection_header(collection: WordPressCollection, found: int, noun: str) -> str:
+    """Заголовок списка с общим количеством на сайте, если показаны не все элементы"""
+    result = f"Найдено {found} {noun}"
+    if collection.total is not None and collection.total > found:
+        result += f" (всего на сайте: {collection.total})"
+    return result + ":\n\n"
+
+
+# ==================== TAXONOMIES ====================
+
+# Таксономии постов: имя аргумента -> endpoint
+TAXONOMY_ENDPOINTS = {
+    "categories": "/wp-json/wp/v2/categories",
+    "tags": "/wp-json/wp/v2/tags",
+}
+
+
+def term_key(name: str) -> str:
+    """Ключ сравнения имён терминов (WordPress отдаёт name с HTML-сущностями)"""
+    return " ".join(html.unescape(str(name)).split()).casefold()
+
+
+class TaxonomyCache:
+    """
+    Словарь имя -> ID рубрик и тегов по сайту
+    
+    Загружается лениво (все термины одной автопагинацией) и поддерживается
+    инструментами записи рубрик и тегов, поэтому create/update поста с именами
+    терминов не требует предварительного wordpress_get_tags/get_categories.
+    Запись живёт ttl_seconds: термины, изменённые в админке сайта, подтянутся
+    после её истечения или при промахе по имени.
+    """
+    
+    def __init__(self, ttl_seconds: float = 300.0, max_sites: int = 500, create_concurrency: int = 2):
+        """
+        Args:
+            ttl_seconds: Время жизни словаря сайта
+            max_sites: Максимум словарей (LRU)
+            create_concurrency: Одновременных запросов создания терминов одного resolve
+        """
+        self._terms = TTLCache(max_size=max_sites * len(TAXONOMY_ENDPOINTS), ttl_seconds=ttl_seconds)
+        self.create_concurrency = create_concurrency
+        # Ключ словаря -> [lock, число ожидающих]; запись удаляется, когда замок никому не нужен
+        self._locks: Dict[tuple, List[Any]] = {}
+        self.loads = 0
+        self.created = 0
+    
+    @staticmethod
+    def _key(settings: UserSettings, taxonomy: str) -> tuple:
+        return (wordpress_http.origin_of(settings.wordpress_url), settings.wordpress_username, taxonomy)
+    
+    @asynccontextmanager
+    async def _locked(self, key: tuple):
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._locks.pop(key, None)
+    
+    async def _load(self, settings: UserSettings, taxonomy: str) -> Dict[str, int]:
+        terms = await WordPressCollection(
+            settings,
+            TAXONOMY_ENDPOINTS[taxonomy],
+            fields=["id", "name"],
+            limit=WP_PAGINATE_MAX_ITEMS,
+            use_cache=False
+        ).collect()
+        self.loads += 1
+        # Для одноимённых рубрик с разными родителями берётся первая
+        by_name: Dict[str, int] = {}
+        for term in terms:
+            by_name.setdefault(term_key(term["name"]), term["id"])
+        self._terms.set(self._key(settings, taxonomy), by_name)
+        return by_name
+    
+    async def get_terms(self, settings: UserSettings, taxonomy: str) -> Dict[str, int]:
+        """Словарь ключ имени -> ID (загружается при первом обращении)"""
+        key = self._key(settings, taxonomy)
+        by_name = self._terms.get(key)
+        if by_name is None:
+            async with self._locked(key):
+                by_name = await self._get_terms_locked(settings, taxonomy, key)
+        return by_name
+    
+    async def _get_terms_locked(self, settings: UserSettings, taxonomy: str, key: tuple) -> Dict[str, int]:
+        """get_terms для вызова под замком key (asyncio.Lock не реентерабелен)"""
+        by_name = self._terms.get(key)
+        if by_name is None:
+            by_name = await self._load(settings, taxonomy)
+        return by_name
+    
+    def remember(self, settings: UserSettings, taxonomy: str, term: Dict[str, Any]) -> None:
+        """Учесть созданный или переименованный термин (если словарь загружен)"""
+        by_name = self._terms.get(self._key(settings, taxonomy))
+        if by_name is None:
+            return
+        self._drop_id(by_name, term["id"])
+        by_name[term_key(term["name"])] = term["id"]
+    
+    def forget(self, settings: UserSettings, taxonomy: str, term_id: int) -> None:
+        """Убрать удалённый термин"""
+        by_name = self._terms.get(self._key(settings, taxonomy))
+        if by_name is not None:
+            self._drop_id(by_name, term_id)
+    
+    @staticmethod
+    def _drop_id(by_name: Dict[str, int], term_id: Any) -> None:
+        for name in [name for name, value in by_name.items() if str(value) == str(term_id)]:
+            del by_name[name]
+    
+    async def resolve(self, settings: UserSettings, taxonomy: str, values: List[Any]) -> tuple:
+        """
+        Преобразовать ID и имена терминов в ID, создав недостающие
+        
+        Args:
+            settings: Настройки пользователя
+            taxonomy: categories или tags
+            values: ID (числа или строки из цифр) и имена
+        
+        Returns:
+            (список ID в порядке values, список имён созданных терминов)
+        """
+        names = [value for value in values if not str(value).strip().isdigit()]
+        if not names:
+            return list(dict.fromkeys(int(value) for value in values)), []
+        
+        key = self._key(settings, taxonomy)
+        by_name = await self.get_terms(settings, taxonomy)
+        created: List[str] = []
+        if any(term_key(name) not in by_name for name in names):
+            # Под замком: параллельные публикации не создают один термин дважды
+            async with self._locked(key):
+                by_name = await self._get_terms_locked(settings, taxonomy, key)
+                missing = list(dict.fromkeys(
+                    " ".join(str(name).split()) for name in names if term_key(name) not in by_name
+                ))
+                if missing:
+                    by_name, created = await self._create_terms(settings, taxonomy, missing, by_name)
+        
+        ids = []
+        for value in values:
+            if str(value).strip().isdigit():
+                ids.append(int(value))
+            else:
+                ids.append(by_name[term_key(value)])
+        return list(dict.fromkeys(ids)), created
+    
+    async def _create_terms(
+        self,
+        settings: UserSettings,
+        taxonomy: str,
+        names: List[str],
+        by_name: Dict[str, int]
+    ) -> tuple:
+        """
+        Создать термины одним пакетом (параллельно, не больше create_concurrency)
+        
+        Не через wordpress_bulk: resolve вызывается и из элементов wordpress_bulk_*,
+        которые уже занимают все слоты сайта - вложенный wordpress_bulk.run ждал бы их вечно.
+        
+        Returns:
+            (актуальный словарь, имена созданных терминов)
+        """
+        semaphore = asyncio.Semaphore(self.create_concurrency)
+        
+        async def create_term(name):
+            async with semaphore:
+                try:
+                    term = await wordpress_api_call(
+                        "POST",
+                        TAXONOMY_ENDPOINTS[taxonomy],
+                        settings,
+                        json_data={"name": name}
+                    )
+                    return name, term, None
+                except Exception as e:
+                    return name, None, str(e)
+        
+        results = await asyncio.gather(*(create_term(name) for name in names))
+        created = []
+        for name, term, error in results:
+            if error is None:
+                by_name[term_key(term["name"])] = term["id"]
+                by_name[term_key(name)] = term["id"]
+                created.append(name)
+        self.created += len(created)
+        failed = [(name, error) for name, term, error in results if error is not None]
+        if failed:
+            # term_exists: термин создан на сайте в обход инструментов - перечитываем словарь
+            by_name = await self._load(settings, taxonomy)
+            errors = [f"{name}: {error[:100]}" for name, error in failed if term_key(name) not in by_name]
+            if errors:
+                raise ValueError(f"Не удалось создать {taxonomy}: " + "; ".join(errors))
+        return by_name, created
+
+
+taxonomy_cache = TaxonomyCache(
+    ttl_seconds=float(os.getenv("WP_TAXONOMY_CACHE_TTL", "300")),
+    max_sites=int(os.getenv("WP_TAXONOMY_CACHE_SITES", "500")),
+    create_concurrency=int(os.getenv("WP_TAXONOMY_CREATE_CONCURRENCY", "2")),
+)
+
+
+async def resolve_post_terms(settings: UserSettings, tool_args: Dict[str, Any], post_data: Dict[str, Any]) -> str:
+    """
+    Добавить в post_data ID рубрик и тегов из tool_args (ID или имена)
+    
+    Returns:
+        Строка о созданных терминах для ответа инструмента (или пустая)
+    """
+    note = ""
+    for taxonomy, noun in (("categories", "Созданы рубрики"), ("tags", "Созданы теги")):
+        values = tool_args.get(taxonomy)
+        if values is None:
+            continue
+        if not isinstance(values, list):
+            values = [value.strip() for value in str(values).split(",") if value.strip()]
+        ids, created = await taxonomy_cache.resolve(settings, taxonomy, values)
+        post_data[taxonomy] = ids
+        if created:
+            note += f"\n{noun}: {', '.join(created)}"
+    return note
+
+
 # ==================== POSTS ====================
 
 async def wordpress_get_posts(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список постов"""
-    per_page = tool_args.get("per_page", 10)
+    """Получить список постов (all=true - все посты сайта)"""
     status = tool_args.get("status", "any")
     
-    posts = await wordpress_api_call(
-        "GET",
-        "/wp-json/wp/v2/posts",
+    collection = WordPressCollection(
         settings,
-        params={"per_page": per_page, "status": status}
+        "/wp-json/wp/v2/posts",
+        params={"status": status},
+        fields=["id", "title", "status", "date"],
+        limit=collection_limit(tool_args, 10)
     )
+    posts = await collection.collect()
     
-    result = f"Найдено {len(posts)} постов:\n\n"
+    result = collection_header(collection, len(posts), "постов")
     for post in posts:
         result += f"ID: {post['id']}\n"
         result += f"Название: {post['title']['rendered']}\n"
@@ -125,14 +554,18 @@ async def wordpress_create_post(settings: UserSettings, tool_args: Dict[str, Any
     if not title or not content:
         return "❌ Ошибка: title и content обязательны"
     
+    post_data = {"title": title, "content": content, "status": status}
+    terms_note = await resolve_post_terms(settings, tool_args, post_data)
+    
     post = await wordpress_api_call(
         "POST",
         "/wp-json/wp/v2/posts",
         settings,
-        json_data={"title": title, "content": content, "status": status}
+        json_data=post_data
     )
+    await content_index.apply_write(settings, "posts", post)
     
-    return f"✅ Пост создан успешно!\nID: {post['id']}\nНазвание: {post['title']['rendered']}\nСтатус: {post['status']}"
+    return f"✅ Пост создан успешно!\nID: {post['id']}\nНазвание: {post['title']['rendered']}\nСтатус: {post['status']}{terms_note}"
 
 
 async def wordpress_update_post(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
@@ -149,9 +582,10 @@ async def wordpress_update_post(settings: UserSettings, tool_args: Dict[str, Any
         update_data["content"] = tool_args.get("content")
     if tool_args.get("status"):
         update_data["status"] = tool_args.get("status")
+    terms_note = await resolve_post_terms(settings, tool_args, update_data)
     
     if not update_data:
-        return "❌ Ошибка: укажите хотя бы одно поле для обновления (title, content, status)"
+        return "❌ Ошибка: укажите хотя бы одно поле для обновления (title, content, status, categories, tags)"
     
     post = await wordpress_api_call(
         "POST",
@@ -159,8 +593,9 @@ async def wordpress_update_post(settings: UserSettings, tool_args: Dict[str, Any
         settings,
         json_data=update_data
     )
+    await content_index.apply_write(settings, "posts", post)
     
-    return f"✅ Пост обновлён!\nID: {post['id']}\nНазвание: {post['title']['rendered']}\nСтатус: {post['status']}"
+    return f"✅ Пост обновлён!\nID: {post['id']}\nНазвание: {post['title']['rendered']}\nСтатус: {post['status']}{terms_note}"
 
 
 async def wordpress_delete_post(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
@@ -176,17 +611,49 @@ async def wordpress_delete_post(settings: UserSettings, tool_args: Dict[str, Any
         settings,
         params={"force": True}
     )
+    await content_index.forget(settings, "posts", post_id)
     
     return f"✅ Пост {post_id} успешно удалён"
 
 
+async def search_content_index(
+    settings: UserSettings,
+    kind: str,
+    search_query: str,
+    noun: str,
+    tool_args: Dict[str, Any]
+) -> Optional[str]:
+    """
+    Ответ поиска из локального индекса (wordpress_sync_index)
+    
+    Returns:
+        Результат или None, если сайт не проиндексирован или запрошен live поиск
+    """
+    if tool_args.get("live"):
+        return None
+    found = await content_index.search(settings, kind, search_query, limit=int(tool_args.get("per_page", 10)))
+    if found is None:
+        return None
+    if not found["items"]:
+        return f"Ничего не найдено по запросу: {search_query} (индекс от {found['synced_at']})"
+    
+    result = f"Найдено {len(found['items'])} {noun} по запросу '{search_query}' (индекс от {found['synced_at']}):\n\n"
+    for item in found["items"]:
+        result += f"ID: {item['id']}\nНазвание: {item['title']}\nИзменено: {item['modified']}\n\n"
+    return result
+
+
 async def wordpress_search_posts(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Поиск постов по ключевым словам"""
+    """Поиск постов по ключевым словам (из локального индекса, если сайт проиндексирован)"""
     search_query = tool_args.get("search", "")
     
     if not search_query:
         return "❌ Ошибка: search обязателен"
     
+    indexed = await search_content_index(settings, "posts", search_query, "постов", tool_args)
+    if indexed is not None:
+        return indexed
+    
     posts = await wordpress_api_call(
         "GET",
         "/wp-json/wp/v2/posts",
@@ -204,8 +671,12 @@ async def wordpress_search_posts(settings: UserSettings, tool_args: Dict[str, An
     return result
 
 
-async def wordpress_bulk_update_posts(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Массовое обновление постов"""
+async def wordpress_bulk_update_posts(
+    settings: UserSettings,
+    tool_args: Dict[str, Any],
+    progress: Optional[ProgressCallback] = None
+) -> str:
+    """Массовое обновление постов (параллельно, с лимитом на сайт)"""
     post_ids = tool_args.get("post_ids", [])
     updates = tool_args.get("updates", {})
     
@@ -214,20 +685,25 @@ async def wordpress_bulk_update_posts(settings: UserSettings, tool_args: Dict[st
     if not updates:
         return "❌ Ошибка: updates обязателен"
     
-    updated_count = 0
-    errors = []
-    
-    for post_id in post_ids:
-        try:
-            await wordpress_api_call(
-                "POST",
-                f"/wp-json/wp/v2/posts/{post_id}",
-                settings,
-                json_data=updates
-            )
-            updated_count += 1
-        except Exception as e:
-            errors.append(f"Post {post_id}: {str(e)[:100]}")
+    async def update_post(post_id):
+        post = await wordpress_api_call(
+            "POST",
+            f"/wp-json/wp/v2/posts/{post_id}",
+            settings,
+            json_data=updates
+        )
+        await content_index.apply_write(settings, "posts", post)
+        return post
+    
+    results = await wordpress_bulk.run(
+        settings.wordpress_url,
+        post_ids,
+        update_post,
+        progress=progress,
+        describe=lambda post_id: f"Post {post_id}",
+    )
+    updated_count = sum(1 for item in results if item.ok)
+    errors = [f"Post {item.item}: {item.error[:100]}" for item in results if not item.ok]
     
     result = f"✅ Обновлено постов: {updated_count}/{len(post_ids)}"
     if errors:
@@ -239,18 +715,19 @@ async def wordpress_bulk_update_posts(settings: UserSettings, tool_args: Dict[st
 # ==================== PAGES ====================
 
 async def wordpress_get_pages(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список страниц"""
-    per_page = tool_args.get("per_page", 10)
+    """Получить список страниц (all=true - все страницы сайта)"""
     status = tool_args.get("status", "any")
     
-    pages = await wordpress_api_call(
-        "GET",
-        "/wp-json/wp/v2/pages",
+    collection = WordPressCollection(
         settings,
-        params={"per_page": per_page, "status": status}
+        "/wp-json/wp/v2/pages",
+        params={"status": status},
+        fields=["id", "title", "status", "date"],
+        limit=collection_limit(tool_args, 10)
     )
+    pages = await collection.collect()
     
-    result = f"Найдено {len(pages)} страниц:\n\n"
+    result = collection_header(collection, len(pages), "страниц")
     for page in pages:
         result += f"ID: {page['id']}\n"
         result += f"Название: {page['title']['rendered']}\n"
@@ -285,6 +762,7 @@ async def wordpress_create_page(settings: UserSettings, tool_args: Dict[str, Any
         settings,
         json_data=page_data
     )
+    await content_index.apply_write(settings, "pages", page)
     
     return f"✅ Страница создана успешно!\nID: {page['id']}\nНазвание: {page['title']['rendered']}\nСтатус: {page['status']}"
 
@@ -315,6 +793,7 @@ async def wordpress_update_page(settings: UserSettings, tool_args: Dict[str, Any
         settings,
         json_data=update_data
     )
+    await content_index.apply_write(settings, "pages", page)
     
     return f"✅ Страница обновлена!\nID: {page['id']}\nНазвание: {page['title']['rendered']}\nСтатус: {page['status']}"
 
@@ -332,17 +811,22 @@ async def wordpress_delete_page(settings: UserSettings, tool_args: Dict[str, Any
         settings,
         params={"force": True}
     )
+    await content_index.forget(settings, "pages", page_id)
     
     return f"✅ Страница {page_id} успешно удалена"
 
 
 async def wordpress_search_pages(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Поиск страниц по ключевым словам"""
+    """Поиск страниц по ключевым словам (из локального индекса, если сайт проиндексирован)"""
     search_query = tool_args.get("search", "")
     
     if not search_query:
         return "❌ Ошибка: search обязателен"
     
+    indexed = await search_content_index(settings, "pages", search_query, "страниц", tool_args)
+    if indexed is not None:
+        return indexed
+    
     pages = await wordpress_api_call(
         "GET",
         "/wp-json/wp/v2/pages",
@@ -360,21 +844,35 @@ async def wordpress_search_pages(settings: UserSettings, tool_args: Dict[str, An
     return result
 
 
+async def wordpress_sync_index(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
+    """Синхронизировать локальный поисковый индекс постов и страниц"""
+    full = bool(tool_args.get("full", False))
+    started = time.perf_counter()
+    synced = await content_index.sync(settings, full=full)
+    
+    result = f"✅ Индекс {'перестроен' if full else 'обновлён'} за {time.perf_counter() - started:.1f}с\n\n"
+    for kind, noun in (("posts", "Посты"), ("pages", "Страницы")):
+        stats = synced[kind]
+        result += f"{noun}: обновлено {stats['changed']}, удалено {stats['removed']}, в индексе {stats['total']}\n"
+    return result
+
+
 # ==================== TAGS ====================
 
 async def wordpress_get_tags(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список тегов"""
-    tags = await wordpress_api_call(
-        "GET",
-        "/wp-json/wp/v2/tags",
+    """Получить список тегов (all=true - все теги сайта)"""
+    collection = WordPressCollection(
         settings,
-        params={"per_page": 100}
+        "/wp-json/wp/v2/tags",
+        fields=["id", "name", "count"],
+        limit=collection_limit(tool_args, 100)
     )
+    tags = await collection.collect()
     
     if not tags:
         return "Теги не найдены"
     
-    result = f"Найдено {len(tags)} тегов:\n\n"
+    result = collection_header(collection, len(tags), "тегов")
     for tag in tags:
         result += f"ID: {tag['id']}\nНазвание: {tag['name']}\nКоличество постов: {tag['count']}\n\n"
     
@@ -394,6 +892,7 @@ async def wordpress_create_tag(settings: UserSettings, tool_args: Dict[str, Any]
         settings,
         json_data={"name": name}
     )
+    taxonomy_cache.remember(settings, "tags", tag)
     
     return f"✅ Тег создан успешно!\nID: {tag['id']}\nНазвание: {tag['name']}"
 
@@ -412,6 +911,7 @@ async def wordpress_update_tag(settings: UserSettings, tool_args: Dict[str, Any]
         settings,
         json_data={"name": name}
     )
+    taxonomy_cache.remember(settings, "tags", tag)
     
     return f"✅ Тег обновлён!\nID: {tag['id']}\nНазвание: {tag['name']}"
 
@@ -429,6 +929,7 @@ async def wordpress_delete_tag(settings: UserSettings, tool_args: Dict[str, Any]
         settings,
         params={"force": True}
     )
+    taxonomy_cache.forget(settings, "tags", tag_id)
     
     return f"✅ Тег {tag_id} успешно удалён"
 
@@ -448,19 +949,22 @@ async def wordpress_create_category(settings: UserSettings, tool_args: Dict[str,
         settings,
         json_data={"name": name}
     )
+    taxonomy_cache.remember(settings, "categories", category)
     
     return f"✅ Категория создана!\nID: {category['id']}\nНазвание: {category['name']}"
 
 
 async def wordpress_get_categories(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список категорий"""
-    categories = await wordpress_api_call(
-        "GET",
+    """Получить список категорий (all=true - все категории сайта)"""
+    collection = WordPressCollection(
+        settings,
         "/wp-json/wp/v2/categories",
-        settings
+        fields=["id", "name", "count"],
+        limit=collection_limit(tool_args, 10)
     )
+    categories = await collection.collect()
     
-    result = f"Найдено {len(categories)} категорий:\n\n"
+    result = collection_header(collection, len(categories), "категорий")
     for cat in categories:
         result += f"ID: {cat['id']}\nНазвание: {cat['name']}\nКоличество постов: {cat['count']}\n\n"
     
@@ -483,6 +987,7 @@ async def wordpress_update_category(settings: UserSettings, tool_args: Dict[str,
         settings,
         json_data={"name": name}
     )
+    taxonomy_cache.remember(settings, "categories", category)
     
     return f"✅ Категория обновлена!\nID: {category['id']}\nНазвание: {category['name']}"
 
@@ -500,12 +1005,181 @@ async def wordpress_delete_category(settings: UserSettings, tool_args: Dict[str,
         settings,
         params={"force": True}
     )
+    taxonomy_cache.forget(settings, "categories", category_id)
     
     return f"✅ Категория {category_id} успешно удалена"
 
 
 # ==================== MEDIA ====================
 
+# Потоковая передача файла: скачивание -> /wp/v2/media без буферизации всего файла
+WP_MEDIA_MAX_BYTES = int(os.getenv("WP_MEDIA_MAX_BYTES", str(256 * 1024 * 1024)))
+WP_MEDIA_CHUNK_SIZE = int(os.getenv("WP_MEDIA_CHUNK_SIZE", str(64 * 1024)))
+WP_MEDIA_TIMEOUT = float(os.getenv("WP_MEDIA_TIMEOUT", "120"))
+
+# Сигнатуры файлов: (смещение, магические байты, MIME тип)
+MEDIA_SIGNATURES = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"ID3", "audio/mpeg"),
+    (4, b"ftyp", "video/mp4"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"OggS", "audio/ogg"),
+]
+MEDIA_SNIFF_BYTES = 64
+
+
+class MediaTransferError(Exception):
+    """Файл нельзя передать в медиатеку (размер, тип, ошибка источника)"""
+
+
+def sniff_media_type(head: bytes, declared: Optional[str], filename: str) -> str:
+    """
+    MIME тип файла: по сигнатуре первых байт, затем по Content-Type источника и имени файла
+    
+    Args:
+        head: Первые байты файла
+        declared: Content-Type ответа источника
+        filename: Имя файла
+    """
+    for offset, magic, media_type in MEDIA_SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            return media_type
+    declared = (declared or "").split(";")[0].strip().lower()
+    if declared and declared not in ("application/octet-stream", "binary/octet-stream"):
+        return declared
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def media_filename(url: str, media_type: str) -> str:
+    """Имя файла из URL (без кавычек и путей), с расширением по MIME типу"""
+    name = unquote(urlparse(url).path.rsplit("/", 1)[-1])
+    name = "".join(ch for ch in name if ch not in '"\\/\r\n').strip() or "file"
+    if not os.path.splitext(name)[1]:
+        name += mimetypes.guess_extension(media_type) or ""
+    return name
+
+
+def content_disposition(filename: str) -> str:
+    """Content-Disposition для загрузки: не-ASCII имя передаётся через filename* (RFC 5987)"""
+    if filename.isascii():
+        return f'attachment; filename="{filename}"'
+    stem, ext = (part.encode("ascii", "ignore").decode("ascii").strip() for part in os.path.splitext(filename))
+    fallback = (stem or "file") + ext
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+async def wordpress_upload_from_url(
+    settings: UserSettings,
+    source_url: str,
+    title: Optional[str] = None,
+    allowed_type_prefix: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Скачать файл по URL и потоком загрузить в медиатеку WordPress
+    
+    Args:
+        settings: Настройки пользователя
+        source_url: URL файла
+        title: Название медиафайла
+        allowed_type_prefix: Допустимый префикс MIME типа (например, image/)
+    
+    Returns:
+        Ответ /wp/v2/media
+    """
+    timeout = httpx.Timeout(WP_MEDIA_TIMEOUT, connect=10.0)
+    async with httpx.AsyncClient(timeout=timeout, follow_redirects=True) as client:
+        async with client.stream("GET", source_url) as source:
+            return await wordpress_upload_stream(
+                settings, source, title=title, allowed_type_prefix=allowed_type_prefix
+            )
+
+
+async def wordpress_upload_stream(
+    settings: UserSettings,
+    source: httpx.Response,
+    title: Optional[str] = None,
+    allowed_type_prefix: Optional[str] = None,
+    filename: Optional[str] = None,
+    transfer: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Передать открытый потоковый ответ источника в медиатеку WordPress
+    
+    В памяти одновременно находится только текущий chunk (WP_MEDIA_CHUNK_SIZE),
+    размер ограничен WP_MEDIA_MAX_BYTES (по Content-Length и по факту передачи).
+    
+    Args:
+        settings: Настройки пользователя
+        source: Ответ client.stream("GET", ...) источника
+        title: Название медиафайла
+        allowed_type_prefix: Допустимый префикс MIME типа (например, image/)
+        filename: Имя файла (по умолчанию из URL источника)
+        transfer: Сюда записывается число переданных байт (bytes)
+    
+    Returns:
+        Ответ /wp/v2/media
+    """
+    if source.status_code >= 400:
+        raise MediaTransferError(f"источник вернул HTTP {source.status_code}")
+    
+    declared_length = source.headers.get("Content-Length")
+    if declared_length and declared_length.isdigit() and int(declared_length) > WP_MEDIA_MAX_BYTES:
+        raise MediaTransferError(
+            f"файл больше лимита {WP_MEDIA_MAX_BYTES // (1024 * 1024)} МБ ({int(declared_length)} байт)"
+        )
+    
+    chunks = source.aiter_bytes(WP_MEDIA_CHUNK_SIZE)
+    head = b""
+    while len(head) < MEDIA_SNIFF_BYTES:
+        try:
+            head += await chunks.__anext__()
+        except StopAsyncIteration:
+            break
+    if not head:
+        raise MediaTransferError("источник вернул пустой файл")
+    
+    media_type = sniff_media_type(head, source.headers.get("Content-Type"), filename or source.url.path)
+    if media_type.startswith("text/html"):
+        raise MediaTransferError("по URL открывается HTML страница, а не файл")
+    if allowed_type_prefix and not media_type.startswith(allowed_type_prefix):
+        raise MediaTransferError(f"тип файла {media_type} не подходит (нужен {allowed_type_prefix}*)")
+    
+    async def body():
+        sent = len(head)
+        yield head
+        async for chunk in chunks:
+            sent += len(chunk)
+            if sent > WP_MEDIA_MAX_BYTES:
+                raise MediaTransferError(f"файл больше лимита {WP_MEDIA_MAX_BYTES // (1024 * 1024)} МБ")
+            yield chunk
+        if transfer is not None:
+            transfer["bytes"] = sent
+    
+    filename = media_filename(filename or str(source.url), media_type)
+    headers = {
+        "Content-Type": media_type,
+        "Content-Disposition": content_disposition(filename),
+    }
+    # Длину можно передать, только если тело не перекодируется (gzip и т.п.)
+    if declared_length and source.headers.get("Content-Encoding", "identity") == "identity":
+        headers["Content-Length"] = declared_length
+    
+    return await wordpress_api_call(
+        "POST",
+        "/wp-json/wp/v2/media",
+        settings,
+        params={"title": title} if title else None,
+        content=body(),
+        headers=headers,
+        timeout=WP_MEDIA_TIMEOUT
+    )
+
+
 async def wordpress_upload_media(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
     """Загрузить медиафайл"""
     file_url = tool_args.get("file_url")
@@ -515,22 +1189,8 @@ async def wordpress_upload_media(settings: UserSettings, tool_args: Dict[str, An
         return "❌ Ошибка: file_url обязателен"
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Скачиваем файл
-            file_resp = await client.get(file_url, timeout=60.0)
-            file_resp.raise_for_status()
-            file_content = file_resp.content
-            
-            # Загружаем в WordPress
-            media = await wordpress_api_call(
-                "POST",
-                "/wp-json/wp/v2/media",
-                settings,
-                files={"file": (title, file_content)},
-                timeout=60
-            )
-            
-            return f"✅ Медиафайл загружен!\nID: {media['id']}\nURL: {media['source_url']}"
+        media = await wordpress_upload_from_url(settings, file_url, title=title)
+        return f"✅ Медиафайл загружен!\nID: {media['id']}\nURL: {media['source_url']}"
     
     except Exception as e:
         return f"❌ Ошибка загрузки файла: {str(e)}"
@@ -544,42 +1204,24 @@ async def wordpress_upload_image_from_url(settings: UserSettings, tool_args: Dic
         return "❌ Ошибка: url обязателен"
     
     try:
-        async with httpx.AsyncClient() as client:
-            # Скачиваем изображение
-            img_resp = await client.get(url, timeout=60.0)
-            img_resp.raise_for_status()
-            img_content = img_resp.content
-            
-            # Получаем имя файла из URL
-            filename = url.split("/")[-1] or "image.jpg"
-            
-            # Загружаем в WordPress
-            media = await wordpress_api_call(
-                "POST",
-                "/wp-json/wp/v2/media",
-                settings,
-                files={"file": (filename, img_content)},
-                timeout=60
-            )
-            
-            return f"✅ Изображение загружено!\nID: {media['id']}\nURL: {media['source_url']}"
+        media = await wordpress_upload_from_url(settings, url, allowed_type_prefix="image/")
+        return f"✅ Изображение загружено!\nID: {media['id']}\nURL: {media['source_url']}"
     
     except Exception as e:
         return f"❌ Ошибка загрузки изображения: {str(e)}"
 
 
 async def wordpress_get_media(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список медиафайлов"""
-    per_page = tool_args.get("per_page", 10)
-    
-    media_items = await wordpress_api_call(
-        "GET",
-        "/wp-json/wp/v2/media",
+    """Получить список медиафайлов (all=true - вся медиатека)"""
+    collection = WordPressCollection(
         settings,
-        params={"per_page": per_page}
+        "/wp-json/wp/v2/media",
+        fields=["id", "title", "source_url"],
+        limit=collection_limit(tool_args, 10)
     )
+    media_items = await collection.collect()
     
-    result = f"Найдено {len(media_items)} медиафайлов:\n\n"
+    result = collection_header(collection, len(media_items), "медиафайлов")
     for media in media_items:
         result += f"ID: {media['id']}\nНазвание: {media['title']['rendered']}\nURL: {media['source_url']}\n\n"
     
@@ -624,21 +1266,23 @@ async def wordpress_create_comment(settings: UserSettings, tool_args: Dict[str,
 
 
 async def wordpress_get_comments(settings: UserSettings, tool_args: Dict[str, Any]) -> str:
-    """Получить список комментариев"""
+    """Получить список комментариев (all=true - все комментарии)"""
     post_id = tool_args.get("post_id")
     
     params = {}
     if post_id:
         params["post"] = post_id
     
-    comments = await wordpress_api_call(
-        "GET",
-        "/wp-json/wp/v2/comments",
+    collection = WordPressCollection(
         settings,
-        params=params
+        "/wp-json/wp/v2/comments",
+        params=params,
+        fields=["id", "author_name", "content"],
+        limit=collection_limit(tool_args, 10)
     )
+    comments = await collection.collect()
     
-    result = f"Найдено {len(comments)} комментариев:\n\n"
+    result = collection_header(collection, len(comments), "комментариев")
     for comment in comments:
         result += f"ID: {comment['id']}\nАвтор: {comment['author_name']}\nСодержание: {comment['content']['rendered'][:100]}...\n\n"
     
@@ -814,9 +1458,151 @@ async def wordpress_delete_user(settings: UserSettings, tool_args: Dict[str, Any
     return f"✅ Пользователь {user_id} успешно удалён"
 
 
+# ==================== BULK TOOLS ====================
+
+# Массовые варианты write-инструментов: bulk инструмент -> (одиночный инструмент, описание, итог)
+WORDPRESS_BULK_TOOLS = {
+    "wordpress_bulk_create_posts": ("wordpress_create_post", "Создать несколько постов", "Создано постов"),
+    "wordpress_bulk_delete_posts": ("wordpress_delete_post", "Удалить несколько постов", "Удалено постов"),
+    "wordpress_bulk_create_pages": ("wordpress_create_page", "Создать несколько страниц", "Создано страниц"),
+    "wordpress_bulk_update_pages": ("wordpress_update_page", "Обновить несколько страниц", "Обновлено страниц"),
+    "wordpress_bulk_delete_pages": ("wordpress_delete_page", "Удалить несколько страниц", "Удалено страниц"),
+    "wordpress_bulk_create_tags": ("wordpress_create_tag", "Создать несколько тегов", "Создано тегов"),
+    "wordpress_bulk_update_tags": ("wordpress_update_tag", "Обновить несколько тегов", "Обновлено тегов"),
+    "wordpress_bulk_delete_tags": ("wordpress_delete_tag", "Удалить несколько тегов", "Удалено тегов"),
+    "wordpress_bulk_create_categories": ("wordpress_create_category", "Создать несколько категорий", "Создано категорий"),
+    "wordpress_bulk_update_categories": ("wordpress_update_category", "Обновить несколько категорий", "Обновлено категорий"),
+    "wordpress_bulk_delete_categories": ("wordpress_delete_category", "Удалить несколько категорий", "Удалено категорий"),
+    "wordpress_bulk_delete_media": ("wordpress_delete_media", "Удалить несколько медиафайлов", "Удалено медиафайлов"),
+    "wordpress_bulk_create_comments": ("wordpress_create_comment", "Создать несколько комментариев", "Создано комментариев"),
+    "wordpress_bulk_update_comments": ("wordpress_update_comment", "Обновить несколько комментариев", "Обновлено комментариев"),
+    "wordpress_bulk_delete_comments": ("wordpress_delete_comment", "Удалить несколько комментариев", "Удалено комментариев"),
+    "wordpress_bulk_moderate_comments": ("wordpress_moderate_comment", "Модерировать несколько комментариев", "Обработано комментариев"),
+}
+
+WP_BULK_MAX_ITEMS = int(os.getenv("WP_BULK_MAX_ITEMS", "500"))
+BULK_REPORT_ERRORS = 10
+
+
+class BulkItemError(Exception):
+    """Одиночный инструмент вернул сообщение об ошибке вместо исключения"""
+
+
+def describe_bulk_item(item) -> str:
+    """Подпись элемента bulk операции: номер и ID/название из аргументов"""
+    index, args = item
+    for key, value in args.items():
+        if key.endswith("_id") or key in ("name", "title", "username"):
+            return f"#{index + 1} ({key}={value})"
+    return f"#{index + 1}"
+
+
+async def wordpress_bulk_write(
+    tool_name: str,
+    settings: UserSettings,
+    tool_args: Dict[str, Any],
+    progress: Optional[ProgressCallback] = None
+) -> str:
+    """
+    Выполнить одиночный write-инструмент для каждого элемента items
+    
+    Аргументы элемента = defaults + items[i] (поля элемента важнее).
+    Элементы выполняются параллельно через wordpress_bulk, ошибки
+    отдельных элементов собираются в отчёт и не прерывают остальные.
+    """
+    single_tool, _, summary_label = WORDPRESS_BULK_TOOLS[tool_name]
+    handler = WORDPRESS_TOOLS[single_tool]
+    items = tool_args.get("items")
+    defaults = tool_args.get("defaults") or {}
+    
+    if not items or not isinstance(items, list):
+        return "❌ Ошибка: items обязателен (массив объектов)"
+    if len(items) > WP_BULK_MAX_ITEMS:
+        return f"❌ Ошибка: не больше {WP_BULK_MAX_ITEMS} элементов за один вызов"
+    if not all(isinstance(item, dict) for item in items) or not isinstance(defaults, dict):
+        return "❌ Ошибка: items и defaults должны быть объектами"
+    
+    async def run_item(item):
+        _, args = item
+        result = await handler(settings, {**defaults, **args})
+        if result.startswith("❌"):
+            raise BulkItemError(result.lstrip("❌ ").strip())
+        return result
+    
+    results = await wordpress_bulk.run(
+        settings.wordpress_url,
+        list(enumerate(items)),
+        run_item,
+        progress=progress,
+        describe=describe_bulk_item,
+    )
+    done = [item for item in results if item.ok]
+    errors = [f"{describe_bulk_item(item.item)}: {item.error[:100]}" for item in results if not item.ok]
+    
+    result = f"✅ {summary_label}: {len(done)}/{len(items)}"
+    if done:
+        result += "\n\n" + "\n".join(
+            f"{describe_bulk_item(item.item)}: {' '.join(item.result.split())}" for item in done
+        )
+    if errors:
+        result += f"\n\n❌ Ошибки ({len(errors)}):\n" + "\n".join(errors[:BULK_REPORT_ERRORS])
+        if len(errors) > BULK_REPORT_ERRORS:
+            result += f"\n... и ещё {len(errors) - BULK_REPORT_ERRORS}"
+    
+    return result
+
+
 # ==================== TOOL ROUTER ====================
 
-async def handle_wordpress_tool(tool_name: str, settings: UserSettings, tool_args: Dict[str, Any]) -> str:
+# Маппинг инструментов
+WORDPRESS_TOOLS = {
+    # Posts
+    "wordpress_get_posts": wordpress_get_posts,
+    "wordpress_create_post": wordpress_create_post,
+    "wordpress_update_post": wordpress_update_post,
+    "wordpress_delete_post": wordpress_delete_post,
+    "wordpress_search_posts": wordpress_search_posts,
+    "wordpress_bulk_update_posts": wordpress_bulk_update_posts,
+    # Categories
+    "wordpress_create_category": wordpress_create_category,
+    "wordpress_get_categories": wordpress_get_categories,
+    "wordpress_update_category": wordpress_update_category,
+    "wordpress_delete_category": wordpress_delete_category,
+    # Tags
+    "wordpress_get_tags": wordpress_get_tags,
+    "wordpress_create_tag": wordpress_create_tag,
+    "wordpress_update_tag": wordpress_update_tag,
+    "wordpress_delete_tag": wordpress_delete_tag,
+    # Pages
+    "wordpress_get_pages": wordpress_get_pages,
+    "wordpress_create_page": wordpress_create_page,
+    "wordpress_update_page": wordpress_update_page,
+    "wordpress_delete_page": wordpress_delete_page,
+    "wordpress_search_pages": wordpress_search_pages,
+    "wordpress_sync_index": wordpress_sync_index,
+    # Media
+    "wordpress_upload_media": wordpress_upload_media,
+    "wordpress_upload_image_from_url": wordpress_upload_image_from_url,
+    "wordpress_get_media": wordpress_get_media,
+    "wordpress_delete_media": wordpress_delete_media,
+    # Comments
+    "wordpress_create_comment": wordpress_create_comment,
+    "wordpress_get_comments": wordpress_get_comments,
+    "wordpress_update_comment": wordpress_update_comment,
+    "wordpress_delete_comment": wordpress_delete_comment,
+    "wordpress_moderate_comment": wordpress_moderate_comment,
+}
+
+# Инструменты, принимающие progress callback
+PROGRESS_TOOLS = {"wordpress_bulk_update_posts"}
+
+
+async def handle_wordpress_tool(
+    tool_name: str,
+    settings: UserSettings,
+    tool_args: Dict[str, Any],
+    progress: Optional[ProgressCallback] = None
+) -> str:
     """
     Роутер для всех WordPress инструментов
     
@@ -824,6 +1610,7 @@ async def handle_wordpress_tool(tool_name: str, settings: UserSettings, tool_arg
         tool_name: Название инструмента
         settings: Настройки пользователя
         tool_args: Аргументы инструмента
+        progress: Уведомления о ходе массовых операций (SSE коннектора)
     
     Returns:
         Результат выполнения в виде строки
@@ -833,49 +1620,15 @@ async def handle_wordpress_tool(tool_name: str, settings: UserSettings, tool_arg
     if not is_valid:
         return f"❌ {error_msg}"
     
-    # Маппинг инструментов
-    tools_map = {
-        # Posts
-        "wordpress_get_posts": wordpress_get_posts,
-        "wordpress_create_post": wordpress_create_post,
-        "wordpress_update_post": wordpress_update_post,
-        "wordpress_delete_post": wordpress_delete_post,
-        "wordpress_search_posts": wordpress_search_posts,
-        "wordpress_bulk_update_posts": wordpress_bulk_update_posts,
-        # Categories
-        "wordpress_create_category": wordpress_create_category,
-        "wordpress_get_categories": wordpress_get_categories,
-        "wordpress_update_category": wordpress_update_category,
-        "wordpress_delete_category": wordpress_delete_category,
-        # Tags
-        "wordpress_get_tags": wordpress_get_tags,
-        "wordpress_create_tag": wordpress_create_tag,
-        "wordpress_update_tag": wordpress_update_tag,
-        "wordpress_delete_tag": wordpress_delete_tag,
-        # Pages
-        "wordpress_get_pages": wordpress_get_pages,
-        "wordpress_create_page": wordpress_create_page,
-        "wordpress_update_page": wordpress_update_page,
-        "wordpress_delete_page": wordpress_delete_page,
-        "wordpress_search_pages": wordpress_search_pages,
-        # Media
-        "wordpress_upload_media": wordpress_upload_media,
-        "wordpress_upload_image_from_url": wordpress_upload_image_from_url,
-        "wordpress_get_media": wordpress_get_media,
-        "wordpress_delete_media": wordpress_delete_media,
-        # Comments
-        "wordpress_create_comment": wordpress_create_comment,
-        "wordpress_get_comments": wordpress_get_comments,
-        "wordpress_update_comment": wordpress_update_comment,
-        "wordpress_delete_comment": wordpress_delete_comment,
-        "wordpress_moderate_comment": wordpress_moderate_comment,
-    }
-    
-    handler = tools_map.get(tool_name)
-    if not handler:
+    handler = WORDPRESS_TOOLS.get(tool_name)
+    if not handler and tool_name not in WORDPRESS_BULK_TOOLS:
         return f"❌ Неизвестный WordPress инструмент: {tool_name}"
     
     try:
+        if tool_name in WORDPRESS_BULK_TOOLS:
+            return await wordpress_bulk_write(tool_name, settings, tool_args, progress=progress)
+        if tool_name in PROGRESS_TOOLS:
+            return await handler(settings, tool_args, progress=progress)
         return await handler(settings, tool_args)
     except Exception as e:
         logger.error(f"WordPress tool {tool_name} error: {str(e)}")
@@ -369,8 +369,6 @@ async def wordstat_get_regions(settings: UserSettings, tool_args: Dict[str, Any]
 
 async def wordstat_set_token(settings: UserSettings, tool_args: Dict[str, Any], db) -> str:
     """Установить токен Wordstat"""
-    from .database import SessionLocal
-    
     token = tool_args.get("token")
     
     if not token:
@@ -378,7 +376,7 @@ async def wordstat_set_token(settings: UserSettings, tool_args: Dict[str, Any],
     
     # Сохраняем токен в базу
     settings.wordstat_access_token = token
-    db.commit()
+    await db.commit()
     
     return f"""✅ Токен Wordstat успешно сохранён!
 
@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Пересчёт почасовых и дневных агрегатов активности из activity_logs
+Создаёт таблицы activity_rollup_hourly / activity_rollup_daily, если их нет.
+Пересчёт идемпотентен: агрегаты очищаются и строятся заново.
+"""
+
+import sys
+import time
+
+from app.activity_log import backfill_rollups
+from app.database import DATABASE_URL, SessionLocal
+
+
+def main():
+    print(f"Backfill агрегатов активности: {DATABASE_URL}")
+    started = time.perf_counter()
+
+    with SessionLocal() as db:
+        try:
+            result = backfill_rollups(db)
+        except Exception as e:
+            db.rollback()
+            print(f"\n❌ Ошибка пересчёта агрегатов: {e}")
+            return 1
+
+    print(f"✓ activity_rollup_hourly: {result['hourly']} строк")
+    print(f"✓ activity_rollup_daily: {result['daily']} строк")
+    print(f"\n✓ Готово за {time.perf_counter() - started:.1f} сек")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: задержка event loop во время «шторма» логинов
+Сравнивает проверку bcrypt прямо в event loop и в пуле потоков (verify_password_async)
+"""
+import asyncio
+import statistics
+import sys
+import time
+
+from app.auth import get_password_hash, verify_password, verify_password_async
+
+LOGINS = 16            # Одновременных логинов
+PING_INTERVAL = 0.01   # Период «пинга» event loop (сек)
+PASSWORD = "Benchmark1Password"
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_storm(hashed: str, offloaded: bool):
+    """Запуск LOGINS проверок пароля параллельно с пингом event loop"""
+    latencies = []
+    done = asyncio.Event()
+
+    async def ping():
+        # Задержка пинга = сколько лишнего ждал event loop
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(PING_INTERVAL)
+            latencies.append((time.perf_counter() - start - PING_INTERVAL) * 1000)
+
+    async def login():
+        if offloaded:
+            return await verify_password_async(PASSWORD, hashed)
+        return verify_password(PASSWORD, hashed)
+
+    pinger = asyncio.create_task(ping())
+    await asyncio.sleep(PING_INTERVAL * 5)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(login() for _ in range(LOGINS)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await pinger
+
+    assert all(results)
+    return latencies, elapsed
+
+
+def report(name, latencies, elapsed):
+    print(
+        f"{name:<22} ping p50={statistics.median(latencies):8.2f} ms  "
+        f"p99={percentile(latencies, 99):8.2f} ms  max={max(latencies):8.2f} ms  "
+        f"storm={elapsed:.2f} s"
+    )
+
+
+def main():
+    print("=" * 60)
+    print(f"БЕНЧМАРК: {LOGINS} одновременных логинов (bcrypt)")
+    print("=" * 60)
+
+    hashed = get_password_hash(PASSWORD)
+
+    latencies, elapsed = asyncio.run(run_storm(hashed, offloaded=False))
+    report("До (в event loop)", latencies, elapsed)
+
+    latencies, elapsed = asyncio.run(run_storm(hashed, offloaded=True))
+    report("После (пул потоков)", latencies, elapsed)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
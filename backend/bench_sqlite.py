@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк: конкурентные чтения/записи SQLite в профилях default и production
+Работает с копией app.db (исходная база не изменяется), без неё - с пустой схемой
+"""
+import asyncio
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.database import (
+    Base,
+    DEFAULT_DB_PATH,
+    SQLITE_PROFILE_DEFAULT,
+    SQLITE_PROFILE_PRODUCTION,
+    engine_options,
+    install_sqlite_profile,
+)
+from app.models import ActivityLog, User
+
+WRITERS = 8           # Задач, пишущих ActivityLog
+READERS = 16          # Задач, читающих статистику
+DURATION = 5.0        # Длительность прогона (сек)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def prepare_database(path: str) -> None:
+    """Копия app.db во временный файл (или пустая база)"""
+    if os.path.exists(DEFAULT_DB_PATH):
+        shutil.copyfile(DEFAULT_DB_PATH, path)
+
+
+async def run_profile(profile: str, path: str):
+    url = f"sqlite+aiosqlite:///{path}"
+    engine = create_async_engine(url, **engine_options(url))
+    install_sqlite_profile(engine.sync_engine, profile)
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with session_factory() as db:
+        user_id = await db.scalar(select(User.id).limit(1))
+        if user_id is None:
+            user = User(email="bench@example.com", hashed_password="x", full_name="Bench")
+            db.add(user)
+            await db.commit()
+            user_id = user.id
+
+    write_latencies, read_latencies = [], []
+    errors = 0
+    deadline = time.perf_counter() + DURATION
+
+    async def writer():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session_factory() as db:
+                    db.add(ActivityLog(user_id=user_id, action_type="mcp", action_name="bench"))
+                    await db.commit()
+                write_latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    async def reader():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with session_factory() as db:
+                    await db.scalar(
+                        select(func.count(ActivityLog.id)).where(ActivityLog.user_id == user_id)
+                    )
+                read_latencies.append((time.perf_counter() - started) * 1000)
+            except Exception:
+                errors += 1
+
+    await asyncio.gather(*[writer() for _ in range(WRITERS)], *[reader() for _ in range(READERS)])
+
+    async with engine.connect() as conn:
+        journal_mode = (await conn.exec_driver_sql("PRAGMA journal_mode")).scalar()
+    await engine.dispose()
+    return journal_mode, write_latencies, read_latencies, errors
+
+
+def report(profile, journal_mode, write_latencies, read_latencies, errors):
+    print(f"\nПрофиль: {profile} (journal_mode={journal_mode})")
+    for name, values in (("Запись", write_latencies), ("Чтение", read_latencies)):
+        if not values:
+            print(f"  {name}: нет успешных операций")
+            continue
+        print(
+            f"  {name}: {len(values) / DURATION:8.1f} оп/с  "
+            f"p50={statistics.median(values):7.2f} ms  p99={percentile(values, 99):7.2f} ms"
+        )
+    print(f"  Ошибки (database is locked и т.п.): {errors}")
+
+
+def main():
+    print("=" * 60)
+    print(f"БЕНЧМАРК SQLite: {WRITERS} писателей, {READERS} читателей, {DURATION:.0f} сек")
+    print("=" * 60)
+    print(f"Источник: {DEFAULT_DB_PATH if os.path.exists(DEFAULT_DB_PATH) else 'пустая схема'}")
+
+    for profile in (SQLITE_PROFILE_DEFAULT, SQLITE_PROFILE_PRODUCTION):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "bench.db")
+            prepare_database(path)
+            report(profile, *asyncio.run(run_profile(profile, path)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
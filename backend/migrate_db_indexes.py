@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Миграция: составные индексы для keyset-пагинации админки
+Создаёт недостающие индексы users / activity_logs / admin_logs (повторный запуск безопасен)
+"""
+
+import sys
+
+from app.database import DATABASE_URL, engine
+from app.models import ActivityLog, AdminLog, User
+
+
+def migrate_database():
+    """Создать недостающие индексы, объявленные в моделях"""
+    print(f"Migrating database: {DATABASE_URL}")
+
+    try:
+        with engine.begin() as conn:
+            for model in (User, ActivityLog, AdminLog):
+                for index in sorted(model.__table__.indexes, key=lambda idx: idx.name):
+                    index.create(conn, checkfirst=True)
+                    print(f"✓ {index.name}")
+    except Exception as e:
+        print(f"\nError during migration: {e}")
+        return 1
+
+    print("\n✓ Database migration completed successfully!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(migrate_database())
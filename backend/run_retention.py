@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Архивация и удаление старых строк activity_logs / login_attempts (для cron)
+Настройки берутся из переменных окружения ACTIVITY_LOG_RETENTION_DAYS, RETENTION_* и т.д.
+"""
+
+import sys
+import time
+
+from app.database import DATABASE_URL
+from app.retention import retention_engine
+
+
+def main():
+    print(f"Retention: {DATABASE_URL} (архив: {retention_engine.archive_mode})")
+    for policy in retention_engine.policies:
+        days = policy.retention_days if policy.retention_days > 0 else "без ограничения"
+        print(f"  {policy.table_name}: хранить {days} дн.")
+    started = time.perf_counter()
+
+    try:
+        moved = retention_engine.run_once()
+    except Exception as e:
+        print(f"\n❌ Ошибка архивации: {e}")
+        return 1
+
+    if not moved:
+        print("\n⚠️  Архивацию уже выполняет другой процесс, проход пропущен")
+        return 0
+
+    for table_name, count in moved.items():
+        print(f"✓ {table_name}: перенесено в архив {count} строк")
+    print(f"\n✓ Готово за {time.perf_counter() - started:.1f} сек")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -191,6 +191,51 @@ def test_helpers():
     else:
         print("[X] SimpleRateLimiter failed")
     
+    # Test PrincipalCache: обратный индекс пользователей следует за вытеснением из LRU и TTL
+    import time
+    from types import SimpleNamespace
+    from app.auth import PrincipalCache
+    
+    tests_total += 1
+    cache = PrincipalCache(max_size=3, ttl_seconds=60)
+    for user_id in range(10):
+        cache.put(f"jwt:{user_id}", SimpleNamespace(user_id=user_id))
+    evicted_ok = sorted(cache._keys_by_user) == [7, 8, 9]
+    cache.put("connector:9", SimpleNamespace(user_id=9), ttl_seconds=0.01)
+    time.sleep(0.02)
+    expired_ok = cache.get("connector:9") is None and cache._keys_by_user.get(9) == {"jwt:9"}
+    cache.invalidate_user(9)
+    if evicted_ok and expired_ok and cache.get("jwt:9") is None and sorted(cache._keys_by_user) == [8]:
+        print("[OK] PrincipalCache: индекс пользователей не растёт сверх размера кэша")
+        tests_passed += 1
+    else:
+        print(f"[X] PrincipalCache index: {cache._keys_by_user}")
+    
+    # Test async хеширования паролей: совместимо с синхронными функциями, пул пересоздаётся после shutdown
+    import asyncio
+    from app import auth
+    
+    async def password_roundtrip():
+        hashed = await auth.get_password_hash_async("пароль-1")
+        return (
+            auth.verify_password("пароль-1", hashed),
+            await auth.verify_password_async("пароль-1", auth.get_password_hash("пароль-1")),
+            await auth.verify_password_async("другой", hashed),
+        )
+    
+    tests_total += 1
+    first = asyncio.run(password_roundtrip())
+    executor = auth._password_executor
+    auth.shutdown_password_executor()
+    stopped = executor._shutdown and auth._password_executor is None
+    second = asyncio.run(password_roundtrip())
+    recreated = auth._password_executor is not None and auth._password_executor is not executor
+    if first == second == (True, True, False) and stopped and recreated:
+        print("[OK] Async хеширование паролей совместимо с bcrypt, пул пересоздаётся после shutdown")
+        tests_passed += 1
+    else:
+        print(f"[X] Async пароли: {first}, {second}, остановлен={stopped}, пересоздан={recreated}")
+    
     print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
     return tests_passed == tests_total
 
@@ -203,7 +248,7 @@ def test_mcp_handlers():
     
     from app.mcp_handlers import (
         SseManager, OAuthStore,
-        get_wordpress_tools, get_wordstat_tools,
+        get_wordpress_tools, get_wordstat_tools, get_telegram_tools,
         get_all_mcp_tools, get_mcp_server_info
     )
     
@@ -220,37 +265,91 @@ def test_mcp_handlers():
         print("[X] SseManager init failed")
     
     # Test OAuthStore
+    import asyncio
     tests_total += 1
     oauth_store = OAuthStore()
-    client = oauth_store.create_client("test_client")
+    client = asyncio.run(oauth_store.create_client("test_client"))
     if "client_id" in client and "client_secret" in client:
         print("[OK] OAuthStore.create_client() работает")
         tests_passed += 1
     else:
         print("[X] OAuthStore.create_client() failed")
     
+    async def oauth_flow(store, client_id):
+        auth_code = await store.issue_auth_code(client_id, "conn_123")
+        token = await store.exchange_code(auth_code, client_id)
+        connector = await store.get_connector_by_token(token)
+        revoked = await store.revoke_token(token)
+        return connector, revoked, await store.get_connector_by_token(token)
+    
     # Test OAuth flow
     tests_total += 1
     try:
-        auth_code = oauth_store.issue_auth_code(client["client_id"], "conn_123")
-        token = oauth_store.exchange_code(auth_code, client["client_id"])
-        connector = oauth_store.get_connector_by_token(token)
-        if connector == "conn_123":
+        connector, revoked, after_revoke = asyncio.run(oauth_flow(oauth_store, client["client_id"]))
+        if connector == "conn_123" and revoked and after_revoke is None:
             print("[OK] OAuth flow работает корректно")
             tests_passed += 1
         else:
-            print(f"[X] OAuth flow failed: connector={connector}")
+            print(f"[X] OAuth flow failed: connector={connector}, revoked={revoked}")
     except Exception as e:
         print(f"[X] OAuth flow failed: {e}")
     
+    # Test OAuth expiry sweeping
+    tests_total += 1
+    from app.mcp_handlers import InMemoryOAuthStorage, SqlOAuthStorage
+    
+    async def sweep_scenario(storage):
+        await storage.put("token", "expired", {"connector_id": "conn_1"}, ttl_seconds=-1)
+        await storage.put("token", "alive", {"connector_id": "conn_2"}, ttl_seconds=3600)
+        swept_store = OAuthStore(storage)
+        removed = await swept_store.sweep_expired()
+        alive = await swept_store.get_connector_by_token("alive")
+        await swept_store.close()
+        return removed, alive
+    
+    removed, alive = asyncio.run(sweep_scenario(InMemoryOAuthStorage()))
+    if removed == 1 and alive == "conn_2":
+        print("[OK] OAuthStore.sweep_expired() удаляет истёкшие токены")
+        tests_passed += 1
+    else:
+        print(f"[X] OAuthStore.sweep_expired() failed: removed={removed}")
+    
+    # Test SQL OAuth storage (AsyncSession, таблица создаётся при первом обращении)
+    tests_total += 1
+    import tempfile
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    
+    async def sql_scenario(db_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        try:
+            storage = SqlOAuthStorage(async_sessionmaker(engine, expire_on_commit=False))
+            store = OAuthStore(storage)
+            sql_client = await store.create_client("sql_client")
+            flow = await oauth_flow(store, sql_client["client_id"])
+            swept = await sweep_scenario(storage)
+            return flow, swept
+        finally:
+            await engine.dispose()
+    
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            flow, swept = asyncio.run(sql_scenario(f"{tmp}/oauth.db"))
+        if flow == ("conn_123", True, None) and swept == (1, "conn_2"):
+            print("[OK] SqlOAuthStorage работает через AsyncSession")
+            tests_passed += 1
+        else:
+            print(f"[X] SqlOAuthStorage failed: flow={flow}, swept={swept}")
+    except Exception as e:
+        print(f"[X] SqlOAuthStorage failed: {e}")
+    
     # Test WordPress tools
     tests_total += 1
     wp_tools = get_wordpress_tools()
-    if len(wp_tools) == 28 and wp_tools[0]["name"] == "wordpress_get_posts":
+    if len(wp_tools) == 45 and wp_tools[0]["name"] == "wordpress_get_posts":  # 29 + 16 bulk
         print(f"[OK] get_wordpress_tools() вернул {len(wp_tools)} tools")
         tests_passed += 1
     else:
-        print(f"[X] get_wordpress_tools() failed: {len(wp_tools)} tools (expected 28)")
+        print(f"[X] get_wordpress_tools() failed: {len(wp_tools)} tools (expected 45)")
     
     # Test Wordstat tools
     tests_total += 1
@@ -264,11 +363,16 @@ def test_mcp_handlers():
     # Test all MCP tools
     tests_total += 1
     all_tools = get_all_mcp_tools()
-    if len(all_tools) == 33:  # 28 WP + 5 WS
+    expected_total = len(wp_tools) + len(ws_tools) + len(get_telegram_tools())  # WP + WS + Telegram
+    unique_names = {tool["name"] for tool in all_tools}
+    if len(all_tools) == expected_total and len(unique_names) == expected_total:
         print(f"[OK] get_all_mcp_tools() вернул {len(all_tools)} tools")
         tests_passed += 1
     else:
-        print(f"[X] get_all_mcp_tools() failed: {len(all_tools)} tools (expected 33)")
+        print(
+            f"[X] get_all_mcp_tools() failed: {len(all_tools)} tools, "
+            f"{len(unique_names)} уникальных (expected {expected_total})"
+        )
     
     # Test MCP server info
     tests_total += 1
@@ -283,6 +387,758 @@ def test_mcp_handlers():
     return tests_passed == tests_total
 
 
+def test_sse_broker():
+    """Тест 3a: Доставка SSE сообщений между процессами через брокер"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3a: Проверка SSE брокера")
+    print("="*60)
+    
+    import asyncio
+    from app.mcp_handlers import SseManager, SseBroker
+    
+    class FakeBus:
+        """Замена Redis pub/sub: общий канал для нескольких 'процессов'"""
+        def __init__(self):
+            self.channels = {}
+    
+    class FakeBusBroker(SseBroker):
+        def __init__(self, bus):
+            self.bus = bus
+        
+        async def subscribe(self, connector_id):
+            self.bus.channels.setdefault(connector_id, set()).add(self)
+        
+        async def unsubscribe(self, connector_id):
+            self.bus.channels.get(connector_id, set()).discard(self)
+        
+        async def publish(self, connector_id, message):
+            receivers = 0
+            for broker in list(self.bus.channels.get(connector_id, ())):
+                receivers += await broker._deliver(connector_id, message)
+            return receivers
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario():
+        bus = FakeBus()
+        worker_a = SseManager(FakeBusBroker(bus))
+        worker_b = SseManager(FakeBusBroker(bus))
+        await worker_a.start()
+        await worker_b.start()
+        
+        queue = await worker_a.connect("conn_123")
+        # POST попал на другой worker
+        await worker_b.send("conn_123", {"jsonrpc": "2.0", "id": 1})
+        received = await asyncio.wait_for(queue.get(), timeout=1)
+        
+        await worker_a.disconnect("conn_123")
+        await worker_b.send("conn_123", {"jsonrpc": "2.0", "id": 2})
+        return received, queue.qsize(), worker_a.get_active_connections()
+    
+    received, leftover, active = asyncio.run(scenario())
+    
+    tests_total += 1
+    if received == '{"jsonrpc": "2.0", "id": 1}':
+        print("[OK] Сообщение доставлено с другого worker")
+        tests_passed += 1
+    else:
+        print(f"[X] Сообщение не доставлено: {received}")
+    
+    tests_total += 1
+    if leftover == 0 and active == 0:
+        print("[OK] После disconnect сообщения не доставляются")
+        tests_passed += 1
+    else:
+        print(f"[X] disconnect failed: leftover={leftover}, active={active}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_sse_backpressure():
+    """Тест 3b: Ограниченные очереди и несколько подписчиков"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3b: Проверка SSE backpressure")
+    print("="*60)
+    
+    import asyncio
+    from app.mcp_handlers import SseManager
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario(policy):
+        manager = SseManager(max_queue_size=2, overflow_policy=policy)
+        tab_1 = await manager.connect("conn_123")
+        tab_2 = await manager.connect("conn_123")
+        for i in range(3):
+            await manager.send("conn_123", {"id": i})
+        items = []
+        while not tab_1.empty():
+            items.append(tab_1.get_nowait())
+        return manager, items, tab_2
+    
+    # Вторая вкладка не отбирает поток у первой
+    manager, items, tab_2 = asyncio.run(scenario("drop_oldest"))
+    tests_total += 1
+    if manager.get_active_connections() == 2 and tab_2.qsize() == 2:
+        print("[OK] Несколько подписчиков на один коннектор")
+        tests_passed += 1
+    else:
+        print(f"[X] Подписчики: {manager.get_active_connections()}, tab_2={tab_2.qsize()}")
+    
+    tests_total += 1
+    if items == ['{"id": 1}', '{"id": 2}'] and manager.dropped_total == 2:
+        print("[OK] drop_oldest отбрасывает старые сообщения")
+        tests_passed += 1
+    else:
+        print(f"[X] drop_oldest failed: {items}, dropped={manager.dropped_total}")
+    
+    manager, items, _ = asyncio.run(scenario("drop_newest"))
+    tests_total += 1
+    if items == ['{"id": 0}', '{"id": 1}'] and manager.dropped_messages["conn_123"] == 2:
+        print("[OK] drop_newest отбрасывает новые сообщения")
+        tests_passed += 1
+    else:
+        print(f"[X] drop_newest failed: {items}")
+    
+    manager, items, _ = asyncio.run(scenario("disconnect"))
+    tests_total += 1
+    if items == [None] and manager.get_active_connections() == 0 and manager.slow_consumers_disconnected == 2:
+        print("[OK] disconnect отключает медленного потребителя")
+        tests_passed += 1
+    else:
+        print(f"[X] disconnect failed: {items}, active={manager.get_active_connections()}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_async_database():
+    """Тест 3c: Асинхронный слой базы данных"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3c: Проверка асинхронной БД")
+    print("="*60)
+    
+    import asyncio
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.database import Base, to_async_url
+    from app.models import User
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    cases = [
+        ("sqlite:///./app.db", "sqlite+aiosqlite:///./app.db"),
+        ("postgresql://u:p@db:5432/mcp", "postgresql+asyncpg://u:p@db:5432/mcp"),
+        ("sqlite+aiosqlite:///./app.db", "sqlite+aiosqlite:///./app.db"),
+    ]
+    for url, expected in cases:
+        tests_total += 1
+        if to_async_url(url) == expected:
+            print(f"[OK] to_async_url('{url}')")
+            tests_passed += 1
+        else:
+            print(f"[X] to_async_url('{url}') = {to_async_url(url)}")
+    
+    async def roundtrip():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            db.add(User(email="async@example.com", hashed_password="x", full_name="Async"))
+            await db.commit()
+        async with session_factory() as db:
+            user = await db.scalar(select(User).where(User.email == "async@example.com"))
+        await engine.dispose()
+        return user
+    
+    tests_total += 1
+    user = asyncio.run(roundtrip())
+    if user is not None and user.full_name == "Async":
+        print("[OK] AsyncSession: запись и чтение через aiosqlite")
+        tests_passed += 1
+    else:
+        print("[X] AsyncSession roundtrip failed")
+    
+    # Production профиль SQLite включает WAL и прагмы на каждом соединении
+    import os
+    import tempfile
+    from sqlalchemy import create_engine
+    from app.database import engine_options, install_sqlite_profile
+    
+    tests_total += 1
+    with tempfile.TemporaryDirectory() as tmp:
+        url = "sqlite:///" + os.path.join(tmp, "profile.db")
+        engine = create_engine(url, **engine_options(url))
+        install_sqlite_profile(engine, "production")
+        with engine.connect() as conn:
+            journal_mode = conn.exec_driver_sql("PRAGMA journal_mode").scalar()
+            synchronous = conn.exec_driver_sql("PRAGMA synchronous").scalar()
+            busy_timeout = conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+        engine.dispose()
+    if journal_mode == "wal" and synchronous == 1 and busy_timeout == 5000:
+        print("[OK] SQLite production профиль: WAL, synchronous=NORMAL, busy_timeout")
+        tests_passed += 1
+    else:
+        print(f"[X] SQLite профиль: journal_mode={journal_mode}, synchronous={synchronous}, busy_timeout={busy_timeout}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_activity_log_writer():
+    """Тест 3d: Пакетная запись ActivityLog"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3d: Проверка ActivityLogWriter")
+    print("="*60)
+    
+    import asyncio
+    from sqlalchemy import func, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.database import Base
+    from app.models import ActivityLog, ActivityRollupDaily, ActivityRollupHourly
+    from app.activity_log import ActivityLogWriter, backfill_rollups, tool_action_type
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        writer = ActivityLogWriter(session_factory, batch_size=3, flush_interval=0.05)
+        await writer.start()
+        for i in range(7):
+            writer.record(1, tool_action_type("wordpress_get_posts"), "wordpress_get_posts",
+                          details={"duration_ms": i})
+        await writer.aclose()
+        async with session_factory() as db:
+            rows = await db.scalar(select(func.count(ActivityLog.id)))
+            wordpress_rows = await db.scalar(
+                select(func.count(ActivityLog.id)).where(ActivityLog.action_type == "wordpress")
+            )
+            hourly = await db.scalar(select(func.sum(ActivityRollupHourly.action_count)))
+            daily = await db.scalar(select(func.sum(ActivityRollupDaily.action_count)))
+        await engine.dispose()
+        return writer, rows, wordpress_rows, (hourly, daily)
+    
+    writer, rows, wordpress_rows, rollups = asyncio.run(scenario())
+    tests_total += 1
+    if rows == 7 and wordpress_rows == 7 and writer.written == 7 and writer.batches >= 3:
+        print(f"[OK] 7 событий записаны пачками ({writer.batches} INSERT) и дописаны при остановке")
+        tests_passed += 1
+    else:
+        print(f"[X] ActivityLogWriter: rows={rows}, stats={writer.stats()}")
+    
+    tests_total += 1
+    if rollups == (7, 7):
+        print("[OK] Почасовые и дневные агрегаты обновляются вместе с записью логов")
+        tests_passed += 1
+    else:
+        print(f"[X] Агрегаты (hourly, daily) = {rollups}, ожидалось (7, 7)")
+    
+    # Backfill пересчитывает агрегаты для уже существующих логов
+    from datetime import datetime
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    
+    tests_total += 1
+    engine = create_engine("sqlite:///:memory:")
+    Base.metadata.create_all(engine, tables=[ActivityLog.__table__])
+    with sessionmaker(bind=engine)() as db:
+        for created_at, status in [
+            (datetime(2026, 1, 1, 10, 5), "success"),
+            (datetime(2026, 1, 1, 10, 50), "success"),
+            (datetime(2026, 1, 1, 11, 0), "error"),
+            (datetime(2026, 1, 2, 9, 0), "success"),
+        ]:
+            db.add(ActivityLog(user_id=1, action_type="wordpress", status=status, created_at=created_at))
+        db.commit()
+        result = backfill_rollups(db)
+        backfill_result = backfill_rollups(db)  # повторный запуск не удваивает счётчики
+        day_one = db.scalar(select(func.sum(ActivityRollupDaily.action_count)).where(
+            ActivityRollupDaily.day == datetime(2026, 1, 1).date()
+        ))
+    engine.dispose()
+    if result == backfill_result == {"hourly": 3, "daily": 3} and day_one == 3:
+        print("[OK] backfill_rollups() идемпотентно пересчитывает агрегаты")
+        tests_passed += 1
+    else:
+        print(f"[X] backfill_rollups(): {result}, {backfill_result}, day_one={day_one}")
+    
+    # Переполненный буфер отбрасывает события, не блокируя вызывающего
+    tests_total += 1
+    overflow = ActivityLogWriter(max_queue_size=2)
+    accepted = [overflow.record(1, "mcp", "tool") for _ in range(3)]
+    if accepted == [True, True, False] and overflow.stats()["dropped"] == 1:
+        print("[OK] Переполнение буфера считается в dropped")
+        tests_passed += 1
+    else:
+        print(f"[X] Overflow failed: {accepted}, {overflow.stats()}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_admin_pagination():
+    """Тест 3e: Keyset-пагинация списков админки"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3e: Проверка keyset-пагинации")
+    print("="*60)
+    
+    import asyncio
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.database import Base
+    from app.models import ActivityLog
+    from app.admin_routes import keyset_page
+    from app.helpers import decode_cursor
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario():
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        base = datetime(2026, 1, 1)
+        async with session_factory() as db:
+            # Две записи с одинаковым created_at проверяют разрешение по id
+            for i in range(7):
+                created_at = base + timedelta(minutes=min(i, 5))
+                db.add(ActivityLog(id=i + 1, user_id=1, action_type="mcp", created_at=created_at))
+            await db.commit()
+            
+            pages, cursor = [], None
+            while True:
+                rows, cursor, prev_cursor = await keyset_page(db, select(ActivityLog), ActivityLog, cursor, 3)
+                pages.append([row.id for row in rows])
+                if pages == [[7, 6, 5]]:
+                    second_next = cursor
+                if not cursor:
+                    break
+            # Шаг назад со второй страницы
+            _, _, prev_cursor = await keyset_page(db, select(ActivityLog), ActivityLog, second_next, 3)
+            back_rows, _, back_prev = await keyset_page(db, select(ActivityLog), ActivityLog, prev_cursor, 3)
+        await engine.dispose()
+        return pages, [row.id for row in back_rows], back_prev
+    
+    pages, back, back_prev = asyncio.run(scenario())
+    tests_total += 1
+    if pages == [[7, 6, 5], [4, 3, 2], [1]]:
+        print("[OK] Страницы вперёд по (created_at, id) без пропусков и повторов")
+        tests_passed += 1
+    else:
+        print(f"[X] Страницы вперёд: {pages}")
+    
+    tests_total += 1
+    if back == [7, 6, 5] and back_prev is None:
+        print("[OK] prev_cursor возвращает на предыдущую страницу")
+        tests_passed += 1
+    else:
+        print(f"[X] Назад: {back}, prev={back_prev}")
+    
+    tests_total += 1
+    try:
+        decode_cursor("not-a-cursor")
+        print("[X] decode_cursor() принял повреждённый курсор")
+    except ValueError:
+        print("[OK] decode_cursor() отклоняет повреждённый курсор")
+        tests_passed += 1
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_retention():
+    """Тест 3f: Архивация и удаление старых логов"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3f: Проверка retention")
+    print("="*60)
+    
+    import gzip
+    import json
+    import os
+    import tempfile
+    from datetime import datetime, timedelta
+    from sqlalchemy import create_engine, func, select
+    from sqlalchemy.orm import sessionmaker
+    from sqlalchemy.pool import StaticPool
+    from app.database import Base
+    from app.models import ActivityLog, ArchiveSummary, LoginAttempt
+    from app.retention import RetentionEngine, RetentionPolicy
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(engine)
+    session_factory = sessionmaker(bind=engine)
+    now = datetime(2026, 3, 15)
+    with session_factory() as db:
+        # 5 старых записей (январь и февраль) и 2 свежие
+        for i, days in enumerate([70, 65, 40, 35, 31, 3, 1]):
+            db.add(ActivityLog(
+                user_id=1, action_type="mcp", status="error" if i % 2 else "success",
+                created_at=now - timedelta(days=days),
+            ))
+        db.add(LoginAttempt(email="a@b.c", ip_address="127.0.0.1", success=False, created_at=now - timedelta(days=90)))
+        db.add(LoginAttempt(email="a@b.c", ip_address="127.0.0.1", success=True, created_at=now))
+        db.commit()
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        retention = RetentionEngine(
+            policies=[
+                RetentionPolicy(ActivityLog, 30, lambda row: row.status == "error"),
+                RetentionPolicy(LoginAttempt, 30, lambda row: not row.success),
+            ],
+            archive_dir=tmp,
+            batch_size=2,
+            batch_pause=0,
+            session_factory=session_factory,
+        )
+        moved = retention.run_once(now=now)
+        with gzip.open(retention.archive_path("activity_logs", "2026-01"), "rt", encoding="utf-8") as archive:
+            january = [json.loads(line) for line in archive]
+        
+        with session_factory() as db:
+            remaining = db.scalar(select(func.count(ActivityLog.id)))
+            summaries = {
+                (row.table_name, row.month): (row.row_count, row.error_count)
+                for row in db.scalars(select(ArchiveSummary))
+            }
+        moved_again = retention.run_once(now=now)
+    engine.dispose()
+    
+    tests_total += 1
+    if moved == {"activity_logs": 5, "login_attempts": 1} and remaining == 2:
+        print("[OK] Старые строки удалены пачками, свежие остались")
+        tests_passed += 1
+    else:
+        print(f"[X] Перенесено: {moved}, осталось: {remaining}")
+    
+    tests_total += 1
+    if len(january) == 2 and all(row["created_at"].startswith("2026-01") for row in january):
+        print("[OK] Архив по месяцам читается как NDJSON из нескольких gzip-пачек")
+        tests_passed += 1
+    else:
+        print(f"[X] Архив за январь: {january}")
+    
+    tests_total += 1
+    expected = {
+        ("activity_logs", "2026-01"): (2, 1),
+        ("activity_logs", "2026-02"): (3, 1),
+        ("login_attempts", "2025-12"): (1, 1),
+    }
+    if summaries == expected and moved_again == {"activity_logs": 0, "login_attempts": 0}:
+        print("[OK] archive_summaries учитывает строки и ошибки, повторный проход идемпотентен")
+        tests_passed += 1
+    else:
+        print(f"[X] Сводка архива: {summaries}, повторно: {moved_again}")
+    
+    # Аренда: пока её держит другой процесс, проход пропускается;
+    # одновременные проходы двух workers не архивируют строки дважды
+    import threading
+    from app.models import RetentionLease
+    
+    def make_engine(tmp, factory):
+        return RetentionEngine(
+            policies=[RetentionPolicy(ActivityLog, 30, lambda row: row.status == "error")],
+            archive_dir=tmp, batch_size=1, batch_pause=0.01, session_factory=factory,
+        )
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        file_engine = create_engine(f"sqlite:///{tmp}/retention.db", connect_args={"timeout": 30})
+        Base.metadata.create_all(file_engine)
+        file_factory = sessionmaker(bind=file_engine)
+        with file_factory() as db:
+            for days in range(31, 51):
+                db.add(ActivityLog(user_id=1, action_type="mcp", status="error", created_at=now - timedelta(days=days)))
+            db.add(RetentionLease(name="retention", owner="other", lease_until=datetime.utcnow() + timedelta(minutes=5)))
+            db.commit()
+        
+        blocked = make_engine(tmp, file_factory).run_once(now=now)
+        with file_factory() as db:
+            db.get(RetentionLease, "retention").lease_until = datetime.utcnow() - timedelta(seconds=1)
+            db.commit()
+        
+        workers = [make_engine(tmp, file_factory) for _ in range(2)]
+        runs = []
+        threads = [threading.Thread(target=lambda w=w: runs.append(w.run_once(now=now))) for w in workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        with file_factory() as db:
+            concurrent_left = db.scalar(select(func.count(ActivityLog.id)))
+            archived_rows = db.scalar(select(func.sum(ArchiveSummary.row_count)))
+            lease = db.get(RetentionLease, "retention")
+        archived_lines = 0
+        for month in ("2026-01", "2026-02"):
+            path = workers[0].archive_path("activity_logs", month)
+            if os.path.exists(path):
+                with gzip.open(path, "rt", encoding="utf-8") as archive:
+                    archived_lines += sum(1 for _ in archive)
+        file_engine.dispose()
+    
+    tests_total += 1
+    total_moved = sum(run.get("activity_logs", 0) for run in runs)
+    if (blocked == {} and concurrent_left == 0 and total_moved == 20 and archived_rows == 20
+            and archived_lines == 20 and lease.lease_until is None):
+        print("[OK] Аренда: занятый проход пропускается, одновременные workers не дублируют архив")
+        tests_passed += 1
+    else:
+        print(
+            f"[X] Аренда: blocked={blocked}, runs={runs}, left={concurrent_left}, "
+            f"summary={archived_rows}, archive={archived_lines}, lease={lease.lease_until}"
+        )
+    
+    # Сбой на середине пачки: архив в файле не дублируется (commit) и не теряется (после commit)
+    class FlakyEngine(RetentionEngine):
+        fail_summary = 1
+        fail_promote = 1
+        
+        def _add_summary(self, *args):
+            if self.fail_summary:
+                self.fail_summary -= 1
+                raise RuntimeError("commit failed")
+            super()._add_summary(*args)
+        
+        def _promote_pending(self, pending):
+            if self.fail_promote and not self.fail_summary:
+                self.fail_promote -= 1
+                raise RuntimeError("crash after commit")
+            RetentionEngine._promote_pending(pending)
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        flaky_engine = create_engine(f"sqlite:///{tmp}/flaky.db")
+        Base.metadata.create_all(flaky_engine)
+        flaky_factory = sessionmaker(bind=flaky_engine)
+        with flaky_factory() as db:
+            for days in range(31, 35):
+                db.add(ActivityLog(user_id=1, action_type="mcp", status="success", created_at=now - timedelta(days=days)))
+            db.commit()
+        flaky = FlakyEngine(
+            policies=[RetentionPolicy(ActivityLog, 30, lambda row: row.status == "error")],
+            archive_dir=tmp, batch_size=2, batch_pause=0, session_factory=flaky_factory,
+        )
+        failures = 0
+        for _ in range(3):
+            try:
+                flaky.run_once(now=now)
+            except RuntimeError:
+                failures += 1
+        with gzip.open(flaky.archive_path("activity_logs", "2026-02"), "rt", encoding="utf-8") as archive:
+            flaky_ids = sorted(json.loads(line)["id"] for line in archive)
+        with flaky_factory() as db:
+            flaky_left = db.scalar(select(func.count(ActivityLog.id)))
+            flaky_summary = db.scalar(select(func.sum(ArchiveSummary.row_count)))
+        leftovers = [name for name in os.listdir(os.path.join(tmp, "activity_logs")) if name.endswith(".pending")]
+        flaky_engine.dispose()
+    
+    tests_total += 1
+    if failures == 2 and flaky_ids == [1, 2, 3, 4] and flaky_left == 0 and flaky_summary == 4 and not leftovers:
+        print("[OK] Пачка попадает в файл архива только после commit и ровно один раз")
+        tests_passed += 1
+    else:
+        print(f"[X] Сбой пачки: failures={failures}, archive={flaky_ids}, left={flaky_left}, summary={flaky_summary}, pending={leftovers}")
+    
+    # /admin/stats: без архивации - счётчики за всё время, после - окно от последнего архивного месяца
+    import asyncio
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app.admin_routes import get_platform_stats
+    from app.models import ActivityRollupDaily
+    
+    async def stats_scenario(db_path):
+        stats_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with stats_engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        stats_factory = async_sessionmaker(stats_engine, expire_on_commit=False)
+        results = {}
+        try:
+            async with stats_factory() as db:
+                for day, count in [(datetime(2025, 6, 1), 5), (datetime(2026, 1, 10), 3), (datetime(2026, 2, 20), 2)]:
+                    db.add(ActivityRollupDaily(day=day.date(), user_id=1, action_type="wordpress", status="success", action_count=count))
+                db.add(ActivityLog(user_id=1, action_type="wordpress", status="success", created_at=datetime(2026, 2, 20)))
+                await db.commit()
+                results["baseline"] = await db.scalar(select(func.sum(ActivityRollupDaily.action_count)))
+                results["default"] = await get_platform_stats(include_archived=False, admin_user=None, db=db)
+                db.add(ArchiveSummary(table_name="activity_logs", month="2026-01", row_count=8, error_count=0))
+                await db.commit()
+                results["archived"] = await get_platform_stats(include_archived=False, admin_user=None, db=db)
+                results["with_archive"] = await get_platform_stats(include_archived=True, admin_user=None, db=db)
+        finally:
+            await stats_engine.dispose()
+        return results
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = asyncio.run(stats_scenario(os.path.join(tmp, "stats.db")))
+    
+    tests_total += 1
+    if (stats["default"]["activity"]["total"] == stats["baseline"] == 10
+            and stats["archived"]["activity"]["total"] == 2
+            and stats["with_archive"]["activity"]["total"] == 10):
+        print("[OK] /admin/stats: по умолчанию всё время, окно только после архивных месяцев")
+        tests_passed += 1
+    else:
+        print(
+            f"[X] /admin/stats: baseline={stats['baseline']}, default={stats['default']['activity']}, "
+            f"archived={stats['archived']['activity']}, with_archive={stats['with_archive']['activity']}"
+        )
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_admin_export():
+    """Тест 3g: Потоковый экспорт логов админки"""
+    print("\n" + "="*60)
+    print("ТЕСТ 3g: Проверка экспорта логов")
+    print("="*60)
+    
+    import asyncio
+    import csv
+    import gzip
+    import io
+    import json
+    import os
+    import tempfile
+    from datetime import datetime, timedelta
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import admin_routes
+    from app.database import Base
+    from app.models import ActivityLog, AdminLog, User
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def read_body(response):
+        return b"".join([chunk async for chunk in response.body_iterator])
+    
+    async def scenario(db_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        original_session_local = admin_routes.AsyncSessionLocal
+        admin_routes.AsyncSessionLocal = session_factory
+        results = {}
+        try:
+            async with session_factory() as db:
+                admin = User(email="export@example.com", hashed_password="x", full_name="Export", is_admin=True)
+                db.add(admin)
+                await db.flush()
+                base = datetime(2026, 3, 1)
+                for i in range(12):
+                    db.add(ActivityLog(
+                        user_id=admin.id if i % 3 else admin.id + 1,
+                        action_type="wordpress" if i % 2 else "telegram",
+                        action_name=f"запись, \"{i}\"",
+                        status="error" if i % 4 == 0 else "success",
+                        created_at=base + timedelta(minutes=i),
+                    ))
+                await db.commit()
+                
+                async def export(**params):
+                    params = {"format": "ndjson", "gzip": False, "user_id": None, "action_type": None,
+                              "status": None, "since": None, "until": None, **params}
+                    response = await admin_routes.export_activity_logs(request=None, admin_user=admin, db=db, **params)
+                    return response, await read_body(response)
+                
+                response, body = await export()
+                results["ndjson_type"] = response.media_type
+                results["ndjson"] = [json.loads(line) for line in body.decode().splitlines()]
+                
+                response, body = await export(format="csv")
+                results["csv"] = list(csv.reader(io.StringIO(body.decode())))
+                
+                response, body = await export(gzip=True)
+                results["gzip_type"] = response.media_type
+                results["gzip_disposition"] = response.headers["content-disposition"]
+                results["gzip"] = [json.loads(line) for line in gzip.decompress(body).decode().splitlines()]
+                
+                # Фильтры экспорта совпадают с фильтрами /admin/logs
+                results["filters"] = []
+                for filters in [{"user_id": admin.id}, {"action_type": "telegram"}, {"status": "error"},
+                                {"user_id": admin.id, "action_type": "wordpress", "status": "success"}]:
+                    _, body = await export(**filters)
+                    exported = sorted(json.loads(line)["id"] for line in body.decode().splitlines())
+                    listed = await admin_routes.get_activity_logs(
+                        cursor=None, limit=500, include_total=False, admin_user=admin, db=db,
+                        **{"user_id": None, "action_type": None, "status": None, **filters},
+                    )
+                    results["filters"].append((exported, sorted(log["id"] for log in listed["logs"])))
+                
+                try:
+                    await export(format="xml")
+                    results["bad_format"] = None
+                except admin_routes.HTTPException as exc:
+                    results["bad_format"] = exc.status_code
+                results["audit"] = (await db.scalars(select(AdminLog.action_type))).all()
+        finally:
+            admin_routes.AsyncSessionLocal = original_session_local
+            await engine.dispose()
+        return results
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        results = asyncio.run(scenario(os.path.join(tmp, "export.db")))
+    
+    tests_total += 1
+    ndjson = results["ndjson"]
+    if (results["ndjson_type"] == "application/x-ndjson" and [row["id"] for row in ndjson] == list(range(1, 13))
+            and ndjson[1]["action_name"] == "запись, \"1\"" and ndjson[0]["created_at"] == "2026-03-01T00:00:00"):
+        print("[OK] NDJSON: по строке JSON на запись в порядке created_at")
+        tests_passed += 1
+    else:
+        print(f"[X] NDJSON: {results['ndjson_type']}, {ndjson[:2]}")
+    
+    tests_total += 1
+    rows = results["csv"]
+    if (rows[0] == ["id", "user_id", "action_type", "action_name", "status", "details",
+                    "error_message", "ip_address", "created_at"]
+            and len(rows) == 13 and rows[2][3] == "запись, \"1\""):
+        print("[OK] CSV: заголовок и экранирование значений")
+        tests_passed += 1
+    else:
+        print(f"[X] CSV: {rows[:3]}")
+    
+    tests_total += 1
+    if (results["gzip"] == ndjson and results["gzip_type"] == "application/gzip"
+            and results["gzip_disposition"].endswith('.ndjson.gz"')):
+        print("[OK] gzip распаковывается в тот же NDJSON")
+        tests_passed += 1
+    else:
+        print(f"[X] gzip: {results['gzip_type']}, {results['gzip_disposition']}, строк {len(results['gzip'])}")
+    
+    tests_total += 1
+    if all(exported == listed and exported for exported, listed in results["filters"]):
+        print("[OK] Фильтры user_id/action_type/status совпадают с /admin/logs")
+        tests_passed += 1
+    else:
+        print(f"[X] Фильтры (экспорт, список): {results['filters']}")
+    
+    tests_total += 1
+    if results["bad_format"] == 400 and results["audit"].count("logs_export") == 7:
+        print("[OK] Неизвестный формат отклоняется, каждый экспорт записан в admin_logs")
+        tests_passed += 1
+    else:
+        print(f"[X] Формат: {results['bad_format']}, admin_logs: {results['audit']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
 def test_wordpress_tools():
     """Тест 4: Проверка WordPress tools структуры"""
     print("\n" + "="*60)
@@ -317,20 +1173,901 @@ def test_wordpress_tools():
     return tests_passed == tests_total
 
 
-def test_wordstat_tools():
-    """Тест 5: Проверка Wordstat tools структуры"""
+def test_http_client_registry():
+    """Тест 4a: Общие httpx клиенты по origin"""
     print("\n" + "="*60)
-    print("ТЕСТ 5: Проверка Wordstat tools")
+    print("ТЕСТ 4a: Проверка реестра HTTP клиентов")
     print("="*60)
     
-    from app.wordstat_tools import handle_wordstat_tool
+    import asyncio
+    import httpx
+    from app.http_clients import HttpClientRegistry
     
     tests_passed = 0
     tests_total = 0
     
-    # Check that handler exists
-    tests_total += 1
-    if callable(handle_wordstat_tool):
+    async def scenario():
+        registry = HttpClientRegistry("test", max_clients=1)
+        await registry.start()
+        results = {}
+        
+        # Set-Cookie ответа одному пользователю не должен уйти в запрос другого
+        shared = registry.get_client("https://a.example/wp-json")
+        request = httpx.Request("GET", "https://a.example/wp-json/wp/v2/users/me")
+        response = httpx.Response(200, headers={"Set-Cookie": "wordpress_logged_in=alice; Path=/"}, request=request)
+        shared.cookies.extract_cookies(response)
+        results["cookies"] = len(shared.cookies)
+        
+        # Клиент, вытесненный во время запроса, закрывается после его завершения
+        async with registry.client("https://a.example/wp-json") as in_flight:
+            registry.get_client("https://b.example")
+            await asyncio.sleep(0)
+            results["closed_in_flight"] = in_flight.is_closed
+        await asyncio.sleep(0)
+        results["closed_after"] = in_flight.is_closed
+        
+        # Простаивающий клиент закрывается сразу
+        idle = registry.get_client("https://b.example")
+        registry.get_client("https://c.example")
+        await asyncio.sleep(0)
+        results["idle_closed"] = idle.is_closed
+        results["in_use"] = len(registry._in_use) + len(registry._retired)
+        await registry.aclose()
+        return results
+    
+    results = asyncio.run(scenario())
+    
+    tests_total += 1
+    if results["cookies"] == 0:
+        print("[OK] Общий клиент origin не сохраняет cookies")
+        tests_passed += 1
+    else:
+        print(f"[X] Сохранено cookies: {results['cookies']}")
+    
+    tests_total += 1
+    if (not results["closed_in_flight"] and results["closed_after"] and results["idle_closed"]
+            and results["in_use"] == 0):
+        print("[OK] Вытесненный клиент закрывается только после выполняющихся запросов")
+        tests_passed += 1
+    else:
+        print(f"[X] Вытеснение: {results}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_wordpress_bulk():
+    """Тест 4b: Параллельный bulk_update_posts с повторами при 429"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4b: Проверка массового обновления постов")
+    print("="*60)
+    
+    import asyncio
+    import httpx
+    from app.models import UserSettings
+    from app.bulk_executor import BulkExecutor
+    from app.http_clients import wordpress_http
+    import app.wordpress_tools as wordpress_tools
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    settings = UserSettings(
+        wordpress_url="https://bulk.example.com",
+        wordpress_username="admin",
+        wordpress_password="secret",
+    )
+    
+    async def scenario():
+        state = {"active": 0, "max_active": 0, "calls": {}}
+        
+        async def handler(request):
+            post_id = int(request.url.path.rsplit("/", 1)[1])
+            state["calls"][post_id] = state["calls"].get(post_id, 0) + 1
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+            await asyncio.sleep(0.01)
+            state["active"] -= 1
+            if post_id == 3 and state["calls"][post_id] == 1:
+                return httpx.Response(429, headers={"Retry-After": "0"}, text="slow down")
+            if post_id == 5:
+                return httpx.Response(404, text="not found")
+            return httpx.Response(200, json={"id": post_id})
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        original = wordpress_tools.wordpress_bulk
+        wordpress_tools.wordpress_bulk = BulkExecutor(concurrency_per_host=2, base_delay=0.01)
+        events = []
+        
+        async def progress(done, total, message):
+            events.append((done, total, message))
+        
+        try:
+            result = await wordpress_tools.wordpress_bulk_update_posts(
+                settings, {"post_ids": [1, 2, 3, 4, 5, 6], "updates": {"status": "publish"}}, progress=progress
+            )
+            # Bulk вариант одиночного инструмента: defaults + items, частичные ошибки
+            moderate = await wordpress_tools.handle_wordpress_tool(
+                "wordpress_bulk_moderate_comments",
+                settings,
+                {"items": [{"comment_id": 1}, {"comment_id": 2, "status": "bogus"}, {"comment_id": 5}], "defaults": {"status": "spam"}},
+            )
+        finally:
+            wordpress_tools.wordpress_bulk = original
+            await wordpress_http._clients.pop(origin).aclose()
+        return result, moderate, state, events
+    
+    result, moderate, state, events = asyncio.run(scenario())
+    
+    tests_total += 1
+    if result.startswith("✅ Обновлено постов: 5/6") and "Post 5: WordPress API ошибка 404" in result:
+        print("[OK] Итоговый отчёт сохраняет формат обновлено/ошибки")
+        tests_passed += 1
+    else:
+        print(f"[X] Отчёт: {result}")
+    
+    tests_total += 1
+    if state["calls"].get(3) == 2 and state["max_active"] == 2:
+        print("[OK] 429 повторяется, параллельность ограничена лимитом хоста")
+        tests_passed += 1
+    else:
+        print(f"[X] Вызовы: {state['calls']}, параллельно: {state['max_active']}")
+    
+    tests_total += 1
+    if [event[0] for event in events] == [1, 2, 3, 4, 5, 6] and all(event[1] == 6 for event in events):
+        print("[OK] Прогресс отправляется по каждому посту")
+        tests_passed += 1
+    else:
+        print(f"[X] Прогресс: {events}")
+    
+    tests_total += 1
+    if (moderate.startswith("✅ Обработано комментариев: 1/3")
+            and "#2 (comment_id=2): Ошибка: status должен быть" in moderate
+            and "#3 (comment_id=5): WordPress API ошибка 404" in moderate):
+        print("[OK] Bulk вариант write-инструмента собирает частичные ошибки")
+        tests_passed += 1
+    else:
+        print(f"[X] Bulk модерация: {moderate}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_wordpress_pagination():
+    """Тест 4c: Автопагинация коллекций WordPress"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4c: Проверка автопагинации WordPress")
+    print("="*60)
+    
+    import asyncio
+    import httpx
+    from app.models import UserSettings
+    from app.http_clients import wordpress_http
+    from app.wordpress_tools import WordPressCollection, wordpress_get_posts
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    settings = UserSettings(
+        wordpress_url="https://pages.example.com",
+        wordpress_username="admin",
+        wordpress_password="secret",
+    )
+    total_posts = 250
+    
+    async def scenario():
+        requests = []
+        
+        async def handler(request):
+            params = request.url.params
+            requests.append(dict(params))
+            page, per_page = int(params["page"]), int(params["per_page"])
+            ids = range((page - 1) * per_page + 1, min(page * per_page, total_posts) + 1)
+            # Поздние страницы отвечают быстрее - порядок должен сохраниться
+            await asyncio.sleep(0.02 / page)
+            return httpx.Response(
+                200,
+                headers={"X-WP-Total": str(total_posts), "X-WP-TotalPages": str(-(-total_posts // per_page))},
+                json=[{"id": i, "title": {"rendered": f"Post {i}"}, "status": "publish", "date": "2026-01-01"} for i in ids],
+            )
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            all_ids = [post["id"] async for post in WordPressCollection(
+                settings, "/wp-json/wp/v2/posts", fields=["id"], limit=10000
+            )]
+            requests_all = list(requests)
+            requests.clear()
+            limited = await wordpress_get_posts(settings, {"per_page": 150})
+            requests_limited = list(requests)
+        finally:
+            await wordpress_http._clients.pop(origin).aclose()
+        return all_ids, requests_all, limited, requests_limited
+    
+    all_ids, requests_all, limited, requests_limited = asyncio.run(scenario())
+    
+    tests_total += 1
+    if all_ids == list(range(1, total_posts + 1)) and len(requests_all) == 3:
+        print("[OK] Все страницы получены параллельно, порядок элементов сохранён")
+        tests_passed += 1
+    else:
+        print(f"[X] Получено {len(all_ids)} элементов за {len(requests_all)} запросов")
+    
+    tests_total += 1
+    if all(request.get("_fields") == "id" for request in requests_all):
+        print("[OK] _fields сокращает ответы до нужных полей")
+        tests_passed += 1
+    else:
+        print(f"[X] Параметры запросов: {requests_all}")
+    
+    tests_total += 1
+    if (limited.startswith("Найдено 150 постов (всего на сайте: 250)")
+            and len(requests_limited) == 2 and "ID: 150\n" in limited and "ID: 151\n" not in limited):
+        print("[OK] per_page больше 100 запрашивает только нужные страницы")
+        tests_passed += 1
+    else:
+        print(f"[X] Запросов: {len(requests_limited)}, ответ: {limited[:80]}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_wordpress_cache():
+    """Тест 4d: Кэш GET запросов WordPress с ревалидацией"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4d: Проверка кэша WordPress GET")
+    print("="*60)
+    
+    import asyncio
+    import httpx
+    from app.models import UserSettings
+    from app.http_clients import ResponseCache, wordpress_http
+    import app.wordpress_tools as wordpress_tools
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    settings = UserSettings(
+        wordpress_url="https://cache.example.com",
+        wordpress_username="admin",
+        wordpress_password="secret",
+    )
+    
+    async def scenario(cache):
+        state = {"tags": [{"id": 1, "name": "python", "count": 3}], "version": 1, "requests": []}
+        
+        async def handler(request):
+            etag = f'"v{state["version"]}"'
+            state["requests"].append((request.method, request.headers.get("If-None-Match")))
+            if request.method == "POST":
+                state["tags"].append({"id": 2, "name": "fastapi", "count": 0})
+                state["version"] += 1
+                return httpx.Response(201, json={"id": 2, "name": "fastapi"})
+            if request.headers.get("If-None-Match") == etag:
+                return httpx.Response(304, headers={"ETag": etag})
+            return httpx.Response(
+                200, headers={"ETag": etag, "X-WP-Total": str(len(state["tags"])), "X-WP-TotalPages": "1"},
+                json=state["tags"],
+            )
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        original = wordpress_tools.wordpress_cache
+        wordpress_tools.wordpress_cache = cache
+        try:
+            first = await wordpress_tools.wordpress_get_tags(settings, {})
+            second = await wordpress_tools.wordpress_get_tags(settings, {})
+            await wordpress_tools.wordpress_create_tag(settings, {"name": "fastapi"})
+            after_write = await wordpress_tools.wordpress_get_tags(settings, {})
+        finally:
+            wordpress_tools.wordpress_cache = original
+            await wordpress_http._clients.pop(origin).aclose()
+        return first, second, after_write, state["requests"]
+    
+    fresh_cache = ResponseCache(ttl_seconds=60)
+    first, second, after_write, requests = asyncio.run(scenario(fresh_cache))
+    tests_total += 1
+    if first == second and [method for method, _ in requests] == ["GET", "POST", "GET"] and "fastapi" in after_write:
+        print("[OK] Повторный GET отдаётся из кэша, запись сбрасывает список тегов")
+        tests_passed += 1
+    else:
+        print(f"[X] Запросы: {requests}")
+    
+    stale_cache = ResponseCache(ttl_seconds=0)
+    first, second, _, requests = asyncio.run(scenario(stale_cache))
+    stats = stale_cache.stats()
+    tests_total += 1
+    if first == second and requests[1] == ("GET", '"v1"') and requests[3] == ("GET", None) and stats["revalidated"] == 1:
+        print("[OK] Устаревшая запись ревалидируется по ETag (304)")
+        tests_passed += 1
+    else:
+        print(f"[X] Запросы: {requests}, статистика: {stats}")
+    
+    tests_total += 1
+    fresh_stats = fresh_cache.stats()
+    if fresh_stats["hits"] == 1 and fresh_stats["bytes_saved"] > 0 and stats["hit_rate"] == round(1 / 3, 4):
+        print("[OK] Метрики кэша: hit rate и сэкономленные байты")
+        tests_passed += 1
+    else:
+        print(f"[X] Метрики: {fresh_stats}, {stats}")
+    
+    async def credentials_scenario():
+        import base64
+        cache = ResponseCache(ttl_seconds=60)
+        seen = []
+        
+        async def handler(request):
+            seen.append(request.headers.get("Authorization"))
+            if request.headers.get("Authorization") != "Basic " + base64.b64encode(b"admin:secret").decode():
+                return httpx.Response(401, json={"code": "invalid_username"})
+            return httpx.Response(200, json=[{"id": 7, "title": {"rendered": "Черновик"}, "status": "draft"}])
+        
+        revoked = UserSettings(
+            wordpress_url="https://cache.example.com",
+            wordpress_username="admin",
+            wordpress_password="revoked",
+        )
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        original = wordpress_tools.wordpress_cache
+        wordpress_tools.wordpress_cache = cache
+        try:
+            await wordpress_tools.wordpress_api_call("GET", "/wp-json/wp/v2/posts", settings, params={"status": "any"})
+            try:
+                await wordpress_tools.wordpress_api_call("GET", "/wp-json/wp/v2/posts", revoked, params={"status": "any"})
+                denied = False
+            except wordpress_tools.WordPressAPIError as e:
+                denied = e.status_code == 401
+        finally:
+            wordpress_tools.wordpress_cache = original
+            await wordpress_http._clients.pop(origin).aclose()
+        return denied, len(seen)
+    
+    denied, requests_made = asyncio.run(credentials_scenario())
+    tests_total += 1
+    if denied and requests_made == 2:
+        print("[OK] Аккаунт с тем же логином и другим паролем не получает чужие ответы из кэша")
+        tests_passed += 1
+    else:
+        print(f"[X] Отказ: {denied}, запросов к сайту: {requests_made}")
+    
+    # Индекс ресурсов не растёт за пределы LRU при разных параметрах одного ресурса
+    small_cache = ResponseCache(ttl_seconds=60, max_entries=3)
+    for i in range(20):
+        small_cache.store(
+            ("https://wp.example", "posts", "/wp-json/wp/v2/posts", "c", (("page", str(i)),)),
+            httpx.Response(200, json=[]),
+        )
+    small_cache.store(("https://wp.example", "pages", "/wp-json/wp/v2/pages", "c", ()), httpx.Response(200, json=[]))
+    for i in range(3):
+        small_cache.store(
+            ("https://wp.example", "users", "/wp-json/wp/v2/users", "c", (("page", str(i)),)),
+            httpx.Response(200, json=[]),
+        )
+    indexed = sum(len(keys) for keys in small_cache._keys_by_resource.values())
+    tests_total += 1
+    if indexed == 3 and list(small_cache._keys_by_resource) == [("https://wp.example", "users")]:
+        print("[OK] Вытесненные ключи удаляются из индекса ресурсов, пустые ресурсы не остаются")
+        tests_passed += 1
+    else:
+        print(f"[X] Ключей в индексе: {indexed}, ресурсы: {list(small_cache._keys_by_resource)}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_wordpress_media_stream():
+    """Тест 4e: Потоковая загрузка медиафайла через локальный stub-сервер"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4e: Проверка потоковой загрузки медиа")
+    print("="*60)
+    
+    import asyncio
+    import json
+    import threading
+    import tracemalloc
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from app.models import UserSettings
+    from app.http_clients import wordpress_http
+    import app.wordpress_tools as wordpress_tools
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    file_size = 16 * 1024 * 1024
+    chunk = b"\x00" * 65536
+    received = {}
+    
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        
+        def log_message(self, *args):
+            pass
+        
+        def do_GET(self):
+            # /photo.png - PNG без расширения в Content-Type, /page - HTML вместо файла
+            if self.path == "/page":
+                body = b"<html>not a file</html>"
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(file_size))
+            self.end_headers()
+            try:
+                self.wfile.write(b"\x89PNG\r\n\x1a\n" + chunk[8:])
+                for _ in range(file_size // len(chunk) - 1):
+                    self.wfile.write(chunk)
+            except (BrokenPipeError, ConnectionResetError):
+                # Клиент прервал скачивание (превышение лимита)
+                pass
+        
+        def do_POST(self):
+            # Заглушка /wp-json/wp/v2/media: читает тело кусками и считает байты
+            remaining = int(self.headers["Content-Length"])
+            total = 0
+            while remaining:
+                data = self.rfile.read(min(remaining, 65536))
+                total += len(data)
+                remaining -= len(data)
+            received.update({
+                "bytes": total,
+                "type": self.headers["Content-Type"],
+                "disposition": self.headers["Content-Disposition"],
+                "path": self.path,
+            })
+            body = json.dumps({"id": 77, "source_url": "http://stub/wp-content/uploads/photo.png"}).encode()
+            self.send_response(201)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    settings = UserSettings(wordpress_url=base_url, wordpress_username="admin", wordpress_password="secret")
+    
+    async def scenario():
+        try:
+            uploaded = await wordpress_tools.wordpress_upload_media(
+                settings, {"file_url": f"{base_url}/photo", "title": "Фото"}
+            )
+            # Память повторной загрузки (без однократных ленивых импортов httpx)
+            tracemalloc.start()
+            await wordpress_tools.wordpress_upload_media(settings, {"file_url": f"{base_url}/photo"})
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            html = await wordpress_tools.wordpress_upload_image_from_url(settings, {"url": f"{base_url}/page"})
+            original_cap = wordpress_tools.WP_MEDIA_MAX_BYTES
+            wordpress_tools.WP_MEDIA_MAX_BYTES = 1024 * 1024
+            too_big = await wordpress_tools.wordpress_upload_media(settings, {"file_url": f"{base_url}/photo"})
+            wordpress_tools.WP_MEDIA_MAX_BYTES = original_cap
+        finally:
+            await wordpress_http.aclose()
+        return uploaded, peak, html, too_big
+    
+    try:
+        uploaded, peak, html, too_big = asyncio.run(scenario())
+    finally:
+        server.shutdown()
+        server.server_close()
+    
+    tests_total += 1
+    if (uploaded.startswith("✅ Медиафайл загружен!") and received.get("bytes") == file_size
+            and received.get("type") == "image/png" and 'filename="photo.png"' in received.get("disposition", "")):
+        print("[OK] Файл передан целиком, тип определён по сигнатуре")
+        tests_passed += 1
+    else:
+        print(f"[X] Загрузка: {uploaded}, stub получил: {received}")
+    
+    tests_total += 1
+    if peak < 4 * 1024 * 1024:
+        print(f"[OK] Пиковая память {peak / 1024 / 1024:.1f} МБ на файл {file_size // (1024 * 1024)} МБ")
+        tests_passed += 1
+    else:
+        print(f"[X] Пиковая память {peak / 1024 / 1024:.1f} МБ")
+    
+    tests_total += 1
+    if "HTML страница" in html and "больше лимита" in too_big:
+        print("[OK] HTML вместо файла и превышение лимита отклоняются")
+        tests_passed += 1
+    else:
+        print(f"[X] HTML: {html}, лимит: {too_big}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_content_index():
+    """Тест 4f: Локальный поисковый индекс WordPress (SQLite FTS5)"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4f: Проверка локального поискового индекса")
+    print("="*60)
+    
+    import asyncio
+    import json
+    import os
+    import tempfile
+    import httpx
+    from app import wordpress_tools
+    from app.content_index import ContentIndex
+    from app.http_clients import wordpress_http
+    from app.models import UserSettings
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    settings = UserSettings(
+        wordpress_url="https://index.example.com",
+        wordpress_username="admin",
+        wordpress_password="secret",
+        mcp_connector_id="index-test",
+    )
+    site = {
+        "posts": {
+            1: {"title": "Кофе по-турецки", "excerpt": "<p>Рецепт &laquo;кофе&raquo; в турке</p>", "modified": "2026-01-01T10:00:00"},
+            2: {"title": "Котики и кофе", "excerpt": "<p>Фотографии</p>", "modified": "2026-01-02T10:00:00"},
+            3: {"title": "Новости сайта", "excerpt": "", "modified": "2026-01-03T10:00:00"},
+        },
+        "pages": {
+            10: {"title": "О кофейне", "excerpt": "<p>Контакты</p>", "modified": "2026-01-01T09:00:00"},
+        },
+    }
+    
+    async def scenario(index):
+        requests = []
+        
+        async def handler(request):
+            params = dict(request.url.params)
+            if request.method in ("POST", "DELETE"):
+                # Запись через инструменты: /posts или /posts/{id}
+                parts = request.url.path.rstrip("/").split("/")
+                kind, wp_id = (parts[-1], 100) if parts[-1] in site else (parts[-2], int(parts[-1]))
+                if request.method == "DELETE":
+                    site[kind].pop(wp_id, None)
+                    return httpx.Response(200, json={"deleted": True, "previous": {"id": wp_id}})
+                body = json.loads(request.content)
+                item = site[kind].setdefault(wp_id, {"title": "", "excerpt": "", "status": "draft"})
+                item.update({key: body[key] for key in ("title", "status") if key in body})
+                item["modified"] = "2026-01-07T10:00:00"
+                return httpx.Response(200, json={
+                    "id": wp_id, "title": {"rendered": item["title"]}, "excerpt": {"rendered": item["excerpt"]},
+                    "modified": item["modified"], "status": item["status"], "link": "", "categories": [], "tags": [],
+                })
+            kind = request.url.path.rstrip("/").split("/")[-1]
+            requests.append((kind, params))
+            items = [
+                {"id": wp_id, "title": {"rendered": item["title"]}, "excerpt": {"rendered": item["excerpt"]},
+                 "modified": item["modified"], "date": item["modified"], "status": item.get("status", "publish"),
+                 "link": f"https://index.example.com/?p={wp_id}", "categories": [1], "tags": []}
+                for wp_id, item in site[kind].items()
+                if ("modified_after" not in params or item["modified"] > params["modified_after"])
+                and item.get("status", "publish") in params.get("status", "publish").split(",")
+            ]
+            if "search" in params:
+                items = [item for item in items if params["search"] in item["title"]["rendered"].lower()]
+            items.sort(key=lambda item: item["modified"])
+            return httpx.Response(200, headers={"X-WP-Total": str(len(items)), "X-WP-TotalPages": "1"}, json=items)
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        original = wordpress_tools.content_index
+        wordpress_tools.content_index = index
+        try:
+            results = {"live": await wordpress_tools.wordpress_search_posts(settings, {"search": "кофе"})}
+            results["live_requests"] = len(requests)
+            
+            results["sync"] = await wordpress_tools.wordpress_sync_index(settings, {})
+            requests.clear()
+            results["indexed"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "кофе"})
+            results["prefix"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "коти"})
+            results["pages"] = await wordpress_tools.wordpress_search_pages(settings, {"search": "контакты"})
+            results["index_requests"] = len(requests)
+            
+            site["posts"][3] = {"title": "Новости кофейни", "excerpt": "", "modified": "2026-01-05T10:00:00"}
+            results["resync"] = await wordpress_tools.wordpress_sync_index(settings, {})
+            results["resync_params"] = [params for kind, params in requests if kind == "posts"]
+            results["updated"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "новости"})
+            
+            # Пост убрали в корзину: инкрементальная синхронизация удаляет его из индекса
+            site["posts"][1] = {**site["posts"][1], "status": "trash", "modified": "2026-01-06T10:00:00"}
+            results["trashed"] = await wordpress_tools.wordpress_sync_index(settings, {})
+            results["after_trash"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "турецки"})
+            
+            del site["posts"][2]
+            results["full"] = await wordpress_tools.wordpress_sync_index(settings, {"full": True})
+            results["after_full"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "котики"})
+            
+            # Запись через инструменты сразу видна в индексе, без синхронизации
+            requests.clear()
+            await wordpress_tools.wordpress_create_post(settings, {"title": "Свежий эспрессо", "content": "x", "status": "publish"})
+            results["created"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "эспрессо"})
+            await wordpress_tools.wordpress_update_post(settings, {"post_id": 100, "status": "draft"})
+            results["drafted"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "эспрессо"})
+            await wordpress_tools.wordpress_update_post(settings, {"post_id": 100, "status": "publish"})
+            await wordpress_tools.wordpress_delete_post(settings, {"post_id": 100})
+            results["deleted"] = await wordpress_tools.wordpress_search_posts(settings, {"search": "эспрессо"})
+            results["write_requests"] = len(requests)
+        finally:
+            wordpress_tools.content_index = original
+            await index.close()
+            await wordpress_http._clients.pop(origin).aclose()
+        return results
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        results = asyncio.run(scenario(ContentIndex(path=os.path.join(tmp, "index.db"))))
+    
+    # Массовый импорт: больше batch_size постов с одним modified
+    bulk_site = {
+        wp_id: {"title": f"Импорт {wp_id}", "modified": "2026-02-01T00:00:00"} for wp_id in range(1, 8)
+    }
+    bulk_site[8] = {"title": "Позже", "modified": "2026-02-02T00:00:00"}
+    
+    async def bulk_scenario(index):
+        async def handler(request):
+            params = dict(request.url.params)
+            kind = request.url.path.rstrip("/").split("/")[-1]
+            source = bulk_site if kind == "posts" else {}
+            items = sorted(
+                (
+                    {"id": wp_id, "title": {"rendered": item["title"]}, "excerpt": {"rendered": ""},
+                     "modified": item["modified"], "status": "publish", "link": "", "categories": [], "tags": []}
+                    for wp_id, item in source.items()
+                    if "modified_after" not in params or item["modified"] > params["modified_after"]
+                ),
+                key=lambda item: (item["modified"], item["id"]),
+            )
+            per_page, page = int(params["per_page"]), int(params["page"])
+            pages = max(1, -(-len(items) // per_page))
+            chunk = items[(page - 1) * per_page:page * per_page]
+            return httpx.Response(200, headers={"X-WP-Total": str(len(items)), "X-WP-TotalPages": str(pages)}, json=chunk)
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        try:
+            first = await index.sync(settings)
+            bulk_site[3] = {"title": "Импорт 3 исправлен", "modified": "2026-02-03T00:00:00"}
+            again = await index.sync(settings)
+            full = await index.sync(settings, full=True)
+        finally:
+            await index.close()
+            await wordpress_http._clients.pop(origin).aclose()
+        return first, again, full
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        bulk = asyncio.run(bulk_scenario(ContentIndex(path=os.path.join(tmp, "bulk.db"), batch_size=3)))
+    
+    tests_total += 1
+    if results["live"].startswith("Найдено 2 постов") and results["live_requests"] == 1:
+        print("[OK] Без индекса поиск идёт на сайт (?search=)")
+        tests_passed += 1
+    else:
+        print(f"[X] Live поиск: {results['live'][:80]}")
+    
+    tests_total += 1
+    if ("Посты: обновлено 3" in results["sync"] and "Страницы: обновлено 1" in results["sync"]
+            and results["index_requests"] == 0
+            and "Найдено 2 постов" in results["indexed"] and "индекс от" in results["indexed"]
+            and "ID: 2\n" in results["prefix"] and "ID: 10\n" in results["pages"]):
+        print("[OK] Поиск из индекса без запросов к сайту (в т.ч. по префиксу и excerpt)")
+        tests_passed += 1
+    else:
+        print(f"[X] Синхронизация: {results['sync']}, поиск: {results['indexed'][:80]}, запросов: {results['index_requests']}")
+    
+    tests_total += 1
+    if ("Посты: обновлено 1" in results["resync"] and "Страницы: обновлено 0" in results["resync"]
+            and results["resync_params"] and results["resync_params"][0].get("modified_after")
+            and "Новости кофейни" in results["updated"]):
+        print("[OK] Повторная синхронизация забирает только изменённые элементы (modified_after)")
+        tests_passed += 1
+    else:
+        print(f"[X] Повторная синхронизация: {results['resync']}, параметры: {results['resync_params']}")
+    
+    tests_total += 1
+    if ("Посты: обновлено 0, удалено 1" in results["trashed"]
+            and results["after_trash"].startswith("Ничего не найдено")):
+        print("[OK] Снятые с публикации и удалённые в корзину элементы уходят из индекса без полной синхронизации")
+        tests_passed += 1
+    else:
+        print(f"[X] Корзина: {results['trashed']}, поиск: {results['after_trash'][:80]}")
+    
+    tests_total += 1
+    if "удалено 1" in results["full"] and results["after_full"].startswith("Ничего не найдено"):
+        print("[OK] Полная синхронизация удаляет пропавшие с сайта элементы")
+        tests_passed += 1
+    else:
+        print(f"[X] Полная синхронизация: {results['full']}, поиск: {results['after_full'][:80]}")
+    
+    tests_total += 1
+    if ("ID: 100\n" in results["created"] and results["drafted"].startswith("Ничего не найдено")
+            and results["deleted"].startswith("Ничего не найдено") and results["write_requests"] == 0):
+        print("[OK] Создание, снятие с публикации и удаление через инструменты сразу обновляют индекс")
+        tests_passed += 1
+    else:
+        print(f"[X] Запись в индекс: {results['created'][:80]}, {results['drafted'][:60]}, {results['deleted'][:60]}")
+    
+    tests_total += 1
+    first, again, full = bulk
+    if (first["posts"]["total"] == 8 and again["posts"]["changed"] == 1
+            and full["posts"] == {"changed": 0, "removed": 0, "total": 8}):
+        print("[OK] Больше batch_size элементов с одним modified индексируются постранично")
+        tests_passed += 1
+    else:
+        print(f"[X] Массовый импорт: {first['posts']}, {again['posts']}, {full['posts']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_taxonomy_cache():
+    """Тест 4g: Разрешение имён рубрик и тегов в ID"""
+    print("\n" + "="*60)
+    print("ТЕСТ 4g: Проверка словаря рубрик и тегов")
+    print("="*60)
+    
+    import asyncio
+    import json
+    import httpx
+    from app import wordpress_tools
+    from app.http_clients import wordpress_http
+    from app.models import UserSettings
+    from app.wordpress_tools import TaxonomyCache
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    settings = UserSettings(
+        wordpress_url="https://terms.example.com",
+        wordpress_username="admin",
+        wordpress_password="secret",
+    )
+    terms = {
+        "categories": {1: "Без рубрики", 5: "Рецепты"},
+        "tags": {20: "Кофе &amp; чай"},
+    }
+    
+    async def scenario():
+        requests = []
+        posts = []
+        
+        async def handler(request):
+            path = request.url.path.rstrip("/")
+            requests.append((request.method, path))
+            taxonomy = next((name for name in terms if f"/wp/v2/{name}" in path), None)
+            if taxonomy and request.method == "GET":
+                items = [{"id": term_id, "name": name} for term_id, name in terms[taxonomy].items()]
+                return httpx.Response(200, headers={"X-WP-Total": str(len(items)), "X-WP-TotalPages": "1"}, json=items)
+            if taxonomy and request.method == "POST":
+                name = json.loads(request.content)["name"]
+                term_id = int(path.split("/")[-1]) if path.split("/")[-1].isdigit() else 100 + len(requests)
+                terms[taxonomy][term_id] = name
+                return httpx.Response(201, json={"id": term_id, "name": name})
+            if taxonomy and request.method == "DELETE":
+                del terms[taxonomy][int(path.split("/")[-1])]
+                return httpx.Response(200, json={"deleted": True})
+            post = json.loads(request.content)
+            posts.append(post)
+            return httpx.Response(201, json={"id": 900 + len(posts), "title": {"rendered": post.get("title", "")}, "status": "draft"})
+        
+        origin = wordpress_http.origin_of(settings.wordpress_url)
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        original = wordpress_tools.taxonomy_cache
+        cache = TaxonomyCache()
+        wordpress_tools.taxonomy_cache = cache
+        results = {}
+        try:
+            results["first"] = await wordpress_tools.wordpress_create_post(settings, {
+                "title": "Латте", "content": "...", "categories": ["рецепты", 1], "tags": ["Кофе & чай", "Молоко"],
+            })
+            results["first_requests"] = list(requests)
+            requests.clear()
+            
+            results["second"] = await wordpress_tools.wordpress_create_post(settings, {
+                "title": "Капучино", "content": "...", "categories": ["Рецепты"], "tags": ["молоко"],
+            })
+            results["second_requests"] = list(requests)
+            
+            await wordpress_tools.wordpress_update_tag(settings, {"tag_id": 20, "name": "Чай"})
+            await wordpress_tools.wordpress_delete_category(settings, {"category_id": 5})
+            requests.clear()
+            results["renamed"] = await cache.resolve(settings, "tags", ["чай"])
+            results["deleted_known"] = "рецепты" in await cache.get_terms(settings, "categories")
+            results["rename_requests"] = list(requests)
+            
+            requests.clear()
+            created = await asyncio.gather(*(
+                wordpress_tools.wordpress_update_post(settings, {"post_id": post_id, "tags": ["Новинка"]})
+                for post_id in (1, 2, 3)
+            ))
+            results["concurrent_creates"] = sum(1 for method, path in requests if method == "POST" and path.endswith("/tags"))
+            results["concurrent_tags"] = {tuple(post["tags"]) for post in posts[-3:]}
+            results["created_notes"] = sum("Созданы теги: Новинка" in text for text in created)
+            
+            # Элементы bulk занимают все слоты сайта; создание терминов не должно их ждать
+            results["bulk"] = await asyncio.wait_for(wordpress_tools.wordpress_bulk_write(
+                "wordpress_bulk_create_posts", settings,
+                {"items": [{"title": f"Пост {i}", "content": "...", "tags": [f"Тема {i}"]} for i in range(6)]},
+            ), timeout=10)
+            
+            # Истёкший словарь перечитывается под замком resolve без повторного захвата замка
+            expiring = TaxonomyCache(ttl_seconds=0.05)
+            wordpress_tools.taxonomy_cache = expiring
+            await expiring.get_terms(settings, "tags")
+            await asyncio.sleep(0.1)
+            results["expired"] = await asyncio.wait_for(expiring.resolve(settings, "tags", ["Свежий"]), timeout=5)
+            results["locks_left"] = len(cache._locks) + len(expiring._locks)
+        finally:
+            wordpress_tools.taxonomy_cache = original
+            await wordpress_http._clients.pop(origin).aclose()
+        results["posts"] = posts
+        return results
+    
+    results = asyncio.run(scenario())
+    first_post, second_post = results["posts"][:2]
+    
+    tests_total += 1
+    if (first_post["categories"] == [5, 1] and first_post["tags"][0] == 20
+            and "Созданы теги: Молоко" in results["first"]
+            and sum(1 for method, path in results["first_requests"] if method == "GET") == 2):
+        print("[OK] Имена разрешаются в ID, недостающие термины создаются")
+        tests_passed += 1
+    else:
+        print(f"[X] Пост: {first_post}, запросы: {results['first_requests']}")
+    
+    tests_total += 1
+    if results["second_requests"] == [("POST", "/wp-json/wp/v2/posts")] and second_post["tags"] == [first_post["tags"][1]]:
+        print("[OK] Повторная публикация разрешает имена без запросов к рубрикам и тегам")
+        tests_passed += 1
+    else:
+        print(f"[X] Запросы: {results['second_requests']}")
+    
+    tests_total += 1
+    if results["renamed"] == ([20], []) and not results["deleted_known"] and not results["rename_requests"]:
+        print("[OK] Инструменты записи рубрик и тегов обновляют словарь")
+        tests_passed += 1
+    else:
+        print(f"[X] Переименование: {results['renamed']}, запросы: {results['rename_requests']}")
+    
+    tests_total += 1
+    if (results["concurrent_creates"] == 1 and len(results["concurrent_tags"]) == 1
+            and results["created_notes"] == 1):
+        print("[OK] Параллельные публикации создают новый тег один раз")
+        tests_passed += 1
+    else:
+        print(f"[X] Создано тегов: {results['concurrent_creates']}, ID: {results['concurrent_tags']}")
+    
+    tests_total += 1
+    if ("6/6" in results["bulk"] and results["expired"][1] == ["Свежий"] and results["locks_left"] == 0):
+        print("[OK] Bulk публикация с новыми терминами и истёкший словарь не блокируют друг друга")
+        tests_passed += 1
+    else:
+        print(f"[X] Bulk: {results['bulk']}, после TTL: {results['expired']}, замков: {results['locks_left']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_wordstat_tools():
+    """Тест 5: Проверка Wordstat tools структуры"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5: Проверка Wordstat tools")
+    print("="*60)
+    
+    from app.wordstat_tools import handle_wordstat_tool
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    # Check that handler exists
+    tests_total += 1
+    if callable(handle_wordstat_tool):
         print("[OK] handle_wordstat_tool() импортирован")
         tests_passed += 1
     else:
@@ -351,6 +2088,795 @@ def test_wordstat_tools():
     return tests_passed == tests_total
 
 
+def test_telegram_bots():
+    """Тест 5b: Реестр Telegram ботов"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5b: Проверка реестра Telegram ботов")
+    print("="*60)
+    
+    import asyncio
+    import httpx
+    from cryptography.fernet import Fernet
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import helpers, telegram_tools
+    from app.database import Base
+    from app.helpers import encrypt_token
+    from app.models import User, UserSettings
+    from app.telegram_bots import TelegramBotRegistry
+    from app.telegram_tools import handle_telegram_tool
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario():
+        tokens = []
+        
+        def handler(request):
+            tokens.append(request.url.path.split("/")[1])
+            return httpx.Response(200, json={"ok": True, "result": {
+                "message_id": len(tokens), "date": 0, "chat": {"id": 42, "type": "private"},
+            }})
+        
+        engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            user = User(email="bots@example.com", hashed_password="x", full_name="Bots")
+            db.add(user)
+            await db.flush()
+            settings = UserSettings(user_id=user.id, telegram_bot_token=encrypt_token("111:first"))
+            db.add(settings)
+            await db.commit()
+        
+        registry = TelegramBotRegistry(revalidate_seconds=60, httpx_kwargs={"transport": httpx.MockTransport(handler)})
+        original = telegram_tools.telegram_bots
+        telegram_tools.telegram_bots = registry
+        results = {}
+        try:
+            async with session_factory() as db:
+                args = {"chat_id": 42, "text": "hi"}
+                first = [await handle_telegram_tool("telegram_send_message", args, user.id, db) for _ in range(3)]
+                bot = await registry.get_bot(user.id, db)
+                results["sent"] = all(text.startswith("✅") for text in first)
+                results["after_send"] = registry.stats()
+                
+                # Смена токена: /user/settings сбрасывает запись сразу
+                settings.telegram_bot_token = encrypt_token("222:second")
+                db.add(settings)
+                await db.commit()
+                registry.invalidate(user.id)
+                await handle_telegram_tool("telegram_send_message", args, user.id, db)
+                results["new_bot"] = (await registry.get_bot(user.id, db)) is not bot
+                
+                # Смена токена в другом worker: заметна после revalidate_seconds
+                settings.telegram_bot_token = encrypt_token("333:third")
+                await db.commit()
+                registry.revalidate_seconds = 0
+                await handle_telegram_tool("telegram_send_message", args, user.id, db)
+                results["tokens"] = tokens
+                results["shared_pool"] = bot._request[0] is (await registry.get_bot(user.id, db))._request[0]
+                
+                registry.idle_seconds = 0
+                results["idle_evicted"] = registry.sweep_idle()
+                
+                # LRU при max_bots: занятый отправкой бот пропускается, вытесняется следующий свободный
+                other_ids = []
+                for name in ("second", "third"):
+                    other = User(email=f"bots-{name}@example.com", hashed_password="x", full_name=name)
+                    db.add(other)
+                    await db.flush()
+                    db.add(UserSettings(user_id=other.id, telegram_bot_token=encrypt_token(f"444:{name}")))
+                    other_ids.append(other.id)
+                await db.commit()
+                registry.max_bots = 2
+                registry.revalidate_seconds = 60
+                busy_bot = await registry.get_bot(user.id, db)
+                busy_bot.rate_limiter.in_flight += 1
+                await registry.get_bot(other_ids[0], db)
+                await registry.get_bot(other_ids[1], db)
+                results["lru_kept"] = list(registry._bots)
+                busy_bot.rate_limiter.in_flight -= 1
+                results["lru_expected"] = [user.id, other_ids[1]]
+        finally:
+            telegram_tools.telegram_bots = original
+            await registry.aclose()
+            await engine.dispose()
+        return results
+    
+    # Временный ключ шифрования токенов, если FERNET_KEY не задан
+    original_fernet = helpers._fernet
+    helpers._fernet = original_fernet or Fernet(Fernet.generate_key())
+    try:
+        results = asyncio.run(scenario())
+    finally:
+        helpers._fernet = original_fernet
+    
+    tests_total += 1
+    stats = results["after_send"]
+    if results["sent"] and stats["created"] == 1 and stats["hits"] == 3:
+        print("[OK] Бот создаётся один раз и переиспользуется между вызовами")
+        tests_passed += 1
+    else:
+        print(f"[X] Реестр после отправки: {stats}")
+    
+    tests_total += 1
+    if (results["new_bot"] and results["tokens"][:3] == ["bot111:first"] * 3
+            and results["tokens"][3:] == ["bot222:second", "bot333:third"]):
+        print("[OK] Смена токена (invalidate и проверка отпечатка) создаёт нового бота")
+        tests_passed += 1
+    else:
+        print(f"[X] Токены запросов: {results['tokens']}")
+    
+    tests_total += 1
+    if results["shared_pool"] and results["idle_evicted"] == 1:
+        print("[OK] Боты используют общий пул соединений, неиспользуемые вытесняются")
+        tests_passed += 1
+    else:
+        print(f"[X] Общий пул: {results['shared_pool']}, вытеснено: {results['idle_evicted']}")
+    
+    tests_total += 1
+    if results["lru_kept"] == results["lru_expected"]:
+        print("[OK] При переполнении реестра бот с очередью отправки не вытесняется")
+        tests_passed += 1
+    else:
+        print(f"[X] Реестр после вытеснения: {results['lru_kept']}, ожидалось {results['lru_expected']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_telegram_scheduler():
+    """Тест 5c: Планировщик исходящих запросов Telegram"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5c: Проверка планировщика отправки Telegram")
+    print("="*60)
+    
+    import asyncio
+    import time
+    from datetime import timedelta
+    from telegram.error import RetryAfter
+    from app.telegram_bots import TelegramBotRegistry
+    from app.telegram_scheduler import PRIORITY_BULK, TelegramSendScheduler
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def send(scheduler, chat_id, priority=None, log=None, fail_first=0):
+        calls = []
+        
+        async def callback(endpoint, data):
+            calls.append(time.monotonic())
+            if len(calls) <= fail_first:
+                raise RetryAfter(timedelta(seconds=0.2))
+            if log is not None:
+                log.append((chat_id, priority))
+            return {"ok": True}
+        
+        data = {"chat_id": chat_id, "text": "hi"}
+        return await scheduler.process_request(callback, ("sendMessage", data), {}, "sendMessage", data, priority)
+    
+    async def throughput():
+        scheduler = TelegramSendScheduler(global_rate=20, chat_rate=1000)
+        started = time.monotonic()
+        await asyncio.gather(*(send(scheduler, chat_id) for chat_id in range(1, 41)))
+        return time.monotonic() - started, scheduler.stats()
+    
+    async def per_chat():
+        scheduler = TelegramSendScheduler(global_rate=1000, chat_rate=5)
+        started = time.monotonic()
+        same_chat = asyncio.gather(*(send(scheduler, 7) for _ in range(6)))
+        await send(scheduler, 8)
+        other_chat = time.monotonic() - started
+        await same_chat
+        return other_chat, time.monotonic() - started
+    
+    async def retry_after():
+        scheduler = TelegramSendScheduler(global_rate=1000, chat_rate=1000)
+        started = time.monotonic()
+        result = await send(scheduler, -100, fail_first=2)
+        return result, time.monotonic() - started, scheduler.stats()
+    
+    async def priorities():
+        scheduler = TelegramSendScheduler(global_rate=10, chat_rate=1000)
+        log = []
+        bulk = [asyncio.create_task(send(scheduler, chat_id, PRIORITY_BULK, log)) for chat_id in range(1, 31)]
+        await asyncio.sleep(0.05)
+        queued = scheduler.stats()["queued"]
+        await send(scheduler, 999, None, log)
+        await asyncio.gather(*bulk)
+        return queued, [chat_id for chat_id, _ in log].index(999)
+    
+    elapsed, stats = asyncio.run(throughput())
+    tests_total += 1
+    if 0.8 <= elapsed <= 1.6 and stats["sent"] == 40:
+        print(f"[OK] Глобальный лимит держит заданную скорость ({elapsed:.2f}с на 40 запросов при 20/с)")
+        tests_passed += 1
+    else:
+        print(f"[X] 40 запросов при 20/с заняли {elapsed:.2f}с, метрики: {stats}")
+    
+    other_chat, same_chat = asyncio.run(per_chat())
+    tests_total += 1
+    if other_chat < 0.1 and 0.9 <= same_chat <= 1.5:
+        print("[OK] Лимит на чат не задерживает другие чаты")
+        tests_passed += 1
+    else:
+        print(f"[X] Другой чат: {other_chat:.2f}с, 6 сообщений в чат: {same_chat:.2f}с")
+    
+    result, elapsed, stats = asyncio.run(retry_after())
+    tests_total += 1
+    if result == {"ok": True} and stats["retries"] == 2 and elapsed >= 0.4:
+        print("[OK] RetryAfter ставит чат на паузу и повторяет запрос")
+        tests_passed += 1
+    else:
+        print(f"[X] Результат: {result}, {elapsed:.2f}с, метрики: {stats}")
+    
+    queued, position = asyncio.run(priorities())
+    tests_total += 1
+    if queued.get(PRIORITY_BULK, 0) >= 15 and position <= 12:
+        print(f"[OK] Запрос агента обгоняет рассылку (позиция {position} из 31, в очереди {queued})")
+        tests_passed += 1
+    else:
+        print(f"[X] Позиция запроса агента: {position}, очередь: {queued}")
+    
+    tests_total += 1
+    registry = TelegramBotRegistry()
+    bot = registry.create_bot("123:token")
+    if isinstance(bot.rate_limiter, TelegramSendScheduler) and registry.stats()["send"]["queued"] == 0:
+        print("[OK] Боты реестра отправляют через планировщик")
+        tests_passed += 1
+    else:
+        print(f"[X] rate_limiter бота: {bot.rate_limiter}")
+    
+    asyncio.run(registry.aclose())
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_telegram_broadcast():
+    """Тест 5d: Фоновые рассылки Telegram с продолжением после остановки"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5d: Проверка рассылок Telegram")
+    print("="*60)
+    
+    import asyncio
+    import os
+    import tempfile
+    from collections import Counter
+    from urllib.parse import parse_qs
+    import httpx
+    from cryptography.fernet import Fernet
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import helpers, telegram_broadcast, telegram_tools
+    from app.database import Base
+    from app.helpers import encrypt_token
+    from app.models import User, UserSettings
+    from app.telegram_bots import TelegramBotRegistry
+    from app.telegram_broadcast import BroadcastManager
+    from app.telegram_tools import handle_telegram_tool
+    from datetime import datetime, timedelta
+    from sqlalchemy import update
+    from app.models import TelegramBroadcast
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    async def scenario(db_path):
+        delivered = Counter()
+        requested = Counter()
+        hold = {"event": None}
+        
+        async def handler(request):
+            data = parse_qs(request.content.decode())
+            chat_id = data["chat_id"][0]
+            requested[chat_id] += 1
+            if hold["event"] is not None:
+                await hold["event"].wait()
+            await asyncio.sleep(0.01)
+            if chat_id == "403":
+                return httpx.Response(403, json={"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"})
+            delivered[chat_id] += 1
+            return httpx.Response(200, json={"ok": True, "result": {
+                "message_id": sum(delivered.values()), "date": 0, "chat": {"id": int(chat_id), "type": "private"},
+            }})
+        
+        # busy_timeout: close() и resume пишут параллельно с пачками
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", connect_args={"timeout": 30})
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            user = User(email="broadcast@example.com", hashed_password="x", full_name="Broadcast")
+            db.add(user)
+            await db.flush()
+            db.add(UserSettings(user_id=user.id, mcp_connector_id="broadcast-test", telegram_bot_token=encrypt_token("111:bcast")))
+            await db.commit()
+        
+        registry = TelegramBotRegistry(httpx_kwargs={"transport": httpx.MockTransport(handler)})
+        notifications = []
+        
+        def make_manager(chunk_size):
+            manager = BroadcastManager(chunk_size=chunk_size, session_factory=session_factory)
+            
+            async def notify(connector_id, status):
+                notifications.append((connector_id, dict(status)))
+            
+            manager.notify = notify
+            return manager
+        
+        async def wait_done(manager, broadcast_id):
+            for _ in range(500):
+                async with session_factory() as db:
+                    job = await manager.get(db, user.id, broadcast_id)
+                    if job.status != "running":
+                        return job
+                await asyncio.sleep(0.02)
+            return job
+        
+        originals = (telegram_broadcast.telegram_bots, telegram_tools.telegram_bots, telegram_tools.broadcast_manager)
+        telegram_broadcast.telegram_bots = telegram_tools.telegram_bots = registry
+        results = {}
+        try:
+            manager = make_manager(chunk_size=5)
+            telegram_tools.broadcast_manager = manager
+            chat_ids = [str(1000 + i) for i in range(11)] + ["403"]
+            async with session_factory() as db:
+                started = await handle_telegram_tool("telegram_broadcast", {
+                    "chat_ids": chat_ids, "audience": "team", "text": "Новость",
+                }, user.id, db)
+            broadcast_id = int(started.split("#")[1].split()[0])
+            job = await wait_done(manager, broadcast_id)
+            async with session_factory() as db:
+                results["status_text"] = await handle_telegram_tool(
+                    "telegram_broadcast_status", {"broadcast_id": broadcast_id}, user.id, db
+                )
+            async with session_factory() as db:
+                results["bad_id"] = await handle_telegram_tool(
+                    "telegram_broadcast_status", {"broadcast_id": "abc"}, user.id, db
+                )
+            results["first"] = (job.status, job.sent, job.failed)
+            results["first_delivered"] = dict(delivered)
+            results["notifications"] = list(notifications)
+            
+            # Вторая рассылка по сохранённой аудитории: worker останавливается после первой пачки
+            delivered.clear()
+            notifications.clear()
+            manager = make_manager(chunk_size=3)
+            telegram_tools.broadcast_manager = manager
+            async with session_factory() as db:
+                started = await handle_telegram_tool("telegram_broadcast", {"audience": "team", "text": "Ещё"}, user.id, db)
+            broadcast_id = int(started.split("#")[1].split()[0])
+            while not notifications:
+                await asyncio.sleep(0.01)
+            await manager.close()
+            results["before_resume"] = sum(delivered.values())
+            
+            resumed_manager = make_manager(chunk_size=3)
+            results["resumed"] = await resumed_manager.resume_orphaned()
+            job = await wait_done(resumed_manager, broadcast_id)
+            results["second"] = (job.status, job.sent, job.failed)
+            results["second_delivered"] = dict(delivered)
+            await resumed_manager.close()
+            
+            # Аренду перехватывают, пока worker отправляет пачку: его пачка не сохраняется
+            delivered.clear()
+            requested.clear()
+            hold["event"] = asyncio.Event()
+            stale_manager = make_manager(chunk_size=3)
+            telegram_tools.broadcast_manager = stale_manager
+            async with session_factory() as db:
+                started = await handle_telegram_tool("telegram_broadcast", {
+                    "chat_ids": [str(2000 + i) for i in range(6)], "text": "Перехват",
+                }, user.id, db)
+            broadcast_id = int(started.split("#")[1].split()[0])
+            while sum(requested.values()) < 3:
+                await asyncio.sleep(0.01)
+            async with session_factory() as db:
+                await db.execute(
+                    update(TelegramBroadcast)
+                    .where(TelegramBroadcast.id == broadcast_id)
+                    .values(lease_until=datetime.utcnow() - timedelta(seconds=1))
+                )
+                await db.commit()
+            new_manager = make_manager(chunk_size=3)
+            results["stolen"] = await new_manager.resume_orphaned()
+            hold["event"].set()
+            job = await wait_done(new_manager, broadcast_id)
+            for _ in range(100):
+                if not stale_manager._jobs:
+                    break
+                await asyncio.sleep(0.01)
+            results["third"] = (job.status, job.sent, job.failed, job.lease_owner == new_manager.owner)
+            results["stale_stopped"] = not stale_manager._jobs
+            hold["event"] = None
+            await stale_manager.close()
+            await new_manager.close()
+        finally:
+            telegram_broadcast.telegram_bots, telegram_tools.telegram_bots, telegram_tools.broadcast_manager = originals
+            await registry.aclose()
+            await engine.dispose()
+        return results
+    
+    original_fernet = helpers._fernet
+    helpers._fernet = original_fernet or Fernet(Fernet.generate_key())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = asyncio.run(scenario(os.path.join(tmp, "broadcast.db")))
+    finally:
+        helpers._fernet = original_fernet
+    
+    tests_total += 1
+    if (results["first"] == ("done", 11, 1) and len(results["first_delivered"]) == 11
+            and all(count == 1 for count in results["first_delivered"].values())
+            and "403: Forbidden: bot was blocked by the user" in results["status_text"]
+            and results["bad_id"].startswith("❌")):
+        print("[OK] Рассылка доставлена каждому получателю один раз, ошибки сохраняются")
+        tests_passed += 1
+    else:
+        print(f"[X] Рассылка: {results['first']}, статус: {results['status_text']}")
+    
+    tests_total += 1
+    progress = [status for connector_id, status in results["notifications"] if connector_id == "broadcast-test"]
+    if len(progress) == 4 and progress[-1]["status"] == "done" and progress[0]["pending"] == 7:
+        print("[OK] Ход рассылки отправляется в SSE канал коннектора после каждой пачки")
+        tests_passed += 1
+    else:
+        print(f"[X] Уведомления: {results['notifications']}")
+    
+    tests_total += 1
+    if (results["resumed"] == 1 and results["second"] == ("done", 11, 1)
+            and 3 <= results["before_resume"] < 11 and len(results["second_delivered"]) == 11
+            and sum(results["second_delivered"].values()) <= 11 + 3):
+        print("[OK] Рассылка по сохранённой аудитории продолжается другим worker'ом с места остановки")
+        tests_passed += 1
+    else:
+        print(f"[X] Продолжение: {results['resumed']}, {results['second']}, до остановки {results['before_resume']}")
+    
+    tests_total += 1
+    if results["stolen"] == 1 and results["third"] == ("done", 6, 0, True) and results["stale_stopped"]:
+        print("[OK] Worker, потерявший аренду, не сохраняет пачку и останавливается")
+        tests_passed += 1
+    else:
+        print(f"[X] Перехват аренды: {results['stolen']}, {results['third']}, старый worker остановлен: {results['stale_stopped']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_telegram_webhook_updates():
+    """Тест 5e: Приём обновлений Telegram через webhook и чтение из буфера"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5e: Проверка webhook приёмника Telegram")
+    print("="*60)
+    
+    import asyncio
+    import json
+    import os
+    import tempfile
+    from cryptography.fernet import Fernet
+    from fastapi import BackgroundTasks, HTTPException
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from starlette.requests import Request
+    from app import helpers, main, telegram_tools
+    from sqlalchemy import update
+    from app.auth import invalidate_principal, principal_cache
+    from app.database import Base
+    from app.helpers import encrypt_token
+    from app.models import User, UserSettings
+    from app.telegram_tools import handle_telegram_tool
+    from app.telegram_updates import SECRET_HEADER, SecretRefreshThrottle, TelegramUpdateStore
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    def make_request(body, secret):
+        headers = [(b"content-type", b"application/json")]
+        if secret:
+            headers.append((SECRET_HEADER.lower().encode(), secret.encode()))
+        scope = {"type": "http", "method": "POST", "path": "/telegram/webhook/hook-test", "headers": headers, "query_string": b""}
+        
+        async def receive():
+            return {"type": "http.request", "body": body, "more_body": False}
+        
+        return Request(scope, receive)
+    
+    def make_update(update_id):
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": 0, "text": "привет",
+            "chat": {"id": 42, "type": "private"},
+            "from": {"id": 42, "is_bot": False, "first_name": "Alice", "username": "alice"},
+        }}
+    
+    async def deliver(db, body, secret):
+        tasks = BackgroundTasks()
+        try:
+            result = await main.telegram_webhook("hook-test", make_request(body, secret), tasks, db)
+        except HTTPException as exc:
+            return exc.status_code
+        await tasks()
+        return result
+    
+    async def scenario(db_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            user = User(email="webhook@example.com", hashed_password="x", full_name="Webhook")
+            db.add(user)
+            await db.flush()
+            db.add(UserSettings(
+                user_id=user.id, mcp_connector_id="hook-test",
+                telegram_webhook_url="https://example.com/telegram/webhook/hook-test",
+                telegram_webhook_secret=encrypt_token("s3cret"),
+            ))
+            await db.commit()
+        
+        store = TelegramUpdateStore(capacity=5, trim_every=1, session_factory=session_factory)
+        throttle = SecretRefreshThrottle(interval_seconds=0.2)
+        originals = (main.telegram_updates, telegram_tools.telegram_updates, main.webhook_secret_refresh)
+        main.telegram_updates = telegram_tools.telegram_updates = store
+        main.webhook_secret_refresh = throttle
+        original_get_bot = telegram_tools.get_bot_from_settings
+        queue = await main.sse_manager.connect("hook-test")
+        results = {}
+        try:
+            async with session_factory() as db:
+                results["wrong_secret"] = await deliver(db, json.dumps(make_update(1)).encode(), "wrong")
+                results["no_secret"] = await deliver(db, json.dumps(make_update(1)).encode(), None)
+                results["refresh_after_fail"] = throttle.stats()
+                results["cached_after_fail"] = principal_cache.get("connector:hook-test") is not None
+                results["bad_body"] = await deliver(db, b"not json", "s3cret")
+                results["accepted"] = [
+                    await deliver(db, json.dumps(make_update(update_id)).encode(), "s3cret")
+                    for update_id in (1, 2, 3, 4, 5, 6, 7, 8, 8)
+                ]
+            results["pushed"] = queue.qsize()
+            async with session_factory() as db:
+                results["buffer"] = [update["update_id"] for update in await store.read(db, user.id)]
+                results["tool"] = await handle_telegram_tool("telegram_get_updates", {"offset": 7}, user.id, db)
+                results["after_confirm"] = [update["update_id"] for update in await store.read(db, user.id)]
+            # Секрет сменили в другом worker: принимается после интервала сверки с БД
+            async with session_factory() as db:
+                await db.execute(update(UserSettings).where(UserSettings.user_id == user.id).values(
+                    telegram_webhook_secret=encrypt_token("n3w")
+                ))
+                await db.commit()
+            await asyncio.sleep(0.25)
+            async with session_factory() as db:
+                results["rotated"] = await deliver(db, json.dumps(make_update(9)).encode(), "n3w")
+                results["old_after_rotation"] = await deliver(db, json.dumps(make_update(10)).encode(), "s3cret")
+            
+            # После delete_webhook telegram_get_updates снова опрашивает Bot API, а не буфер
+            class PollingBot:
+                polled = 0
+                
+                async def delete_webhook(self, drop_pending_updates=False):
+                    return True
+                
+                async def get_updates(self, **kwargs):
+                    self.polled += 1
+                    return []
+            
+            polling_bot = PollingBot()
+            
+            async def fake_bot(user_id, db):
+                return polling_bot
+            
+            telegram_tools.get_bot_from_settings = fake_bot
+            async with session_factory() as db:
+                results["deleted"] = await handle_telegram_tool("telegram_delete_webhook", {}, user.id, db)
+                results["polled_updates"] = await handle_telegram_tool("telegram_get_updates", {}, user.id, db)
+                results["buffer_after_delete"] = await store.read(db, user.id)
+            results["polled"] = polling_bot.polled
+        finally:
+            telegram_tools.get_bot_from_settings = original_get_bot
+            main.telegram_updates, telegram_tools.telegram_updates, main.webhook_secret_refresh = originals
+            await main.sse_manager.disconnect("hook-test", queue)
+            invalidate_principal(user.id)
+            await engine.dispose()
+        results["stats"] = store.stats()
+        return results
+    
+    original_fernet = helpers._fernet
+    helpers._fernet = original_fernet or Fernet(Fernet.generate_key())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = asyncio.run(scenario(os.path.join(tmp, "updates.db")))
+    finally:
+        helpers._fernet = original_fernet
+    
+    tests_total += 1
+    if results["wrong_secret"] == 403 and results["no_secret"] == 403 and results["bad_body"] == 400:
+        print("[OK] Запросы без верного секрета и без update_id отклоняются")
+        tests_passed += 1
+    else:
+        print(f"[X] Проверка запросов: {results['wrong_secret']}, {results['no_secret']}, {results['bad_body']}")
+    
+    tests_total += 1
+    if (results["refresh_after_fail"] == {"refreshed": 1, "throttled": 1} and results["cached_after_fail"]
+            and results["rotated"] == {"ok": True} and results["old_after_rotation"] == 403):
+        print("[OK] Неверный секрет не сбрасывает кэш, сверка с БД не чаще интервала, смена секрета подхватывается")
+        tests_passed += 1
+    else:
+        print(
+            f"[X] Сверка секрета: {results['refresh_after_fail']}, кэш {results['cached_after_fail']}, "
+            f"новый {results['rotated']}, старый {results['old_after_rotation']}"
+        )
+    
+    tests_total += 1
+    if (all(result == {"ok": True} for result in results["accepted"]) and results["pushed"] == 8
+            and results["stats"]["duplicates"] == 1):
+        print("[OK] Обновления подтверждаются и отправляются в SSE, повторная доставка отбрасывается")
+        tests_passed += 1
+    else:
+        print(f"[X] Приём: {results['accepted']}, в SSE {results['pushed']}, {results['stats']}")
+    
+    tests_total += 1
+    if results["buffer"] == [4, 5, 6, 7, 8]:
+        print("[OK] Буфер хранит только последние capacity обновлений")
+        tests_passed += 1
+    else:
+        print(f"[X] Буфер: {results['buffer']}")
+    
+    tests_total += 1
+    if ("Всего обновлений: 2 (webhook)" in results["tool"] and "@alice" in results["tool"]
+            and "Следующий offset: 9" in results["tool"] and results["after_confirm"] == [7, 8]):
+        print("[OK] telegram_get_updates читает буфер, offset подтверждает прочитанное")
+        tests_passed += 1
+    else:
+        print(f"[X] telegram_get_updates: {results['tool']}, после подтверждения {results['after_confirm']}")
+    
+    tests_total += 1
+    if (results["deleted"].startswith("✅") and results["polled"] == 1
+            and results["polled_updates"] == "ℹ️ Обновлений нет." and results["buffer_after_delete"] == []):
+        print("[OK] После удаления webhook буфер очищается, обновления снова читаются из Bot API")
+        tests_passed += 1
+    else:
+        print(f"[X] После delete_webhook: {results['deleted']}, опросов {results['polled']}, буфер {results['buffer_after_delete']}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
+def test_telegram_file_to_wordpress():
+    """Тест 5f: Потоковый перенос файла Telegram в медиатеку WordPress"""
+    print("\n" + "="*60)
+    print("ТЕСТ 5f: Проверка переноса файлов Telegram в WordPress")
+    print("="*60)
+    
+    import asyncio
+    import os
+    import tempfile
+    import httpx
+    from cryptography.fernet import Fernet
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from app import helpers, telegram_media, telegram_tools
+    from app.database import Base
+    from app.helpers import encrypt_token
+    from app.http_clients import wordpress_http
+    from app.models import User, UserSettings
+    from app.telegram_bots import TelegramBotRegistry
+    from app.telegram_media import TelegramMediaImporter
+    from app.telegram_tools import handle_telegram_tool
+    
+    tests_passed = 0
+    tests_total = 0
+    
+    pdf = b"%PDF-1.4\n" + bytes(range(256)) * 1200
+    files = {"BQACfirst": "AgADpdf", "BQACforward": "AgADpdf", "BQACother": "AgADother"}
+    state = {"downloads": 0, "chunks": 0, "uploads": [], "deleted": set()}
+    
+    async def telegram_handler(request):
+        path = request.url.path
+        if path.endswith("/getFile"):
+            file_id = request.content.decode().split("file_id=")[1].split("&")[0]
+            return httpx.Response(200, json={"ok": True, "result": {
+                "file_id": file_id, "file_unique_id": files[file_id],
+                "file_size": len(pdf), "file_path": f"documents/{files[file_id]}.pdf",
+            }})
+        state["downloads"] += 1
+        
+        async def stream():
+            for start in range(0, len(pdf), 32 * 1024):
+                state["chunks"] += 1
+                yield pdf[start:start + 32 * 1024]
+        
+        return httpx.Response(200, headers={"Content-Type": "application/octet-stream"}, content=stream())
+    
+    async def wordpress_handler(request):
+        if request.method == "POST":
+            body = await request.aread()
+            media_id = 100 + len(state["uploads"])
+            state["uploads"].append((request.headers["Content-Type"], request.headers["Content-Disposition"], body))
+            await asyncio.sleep(0.05)
+            return httpx.Response(201, json={"id": media_id, "source_url": f"https://site.example/uploads/{media_id}.pdf"})
+        media_id = int(request.url.path.rsplit("/", 1)[1])
+        if media_id in state["deleted"]:
+            return httpx.Response(404, json={"code": "rest_post_invalid_id"})
+        return httpx.Response(200, json={"id": media_id, "source_url": f"https://site.example/uploads/{media_id}.pdf"})
+    
+    async def scenario(db_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, expire_on_commit=False)
+        async with session_factory() as db:
+            user = User(email="media@example.com", hashed_password="x", full_name="Media")
+            db.add(user)
+            await db.flush()
+            db.add(UserSettings(
+                user_id=user.id, telegram_bot_token=encrypt_token("111:media"),
+                wordpress_url="https://site.example", wordpress_username="admin", wordpress_password="secret",
+            ))
+            await db.commit()
+        
+        registry = TelegramBotRegistry(httpx_kwargs={"transport": httpx.MockTransport(telegram_handler)})
+        importer = TelegramMediaImporter(session_factory=session_factory)
+        origin = wordpress_http.origin_of("https://site.example")
+        wordpress_http._clients[origin] = httpx.AsyncClient(transport=httpx.MockTransport(wordpress_handler))
+        originals = (telegram_tools.telegram_bots, telegram_media.telegram_bots, telegram_tools.telegram_media)
+        telegram_tools.telegram_bots = telegram_media.telegram_bots = registry
+        telegram_tools.telegram_media = importer
+        
+        async def call(file_id):
+            async with session_factory() as db:
+                return await handle_telegram_tool("telegram_file_to_wordpress", {"file_id": file_id, "title": "Отчёт"}, user.id, db)
+        
+        results = {}
+        try:
+            results["first"] = await call("BQACfirst")
+            results["forwarded"] = await call("BQACforward")
+            results["concurrent"] = await asyncio.gather(call("BQACother"), call("BQACother"))
+            state["deleted"].add(100)
+            results["after_delete"] = await call("BQACfirst")
+        finally:
+            telegram_tools.telegram_bots, telegram_media.telegram_bots, telegram_tools.telegram_media = originals
+            await registry.aclose()
+            await wordpress_http._clients.pop(origin).aclose()
+            await engine.dispose()
+        results["stats"] = importer.stats()
+        return results
+    
+    original_fernet = helpers._fernet
+    helpers._fernet = original_fernet or Fernet(Fernet.generate_key())
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            results = asyncio.run(scenario(os.path.join(tmp, "media.db")))
+    finally:
+        helpers._fernet = original_fernet
+    
+    tests_total += 1
+    first_upload = state["uploads"][0] if state["uploads"] else (None, None, b"")
+    if ("ID: 100" in results["first"] and "МБ/с" in results["first"] and first_upload[2] == pdf
+            and first_upload[0] == "application/pdf" and 'filename="AgADpdf.pdf"' in first_upload[1]
+            and state["chunks"] > 1):
+        print("[OK] Файл передан из Telegram в /wp/v2/media потоком, в ответе размер и скорость")
+        tests_passed += 1
+    else:
+        print(f"[X] Перенос: {results['first']}, загрузка: {first_upload[:2]}")
+    
+    tests_total += 1
+    concurrent_ids = {text.split("ID: ")[1].split("\n")[0] for text in results["concurrent"]}
+    if ("Файл уже есть в медиатеке" in results["forwarded"] and "ID: 100" in results["forwarded"]
+            and len(concurrent_ids) == 1 and results["stats"]["deduplicated"] == 2):
+        print("[OK] Тот же file_unique_id не загружается повторно (в том числе параллельно)")
+        tests_passed += 1
+    else:
+        print(f"[X] Повторы: {results['forwarded']}, параллельно: {results['concurrent']}, {results['stats']}")
+    
+    tests_total += 1
+    if "ID: 102" in results["after_delete"] and len(state["uploads"]) == 3 and state["downloads"] == 3:
+        print("[OK] Удалённый на сайте медиафайл загружается заново")
+        tests_passed += 1
+    else:
+        print(f"[X] После удаления: {results['after_delete']}, загрузок {len(state['uploads'])}")
+    
+    print(f"\nРезультат: {tests_passed}/{tests_total} тестов пройдено")
+    return tests_passed == tests_total
+
+
 def test_main_integration():
     """Тест 6: Проверка интеграции в main.py"""
     print("\n" + "="*60)
@@ -463,8 +2989,27 @@ def main():
     results.append(("Импорты модулей", test_imports()))
     results.append(("Helpers функции", test_helpers()))
     results.append(("MCP handlers", test_mcp_handlers()))
+    results.append(("SSE брокер", test_sse_broker()))
+    results.append(("SSE backpressure", test_sse_backpressure()))
+    results.append(("Асинхронная БД", test_async_database()))
+    results.append(("ActivityLog writer", test_activity_log_writer()))
+    results.append(("Keyset-пагинация", test_admin_pagination()))
+    results.append(("Retention логов", test_retention()))
+    results.append(("Экспорт логов", test_admin_export()))
     results.append(("WordPress tools", test_wordpress_tools()))
+    results.append(("HTTP клиенты", test_http_client_registry()))
+    results.append(("WordPress bulk", test_wordpress_bulk()))
+    results.append(("WordPress пагинация", test_wordpress_pagination()))
+    results.append(("WordPress кэш", test_wordpress_cache()))
+    results.append(("WordPress медиа", test_wordpress_media_stream()))
+    results.append(("WordPress индекс", test_content_index()))
+    results.append(("WordPress рубрики и теги", test_taxonomy_cache()))
     results.append(("Wordstat tools", test_wordstat_tools()))
+    results.append(("Telegram боты", test_telegram_bots()))
+    results.append(("Telegram планировщик", test_telegram_scheduler()))
+    results.append(("Telegram рассылки", test_telegram_broadcast()))
+    results.append(("Telegram webhook", test_telegram_webhook_updates()))
+    results.append(("Telegram файлы в WordPress", test_telegram_file_to_wordpress()))
     results.append(("Main интеграция", test_main_integration()))
     results.append(("Перекрёстные зависимости", test_cross_module_dependencies()))
     